@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from qobuz import qobuz_api as qobuz
+from qobuz.mock_server import MockQobuzServer
+
+def get_percentile(values, percentile):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))]
+
+def get_cache_size(cache_dir):
+    size = 0
+    for root, dirs, files in os.walk(cache_dir):
+        for file_name in files:
+            if not file_name.startswith('.qobuz_'):
+                size += os.path.getsize(os.path.join(root, file_name))
+    return size
+
+def run_workload(name, server, cache_dir, client_options, workload):
+    qobuz_client = qobuz.QobuzApi('benchmark', 'secret', 'token', 6, cache_dir, cache_dir, api_endpoint=server.api_endpoint, **client_options)
+    track_latencies = []
+    play_track = qobuz_client.play_track
+
+    def timed_play_track(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return play_track(*args, **kwargs)
+        finally:
+            track_latencies.append(time.perf_counter() - started_at)
+
+    qobuz_client.play_track = timed_play_track
+    server.reset_counts()
+    cache_size = get_cache_size(cache_dir)
+    started_at = time.perf_counter()
+    workload(qobuz_client)
+    duration = time.perf_counter() - started_at
+    qobuz_client.close()
+    api_calls = server.reset_counts()
+    downloaded_bytes = get_cache_size(cache_dir) - cache_size
+    return {
+        'workload': name,
+        'seconds': round(duration, 4),
+        'tracks': len(track_latencies),
+        'tracks_per_second': round(len(track_latencies) / duration, 2),
+        'megabytes_per_second': round(downloaded_bytes / duration / 1024 ** 2, 2),
+        'track_latency_p50': get_percentile(track_latencies, 50),
+        'track_latency_p99': get_percentile(track_latencies, 99),
+        'api_calls': api_calls,
+        'api_calls_total': sum(count for endpoint, count in api_calls.items() if endpoint not in ('file', 'cover'))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark QobuzApi against a local mock server')
+    parser.add_argument('--favorite-tracks', type=int, default=1000)
+    parser.add_argument('--albums-per-artist', type=int, default=10)
+    parser.add_argument('--tracks-per-album', type=int, default=10)
+    parser.add_argument('--track-size', type=int, default=256 * 1024, help='bytes per track')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per api response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second per connection, 0 is unlimited')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of api calls answered with 429 or 503')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests-per-second', type=float, help='overrides the client rate limits')
+    parser.add_argument('--label', default='', help='stored with the results, e.g. a version')
+    parser.add_argument('--output', help='write the json report here instead of stdout')
+    args = parser.parse_args()
+
+    server = MockQobuzServer(latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate, albums_per_artist=args.albums_per_artist, tracks_per_album=args.tracks_per_album, favorite_track_count=args.favorite_tracks, track_size=args.track_size).start()
+    client_options = {'workers': args.workers}
+    if args.requests_per_second:
+        rate_limit = (args.requests_per_second, max(1, int(args.requests_per_second)))
+        client_options['rate_limits'] = {endpoint: rate_limit for endpoint in ('*', 'track/getFileUrl', 'catalog/search')}
+
+    workloads = [
+        ('favorites_sync_cold', lambda qobuz_client: qobuz_client.play_favorite_tracks(cache_only=True, skip_existing=True)),
+        ('favorites_sync_warm', lambda qobuz_client: qobuz_client.play_favorite_tracks(cache_only=True, skip_existing=True)),
+        ('artist_discography', lambda qobuz_client: qobuz_client.play_artist_albums(server.catalog.artist_count, cache_only=True, skip_existing=True, minimum_track_count=1)),
+    ]
+    cache_dir = tempfile.mkdtemp(prefix='qobuz-benchmark-')
+    results = []
+    try:
+        # progress output of the client goes to stderr, the report is the only thing on stdout
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        for name, workload in workloads:
+            results.append(run_workload(name, server, cache_dir, client_options, workload))
+        sys.stdout = stdout
+    finally:
+        sys.stdout = sys.__stdout__
+        server.stop()
+        shutil.rmtree(cache_dir)
+
+    report = {
+        'label': args.label,
+        'created_at': int(time.time()),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+import argparse
+
+from qobuz import config as qobuz_config
+from qobuz.maintenance import FLAC_BINARY, LibraryMaintenance
+
+parser = argparse.ArgumentParser(description='Check every cached file, tag again what differs from the metadata and download broken files again')
+parser.add_argument('--workers', type=int, help='processes checking files (default: one per cpu)')
+parser.add_argument('--md5', action='store_true', help='decode flac files with the flac binary and verify their md5')
+parser.add_argument('--cached-meta-data-only', dest='fetch_meta_data', action='store_false', help='no api calls, files without cached metadata are left unchecked')
+parser.add_argument('--dry-run', action='store_true', help='only report what would be done')
+parser.add_argument('--restart', action='store_true', help='ignore the checkpoint of an interrupted run')
+args = parser.parse_args()
+
+if args.md5 and not FLAC_BINARY:
+    print("flac not found, only checking the headers")
+
+qobuz_client = qobuz_config.create_client(qobuz_config.load_config())
+maintenance = LibraryMaintenance(qobuz_client, workers=args.workers, verify_md5=args.md5, dry_run=args.dry_run, fetch_meta_data=args.fetch_meta_data)
+try:
+    counts = maintenance.run(restart=args.restart)
+    for action, count in sorted(counts.items()):
+        print("{}: {}".format(action, count))
+finally:
+    qobuz_client.close()
@@ -0,0 +1,106 @@
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DAY = 24 * 3600
+
+def normalize_name(name):
+    # compatibility forms (full width letters, ligatures) are folded before the case
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+class ArtistGraph:
+    QOBUZ = 'qobuz'
+    LASTFM = 'lastfm'
+    # how much an edge of each source counts when walking the graph
+    SOURCE_WEIGHTS = {
+        QOBUZ: 1.0,
+        LASTFM: 1.0,
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS artists (artist_id TEXT PRIMARY KEY, name TEXT NOT NULL)')
+            # artist_id is NULL for names which aren't in the qobuz catalog
+            self.connection.execute('CREATE TABLE IF NOT EXISTS artist_names (name TEXT PRIMARY KEY, artist_id TEXT, resolved_at REAL NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS edges (source_id TEXT NOT NULL, target_id TEXT NOT NULL, source TEXT NOT NULL, weight REAL NOT NULL, PRIMARY KEY (source_id, target_id, source))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS refreshes (artist_id TEXT NOT NULL, source TEXT NOT NULL, refreshed_at REAL NOT NULL, PRIMARY KEY (artist_id, source))')
+
+    def add_artist(self, artist_id, name):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO artists (artist_id, name) VALUES (?, ?)', (str(artist_id), name))
+            self.connection.execute('INSERT OR REPLACE INTO artist_names (name, artist_id, resolved_at) VALUES (?, ?, ?)', (normalize_name(name), str(artist_id), time.time()))
+
+    def get_artist(self, artist_id):
+        with self.lock:
+            row = self.connection.execute('SELECT artist_id, name FROM artists WHERE artist_id = ?', (str(artist_id),)).fetchone()
+        if row:
+            return {'id': row[0], 'name': row[1]}
+
+    def resolve_name(self, name, max_age=30 * DAY):
+        # (True, artist_id) for known names, artist_id being None if the catalog doesn't have it
+        with self.lock:
+            row = self.connection.execute('SELECT artist_id, resolved_at FROM artist_names WHERE name = ?', (normalize_name(name),)).fetchone()
+        if not row or time.time() - row[1] > max_age:
+            return False, None
+        return True, row[0]
+
+    def set_name(self, name, artist_id):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO artist_names (name, artist_id, resolved_at) VALUES (?, ?, ?)', (normalize_name(name), artist_id and str(artist_id), time.time()))
+
+    def set_edges(self, artist_id, source, edges):
+        # edges replace the ones the source gave before
+        artist_id = str(artist_id)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM edges WHERE source_id = ? AND source = ?', (artist_id, source))
+            self.connection.executemany('INSERT OR REPLACE INTO edges (source_id, target_id, source, weight) VALUES (?, ?, ?, ?)', [(artist_id, str(target_id), source, weight) for target_id, weight in edges if str(target_id) != artist_id])
+            self.connection.execute('INSERT OR REPLACE INTO refreshes (artist_id, source, refreshed_at) VALUES (?, ?, ?)', (artist_id, source, time.time()))
+
+    def is_stale(self, artist_id, source, max_age):
+        with self.lock:
+            row = self.connection.execute('SELECT refreshed_at FROM refreshes WHERE artist_id = ? AND source = ?', (str(artist_id), source)).fetchone()
+        return not row or time.time() - row[0] > max_age
+
+    def get_neighbors(self, artist_id):
+        with self.lock:
+            rows = self.connection.execute('SELECT target_id, source, weight FROM edges WHERE source_id = ?', (str(artist_id),)).fetchall()
+        weights = {}
+        for target_id, source, weight in rows:
+            weights[target_id] = weights.get(target_id, 0) + weight * ArtistGraph.SOURCE_WEIGHTS.get(source, 1.0)
+        return sorted(weights.items(), key=lambda item: item[1], reverse=True)
+
+    def get_similar(self, artist_id, limit=None):
+        return [target_id for target_id, weight in self.get_neighbors(artist_id)[:limit]]
+
+    def random_walk(self, seed_id, length, restart_probability=0.15, random_source=random):
+        # weighted multi hop walk, now and then it goes on from another artist of the queue
+        # so it spreads out instead of running down a single chain
+        seed_id = str(seed_id)
+        queue = [seed_id]
+        queued_ids = {seed_id}
+        neighbors = {}
+        current_id = seed_id
+        for attempt in range(length * 10):
+            if len(queue) >= length:
+                break
+            if current_id not in neighbors:
+                neighbors[current_id] = self.get_neighbors(current_id)
+            candidates = [(target_id, weight) for target_id, weight in neighbors[current_id] if target_id not in queued_ids]
+            if not candidates or random_source.random() < restart_probability:
+                current_id = random_source.choice(queue)
+                continue
+            current_id = random_source.choices([target_id for target_id, weight in candidates], [weight for target_id, weight in candidates])[0]
+            queue.append(current_id)
+            queued_ids.add(current_id)
+        return queue
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
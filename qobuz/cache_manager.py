@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+DAY = 24 * 3600
+
+class CacheManager:
+    POLICIES = ('lru', 'lfu')
+    # evict a bit below the budget, so it doesn't start over for every new track
+    LOW_WATERMARK = 0.9
+    TEMP_SUFFIX = '.qtmp'
+    PARTS_SUFFIX = '.qtmp.parts'
+    MISSING_SUFFIX = '.missing'
+    # covers and the databases are stat'ed at most this often, enforce runs after every track
+    OVERHEAD_CHECK_INTERVAL = 60
+
+    def __init__(self, qobuz_api, max_bytes=None, policy='lru', cleanup_interval=3600, temp_max_age=DAY, missing_max_age=30 * DAY, min_age=600):
+        if policy not in CacheManager.POLICIES:
+            raise ValueError("policy has to be one of {}".format(', '.join(CacheManager.POLICIES)))
+        self.qobuz_api = qobuz_api
+        self.library_index = qobuz_api.library_index
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.cleanup_interval = cleanup_interval
+        self.temp_max_age = temp_max_age
+        self.missing_max_age = missing_max_age
+        # tracks cached or played this recently stay, evicting them would only fetch them again
+        self.min_age = min_age
+        self.over_budget = False
+        self.overhead_bytes = 0
+        self.overhead_checked_at = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.cleanup_thread = None
+        # its mtime tells when the last cleanup ran, also across runs
+        self.cleanup_marker_path = os.path.join(qobuz_api.cache_dir, '.qobuz_cleanup')
+
+    def start(self):
+        # without a budget there's nothing to enforce, stale files are left to the next run with one
+        if self.max_bytes and self.cleanup_interval:
+            self.cleanup_thread = threading.Thread(target=self.run, name='qobuz-cache', daemon=True)
+            self.cleanup_thread.start()
+        return self
+
+    def get_used_bytes(self):
+        # the index knows every cached track's size, no need to walk cache_dir
+        return self.library_index.total_size() + self.get_overhead_bytes()
+
+    def get_overhead_bytes(self):
+        # each cover is stored once in the cover cache, the folder.jpg files link to it
+        now = time.monotonic()
+        if self.overhead_checked_at is not None and now - self.overhead_checked_at < CacheManager.OVERHEAD_CHECK_INTERVAL:
+            return self.overhead_bytes
+        overhead_bytes = self.get_dir_size(self.qobuz_api.cover_cache.path)
+        overhead_bytes += self.get_dir_size(self.qobuz_api.cache_dir, lambda file_name: '.sqlite' in file_name)
+        self.overhead_bytes = overhead_bytes
+        self.overhead_checked_at = now
+        return overhead_bytes
+
+    @staticmethod
+    def get_dir_size(path, include=None):
+        size = 0
+        try:
+            entries = list(os.scandir(path))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False) and (not include or include(entry.name)):
+                    size += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def get_protected_track_ids(self):
+        # tracks lined up in the player or being prefetched stay
+        track_ids = {str(track_id) for track_id in self.qobuz_api.prefetcher.futures}
+        player = self.qobuz_api.player
+        if player:
+            with player.condition:
+                track_ids.update(str(entry.data) for entry in player.entries)
+        return track_ids
+
+    def enforce(self):
+        if not self.max_bytes:
+            return 0
+        with self.lock:
+            used_bytes = self.get_used_bytes()
+            if used_bytes <= self.max_bytes:
+                return 0
+            target_bytes = self.max_bytes * CacheManager.LOW_WATERMARK
+            protected_track_ids = self.get_protected_track_ids()
+            recent_time = time.time() - self.min_age
+            evicted_count = 0
+            for track in self.library_index.eviction_candidates(self.policy):
+                if used_bytes <= target_bytes:
+                    break
+                if track['track_id'] in protected_track_ids or max(track['last_played'] or 0, track['indexed_at']) > recent_time:
+                    continue
+                # the album folder stays, another track of it may be on its way
+                self.qobuz_api.remove_cached_track(track, remove_folder=False)
+                used_bytes -= track['size']
+                evicted_count += 1
+            over_budget = used_bytes > self.max_bytes
+            if over_budget and not self.over_budget:
+                print("The cache takes up {} bytes, everything left is pinned, playing or recent".format(used_bytes))
+            self.over_budget = over_budget
+        return evicted_count
+
+    def cleanup(self):
+        # leftovers of interrupted downloads, and placeholders of tracks which may be available by now
+        now = time.time()
+        removed_count = 0
+        for root, dirs, files in os.walk(self.qobuz_api.cache_dir):
+            if self.stopped.is_set():
+                return removed_count
+            file_names = set(files)
+            for file_name in files:
+                if file_name.endswith(CacheManager.TEMP_SUFFIX):
+                    # a preallocated temp file is padded to its full size, without its .parts file it
+                    # would pass for a finished download, so both go by the age of the temp file
+                    paths = [os.path.join(root, file_name), os.path.join(root, file_name + '.parts')]
+                    max_age = self.temp_max_age
+                elif file_name.endswith(CacheManager.PARTS_SUFFIX):
+                    if file_name[:-len('.parts')] in file_names:
+                        continue
+                    paths = [os.path.join(root, file_name)]
+                    max_age = self.temp_max_age
+                elif file_name.endswith(CacheManager.MISSING_SUFFIX):
+                    paths = [os.path.join(root, file_name)]
+                    max_age = self.missing_max_age
+                else:
+                    continue
+                try:
+                    if now - os.path.getmtime(paths[0]) <= max_age:
+                        continue
+                except FileNotFoundError:
+                    continue
+                for path in paths:
+                    try:
+                        os.unlink(path)
+                        removed_count += 1
+                    except FileNotFoundError:
+                        pass
+        # they're looked up again the next time their album is cached
+        self.library_index.remove_missing_tracks(now - self.missing_max_age)
+        with open(self.cleanup_marker_path, 'a'):
+            os.utime(self.cleanup_marker_path)
+        return removed_count
+
+    def get_next_cleanup_time(self):
+        try:
+            return os.path.getmtime(self.cleanup_marker_path) + self.cleanup_interval
+        except FileNotFoundError:
+            return 0
+
+    def run(self):
+        while not self.stopped.is_set():
+            if time.time() >= self.get_next_cleanup_time():
+                try:
+                    removed_count = self.cleanup()
+                    if removed_count:
+                        print("Removed {} stale files from the cache".format(removed_count))
+                    self.enforce()
+                except Exception as e:
+                    print("Cleaning up the cache failed: {}".format(e))
+                    self.stopped.wait(self.cleanup_interval)
+                    continue
+            self.stopped.wait(max(1, self.get_next_cleanup_time() - time.time()))
+
+    def close(self):
+        self.stopped.set()
+        if self.cleanup_thread:
+            self.cleanup_thread.join()
+            self.cleanup_thread = None
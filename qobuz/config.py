@@ -0,0 +1,58 @@
+import configparser
+import os
+import shutil
+import sys
+
+CONFIG_PATH = os.path.expanduser('~/.qdl/qdl_config.ini')
+CONFIG_SKEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.ini.skel')
+
+def load_config(config_path=CONFIG_PATH):
+    config_folder = os.path.dirname(config_path)
+    if not os.path.exists(config_folder):
+        os.makedirs(config_folder)
+
+    if not os.path.isfile(config_path):
+        shutil.copyfile(CONFIG_SKEL_PATH, config_path)
+        print("A new config file in {} has been created.".format(config_path))
+        print("Please add your app and user info")
+        sys.exit(-1)
+
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return config
+
+def create_client(config):
+    # the client pulls in requests and friends, reading the config doesn't need them
+    from qobuz.qobuz_api import QobuzApi
+    from qobuz.player import NullPlayer
+
+    cache_dir = config['DOWNLOAD']['directory']
+    os.makedirs(cache_dir, exist_ok=True)
+    return QobuzApi(
+        config['QOBUZ']['app_id'],
+        config['QOBUZ']['app_secret'],
+        config['QOBUZ']['user_auth_token'],
+        format_id=config.getint('DOWNLOAD', 'format_id'),
+        cache_dir=cache_dir,
+        log_dir=config.get('LOG', 'directory', fallback='') or cache_dir,
+        workers=config.getint('DOWNLOAD', 'workers', fallback=4),
+        max_connections_per_host=config.getint('DOWNLOAD', 'max_connections_per_host', fallback=4),
+        pool_size=config.getint('DOWNLOAD', 'pool_size', fallback=10),
+        retries=config.getint('DOWNLOAD', 'retries', fallback=3),
+        timeout=config.getfloat('DOWNLOAD', 'timeout', fallback=30),
+        download_segments=config.getint('DOWNLOAD', 'download_segments', fallback=1),
+        segment_min_size=config.getint('DOWNLOAD', 'segment_min_size', fallback=32 * 1024 ** 2),
+        download_buffer_size=config.getint('DOWNLOAD', 'buffer_size', fallback=1024 ** 2),
+        fsync_policy=config.get('DOWNLOAD', 'fsync', fallback='none'),
+        fsync_batch_size=config.getint('DOWNLOAD', 'fsync_batch_size', fallback=20),
+        rate_limits={'*': (config.getfloat('API', 'requests_per_second', fallback=10), config.getint('API', 'requests_burst', fallback=20))},
+        progressive=config.getboolean('PLAYER', 'progressive', fallback=False),
+        prefetch_depth=config.getint('PLAYER', 'prefetch_depth', fallback=2),
+        prefetch_max_bytes=config.getint('PLAYER', 'prefetch_max_bytes', fallback=1024 ** 3),
+        player=NullPlayer() if config.get('PLAYER', 'backend', fallback='mplayer') == 'null' else None,
+        cache_max_bytes=int(config.get('CACHE', 'max_bytes', fallback='') or 0) or None,
+        cache_policy=config.get('CACHE', 'policy', fallback='lru'),
+        cache_cleanup_interval=config.getfloat('CACHE', 'cleanup_interval', fallback=3600),
+        log_events=config.getboolean('LOG', 'events', fallback=False),
+        metrics_port=int(config.get('LOG', 'metrics_port', fallback='') or 0) or None,
+    )
@@ -0,0 +1,32 @@
+import json
+import os
+import socket
+
+# only the standard library here, qobuzctl.py has to start fast
+DEFAULT_SOCKET_PATH = os.path.expanduser('~/.qdl/qobuz.sock')
+
+class QobuzControlError(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+def get_socket_path(config=None):
+    if config is None:
+        return DEFAULT_SOCKET_PATH
+    return os.path.expanduser(config.get('DAEMON', 'socket', fallback='') or DEFAULT_SOCKET_PATH)
+
+def send_command(command, socket_path=DEFAULT_SOCKET_PATH, **args):
+    # one json request per line, answered by one json line
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise QobuzControlError("The daemon isn't running ({})".format(socket_path))
+        connection.sendall(json.dumps({'command': command, 'args': args}).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as response_file:
+            response_line = response_file.readline()
+    if not response_line:
+        raise QobuzControlError("No response to {}".format(command))
+    response = json.loads(response_line)
+    if 'error' in response:
+        raise QobuzControlError(response['error'])
+    return response
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import threading
+
+class CoverCache:
+    # urls share a fixed set of locks by their hash, a lock per url would pile up over a long sync
+    LOCK_COUNT = 64
+
+    # covers are stored once per content hash, each url they were fetched from links to that file
+    def __init__(self, path, download):
+        self.path = path
+        self.download = download
+        self.url_locks = [threading.Lock() for _ in range(CoverCache.LOCK_COUNT)]
+        os.makedirs(os.path.join(path, 'urls'), exist_ok=True)
+
+    @staticmethod
+    def get_url_hash(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get_url_path(self, url):
+        return os.path.join(self.path, 'urls', self.get_url_hash(url))
+
+    def get_content_path(self, content_hash, url):
+        extension = os.path.splitext(url.partition('?')[0])[1] or '.jpg'
+        return os.path.join(self.path, '{}{}'.format(content_hash, extension))
+
+    @staticmethod
+    def get_content_hash(path):
+        content_hash = hashlib.sha256()
+        with open(path, 'rb') as in_file:
+            content_hash.update(in_file.read())
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def link(source_path, target_path):
+        # hardlinks cost no space, a copy is the fallback for file systems without them
+        try:
+            os.link(source_path, target_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            temp_target_path = '{}.qtmp'.format(target_path)
+            shutil.copyfile(source_path, temp_target_path)
+            os.replace(temp_target_path, target_path)
+
+    def url_lock(self, url):
+        return self.url_locks[int(self.get_url_hash(url), 16) % CoverCache.LOCK_COUNT]
+
+    def fetch(self, url):
+        # concurrent workers asking for the same url wait for a single download
+        url_path = self.get_url_path(url)
+        with self.url_lock(url):
+            if os.path.isfile(url_path):
+                return url_path
+            temp_path = '{}.qtmp'.format(url_path)
+            if not self.download(url, temp_path):
+                return None
+            content_path = self.get_content_path(self.get_content_hash(temp_path), url)
+            if os.path.isfile(content_path):
+                os.unlink(temp_path)
+            else:
+                os.replace(temp_path, content_path)
+            self.link(content_path, url_path)
+        return url_path
+
+    def get(self, url, target_path):
+        if os.path.isfile(target_path):
+            return True
+        url_path = self.fetch(url)
+        if not url_path:
+            return False
+        self.link(url_path, target_path)
+        return True
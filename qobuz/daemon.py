@@ -0,0 +1,224 @@
+from collections import deque
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from qobuz.favorites_sync import FavoritesSync
+from qobuz.qobuz_api import FavoriteType
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for request_line in self.rfile:
+            try:
+                request = json.loads(request_line)
+                response = self.server.daemon.handle(request.get('command'), request.get('args') or {})
+            except Exception as e:
+                response = {'error': '{}: {}'.format(type(e).__name__, e)}
+            self.wfile.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.daemon = daemon
+        socketserver.ThreadingUnixStreamServer.__init__(self, socket_path, ControlRequestHandler)
+
+class QobuzDaemon:
+    COMMANDS = ('enqueue', 'status', 'skip', 'clear', 'sync', 'stop')
+    STATUS_QUEUE_LENGTH = 20
+
+    def __init__(self, qobuz_api, socket_path, sync_interval=0):
+        self.qobuz_api = qobuz_api
+        self.socket_path = socket_path
+        self.sync_interval = sync_interval
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.track_meta_data = {}
+        self.current_track = None
+        self.running = False
+        self.started_at = time.time()
+        self.favorites_sync = FavoritesSync(qobuz_api)
+        self.sync_thread = None
+        self.sync_status = {'running': False, 'synced_at': None, 'error': None}
+        self.server = None
+
+    def start(self):
+        self.remove_stale_socket()
+        self.server = ControlServer(self.socket_path, self)
+        os.chmod(self.socket_path, 0o600)
+        self.running = True
+        threading.Thread(target=self.play_queue, name='qobuz-player', daemon=True).start()
+        if self.sync_interval:
+            threading.Thread(target=self.sync_periodically, name='qobuz-sync', daemon=True).start()
+        return self
+
+    def remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            try:
+                connection.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)
+                return
+        raise RuntimeError("Another daemon is listening on {}".format(self.socket_path))
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def handle(self, command, args):
+        if command not in QobuzDaemon.COMMANDS:
+            return {'error': 'Unknown command "{}"'.format(command)}
+        return getattr(self, 'command_{}'.format(command))(**args)
+
+    def get_tracks(self, item_type, item_id=None, name=None, track_limit=None, artist_count=10):
+        qobuz_api = self.qobuz_api
+        if name and item_type in ('artist', 'radio'):
+            item_id = qobuz_api.resolve_artist_name(name)
+            if not item_id:
+                raise LookupError("Artist {} not found".format(name))
+        if item_type == 'track':
+            return {item_id: qobuz_api.get_meta_data(item_id)}
+        if item_type == 'album':
+            album_meta_data = qobuz_api.get_meta_data_for_album_id(item_id)
+            track_items = album_meta_data['tracks']['items']
+            return {track['id']: qobuz_api.parse_track_meta_data(track, album_meta_data) for track in track_items if qobuz_api.has_track_meta_data(track, album_meta_data)}
+        if item_type == 'artist':
+            tracks = qobuz_api.get_artist_tracks(item_id)[:track_limit]
+        elif item_type == 'radio':
+            qobuz_api.refresh_artist_graph([item_id])
+            artist_ids = qobuz_api.artist_graph.random_walk(item_id, artist_count)
+            tracks = [track for artist_id in artist_ids for track in qobuz_api.get_artist_tracks(artist_id)[:track_limit or 1]]
+        else:
+            raise ValueError('Unknown type "{}"'.format(item_type))
+        track_meta_data = qobuz_api.resolve_track_meta_data(tracks)
+        # keep the order of the listing
+        return {track['id']: track_meta_data[track['id']] for track in tracks if track['id'] in track_meta_data}
+
+    def command_enqueue(self, item_type, item_id=None, name=None, play_next=False, track_limit=None, artist_count=10):
+        track_meta_data = self.get_tracks(item_type, item_id, name, track_limit, artist_count)
+        with self.condition:
+            self.track_meta_data.update(track_meta_data)
+            if play_next:
+                self.queue.extendleft(reversed(list(track_meta_data)))
+            else:
+                self.queue.extend(track_meta_data)
+            self.condition.notify_all()
+            queue_length = len(self.queue)
+        return {'queued': len(track_meta_data), 'queue_length': queue_length}
+
+    @staticmethod
+    def describe_track(track_meta_data):
+        return {key: track_meta_data[key] for key in ('track_id', 'artist', 'album', 'title', 'duration')}
+
+    def get_playing_track_id(self):
+        # the player is a track ahead of play_queue, it already has the next one lined up
+        entry = self.qobuz_api.player and self.qobuz_api.player.current
+        return entry.data if entry else None
+
+    def command_status(self):
+        playing_track_id = self.get_playing_track_id()
+        with self.condition:
+            current_track = self.track_meta_data.get(playing_track_id) or self.current_track
+            queue = list(self.queue)
+        return {
+            'current': current_track and self.describe_track(current_track),
+            'queue': [self.describe_track(self.track_meta_data[track_id]) for track_id in queue[:QobuzDaemon.STATUS_QUEUE_LENGTH]],
+            'queue_length': len(queue),
+            'sync': dict(self.sync_status),
+            'uptime': time.time() - self.started_at
+        }
+
+    def command_skip(self):
+        return {'skipped': self.qobuz_api.skip()}
+
+    def command_clear(self):
+        with self.condition:
+            cleared_count = len(self.queue)
+            self.queue.clear()
+            self.forget_tracks()
+        self.qobuz_api.prefetcher.retain(())
+        return {'cleared': cleared_count}
+
+    def command_sync(self, types=None, prune=False):
+        favorite_types = [FavoriteType(favorite_type) for favorite_type in types] if types else list(FavoriteType)
+        return {'started': self.start_sync(favorite_types, prune)}
+
+    def command_stop(self):
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.condition.notify_all()
+        self.qobuz_api.stop()
+        # shutdown waits for serve_forever, which runs in another thread
+        threading.Thread(target=self.server.shutdown).start()
+        return {'stopped': True}
+
+    def start_sync(self, favorite_types=tuple(FavoriteType), prune=False):
+        with self.condition:
+            if self.sync_thread and self.sync_thread.is_alive():
+                return False
+            self.sync_thread = threading.Thread(target=self.sync, args=(favorite_types, prune), name='qobuz-sync-run', daemon=True)
+            self.sync_thread.start()
+        return True
+
+    def sync(self, favorite_types, prune):
+        self.sync_status['running'] = True
+        try:
+            self.favorites_sync.sync_all(favorite_types, prune=prune)
+            self.sync_status['error'] = None
+        except Exception as e:
+            self.sync_status['error'] = repr(e)
+        finally:
+            self.sync_status['running'] = False
+            self.sync_status['synced_at'] = time.time()
+
+    def sync_periodically(self):
+        while self.running:
+            self.start_sync()
+            time.sleep(self.sync_interval)
+
+    def play_queue(self):
+        # tracks are played in the order they were queued, the next ones are cached meanwhile
+        qobuz_api = self.qobuz_api
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                track_id = self.queue.popleft()
+                self.current_track = self.track_meta_data[track_id]
+                upcoming_track_ids = list(self.queue)
+            qobuz_api.prefetcher.prefetch(upcoming_track_ids, self.track_meta_data)
+            qobuz_api.prefetcher.wait(track_id)
+            try:
+                qobuz_api.play_track(track_id, track_meta_data=self.current_track)
+            except Exception as e:
+                print("Playing track {} failed: {}".format(track_id, e))
+            with self.condition:
+                self.current_track = None
+                self.forget_tracks()
+                upcoming_track_ids = list(self.queue)
+            qobuz_api.prefetcher.retain(upcoming_track_ids)
+
+    def forget_tracks(self):
+        # keeps the metadata of queued tracks and of the ones the player still has
+        player = self.qobuz_api.player
+        kept_track_ids = set(self.queue)
+        if player:
+            with player.condition:
+                kept_track_ids.update(entry.data for entry in player.entries)
+        if self.current_track:
+            kept_track_ids.add(self.current_track['track_id'])
+        for track_id in list(self.track_meta_data):
+            if track_id not in kept_track_ids:
+                del self.track_meta_data[track_id]
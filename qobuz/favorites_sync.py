@@ -0,0 +1,150 @@
+import json
+import os
+import time
+
+from qobuz.qobuz_api import FavoriteType, QobuzIncompleteAlbumError
+from qobuz.rate_limiter import Priority
+
+class FavoritesSync:
+    PAGE_SIZE = 100
+    # favorites whose files can be removed again once they're unfavorited
+    PRUNABLE_TYPES = (FavoriteType.TRACK, FavoriteType.ALBUM)
+
+    def __init__(self, qobuz_api, state_path=None):
+        self.qobuz_api = qobuz_api
+        self.state_path = state_path or os.path.join(qobuz_api.cache_dir, '.qobuz_favorites.json')
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {'favorites': {}, 'removed': {}}
+
+    def save_state(self):
+        temp_state_path = '{}.qtmp'.format(self.state_path)
+        with open(temp_state_path, 'w') as state_file:
+            json.dump(self.state, state_file)
+        os.replace(temp_state_path, self.state_path)
+
+    def get_favorite_ids(self, favorite_type):
+        return self.state['favorites'].get(favorite_type.value, {}).get('ids', [])
+
+    def fetch_changes(self, favorite_type):
+        # favorites are listed newest first, the new ones end where the first known id shows up
+        known_ids = self.get_favorite_ids(favorite_type)
+        known_id_set = set(known_ids)
+        new_items = []
+        offset = 0
+        while True:
+            items, total = self.qobuz_api.get_favorites_page(favorite_type, FavoritesSync.PAGE_SIZE, offset)
+            known_position = next((position for position, item in enumerate(items) if item['id'] in known_id_set), None)
+            new_items.extend(items[:known_position])
+            offset += len(items)
+            if known_position is not None or len(items) < FavoritesSync.PAGE_SIZE or (total is not None and offset >= total):
+                break
+        ids = [item['id'] for item in new_items] + known_ids
+        if total != len(ids):
+            # something was removed or the order changed, only the full list tells what
+            items = list(self.qobuz_api.get_favorites(favorite_type, limit=FavoritesSync.PAGE_SIZE))
+            ids = [item['id'] for item in items]
+            new_items = [item for item in items if item['id'] not in known_id_set]
+        id_set = set(ids)
+        removed_ids = [known_id for known_id in known_ids if known_id not in id_set]
+        return new_items, removed_ids, ids, total
+
+    def cache_favorites(self, favorite_type, items):
+        # returns the ids of the favorites which couldn't be cached and the ones which can't be cached at all
+        qobuz_api = self.qobuz_api
+        failed_ids = []
+        unavailable_ids = []
+        with qobuz_api.request_priority(Priority.BULK):
+            if favorite_type == FavoriteType.TRACK:
+                track_meta_data = qobuz_api.resolve_track_meta_data(items)
+                for track_id in qobuz_api.try_cache_tracks([item['id'] for item in items], skip_existing=True, track_meta_data=track_meta_data):
+                    if qobuz_api.is_track_unavailable(track_id):
+                        unavailable_ids.append(track_id)
+                    else:
+                        failed_ids.append(track_id)
+                return failed_ids, unavailable_ids
+            for item in items:
+                try:
+                    if favorite_type == FavoriteType.ALBUM:
+                        qobuz_api.play_album(item['id'], cache_only=True, skip_existing=True)
+                    else:
+                        qobuz_api.play_artist_albums(item['id'], cache_only=True, skip_existing=True)
+                except QobuzIncompleteAlbumError as e:
+                    album_meta_data = e.args[0]
+                    track_ids = [track['id'] for track in album_meta_data['tracks']['items'] if not qobuz_api.get_indexed_track(track['id'])]
+                    if all(qobuz_api.is_track_unavailable(track_id) for track_id in track_ids):
+                        unavailable_ids.append(item['id'])
+                    else:
+                        failed_ids.append(item['id'])
+        return failed_ids, unavailable_ids
+
+    def sync(self, favorite_type, cache=True):
+        new_items, removed_ids, ids, total = self.fetch_changes(favorite_type)
+        print("{}: {} new, {} removed, {} in total".format(favorite_type.value, len(new_items), len(removed_ids), len(ids)))
+        library_index = self.qobuz_api.library_index
+        if library_index and favorite_type in FavoritesSync.PRUNABLE_TYPES:
+            # favorites are never evicted to make room, pinned before they're cached
+            library_index.set_pins(favorite_type.value, ids)
+        failed_ids, unavailable_ids = self.cache_favorites(favorite_type, new_items) if cache and new_items else ([], [])
+        if unavailable_ids:
+            # they stay in the state, retrying them on every run would turn every sync into a full one
+            print("{} {} aren't available".format(len(unavailable_ids), favorite_type.value))
+        if failed_ids:
+            # leave them out of the state, the next run sees them as new again
+            print("{} {} could not be cached".format(len(failed_ids), favorite_type.value))
+            failed_ids = set(failed_ids)
+            ids = [favorite_id for favorite_id in ids if favorite_id not in failed_ids]
+        self.state['favorites'][favorite_type.value] = {
+            'ids': ids,
+            'total': total,
+            'synced_at': time.time()
+        }
+        if favorite_type in FavoritesSync.PRUNABLE_TYPES:
+            id_set = set(ids)
+            queued_ids = self.state['removed'].get(favorite_type.value, []) + removed_ids
+            self.state['removed'][favorite_type.value] = [removed_id for removed_id in dict.fromkeys(queued_ids) if removed_id not in id_set]
+        self.save_state()
+        return new_items, removed_ids
+
+    def sync_all(self, favorite_types=tuple(FavoriteType), cache=True, prune=False):
+        for favorite_type in favorite_types:
+            self.sync(favorite_type, cache=cache)
+        if prune:
+            self.prune()
+
+    def prune(self):
+        library_index = self.qobuz_api.library_index
+        if not library_index:
+            print("Pruning needs the library index")
+            return 0
+        format_id = self.qobuz_api.format_id
+        # a track stays while it's a favorite by itself or through its album
+        favorite_track_ids = {str(track_id) for track_id in self.get_favorite_ids(FavoriteType.TRACK)}
+        favorite_album_ids = {str(album_id) for album_id in self.get_favorite_ids(FavoriteType.ALBUM)}
+        pruned_count = 0
+        for favorite_type in FavoritesSync.PRUNABLE_TYPES:
+            for removed_id in self.state['removed'].get(favorite_type.value, []):
+                if favorite_type == FavoriteType.TRACK:
+                    indexed_track = library_index.get_track(removed_id, format_id)
+                    tracks = [indexed_track] if indexed_track else []
+                else:
+                    tracks = library_index.album_tracks(removed_id, format_id)
+                for track in tracks:
+                    if track['track_id'] in favorite_track_ids or track['album_id'] in favorite_album_ids:
+                        continue
+                    self.remove_track(track)
+                    pruned_count += 1
+                if favorite_type == FavoriteType.ALBUM:
+                    library_index.remove_album(removed_id)
+            self.state['removed'][favorite_type.value] = []
+        self.save_state()
+        print("Pruned {} tracks".format(pruned_count))
+        return pruned_count
+
+    def remove_track(self, track):
+        self.qobuz_api.remove_cached_track(track)
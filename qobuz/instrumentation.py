@@ -0,0 +1,137 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+class Instrumentation:
+    def __init__(self):
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners = self.listeners + [listener]
+        return listener
+
+    def unsubscribe(self, listener):
+        self.listeners = [subscribed for subscribed in self.listeners if subscribed is not listener]
+
+    def emit(self, event, **fields):
+        listeners = self.listeners
+        if not listeners:
+            return
+        fields['event'] = event
+        fields['time'] = time.time()
+        fields['thread'] = threading.current_thread().name
+        for listener in listeners:
+            listener(fields)
+
+    @contextmanager
+    def timed(self, event, **fields):
+        # the yielded dict can be filled with results like bytes or status before the event is emitted
+        started_at = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields['error'] = repr(e)
+            raise
+        finally:
+            fields['duration'] = time.perf_counter() - started_at
+            self.emit(event, **fields)
+
+class JsonLinesSink:
+    def __init__(self, path, exclude=()):
+        self.path = path
+        self.exclude = set(exclude)
+        self.lock = threading.Lock()
+        self.log_file = open(path, 'a', buffering=1)
+
+    @staticmethod
+    def in_dir(log_dir, file_name='qobuz_events.jsonl', exclude=()):
+        os.makedirs(log_dir, exist_ok=True)
+        return JsonLinesSink(os.path.join(log_dir, file_name), exclude)
+
+    def __call__(self, record):
+        if record['event'] in self.exclude:
+            return
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.log_file.write(line + '\n')
+
+    def close(self):
+        with self.lock:
+            self.log_file.close()
+
+class PrometheusExporter:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, namespace='qobuz'):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.server = None
+
+    def __call__(self, record):
+        labels = (('event', record['event']), ('endpoint', record.get('endpoint', '')))
+        with self.lock:
+            self.counters[('events_total', labels)] += 1
+            if record.get('bytes'):
+                self.counters[('bytes_total', labels)] += record['bytes']
+            if record.get('retries'):
+                self.counters[('retries_total', labels)] += record['retries']
+            if record.get('cache'):
+                self.counters[('cache_total', labels + (('result', record['cache']),))] += 1
+            if record.get('error'):
+                self.counters[('errors_total', labels)] += 1
+            if 'duration' in record:
+                histogram = self.histograms.setdefault(labels, [[0] * len(PrometheusExporter.BUCKETS), 0, 0])
+                for position, bucket in enumerate(PrometheusExporter.BUCKETS):
+                    if record['duration'] <= bucket:
+                        histogram[0][position] += 1
+                histogram[1] += record['duration']
+                histogram[2] += 1
+
+    @staticmethod
+    def format_labels(labels):
+        return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in labels) + '}'
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append('{}_{}{} {}'.format(self.namespace, name, self.format_labels(labels), value))
+            name = '{}_duration_seconds'.format(self.namespace)
+            for labels, (bucket_counts, duration_sum, count) in sorted(self.histograms.items()):
+                for bucket, bucket_count in zip(PrometheusExporter.BUCKETS, bucket_counts):
+                    lines.append('{}_bucket{} {}'.format(name, self.format_labels(labels + (('le', bucket),)), bucket_count))
+                lines.append('{}_bucket{} {}'.format(name, self.format_labels(labels + (('le', '+Inf'),)), count))
+                lines.append('{}_sum{} {}'.format(name, self.format_labels(labels), duration_sum))
+                lines.append('{}_count{} {}'.format(name, self.format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+TRACK_ID_TAG = 'QOBUZ_TRACK_ID'
+ALBUM_ID_TAG = 'QOBUZ_ALBUM_ID'
+FORMAT_ID_TAG = 'QOBUZ_FORMAT_ID'
+
+AUDIO_EXTENSIONS = {
+    '.flac': 6,
+    '.mp3': 5
+}
+
+def get_file_checksum(path, chunk_size=1024 * 1024):
+    file_hash = hashlib.md5()
+    with open(path, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+class LibraryIndex:
+    ADDED_COLUMNS = (
+        ('last_played', 'REAL'),
+        ('play_count', 'INTEGER NOT NULL DEFAULT 0'),
+    )
+    # tracks least worth keeping first
+    EVICTION_ORDERS = {
+        'lru': 'COALESCE(last_played, indexed_at)',
+        'lfu': 'play_count, COALESCE(last_played, indexed_at)',
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            # path is relative to cache_dir, NULL for tracks which couldn't be cached
+            self.connection.execute('CREATE TABLE IF NOT EXISTS tracks (track_id TEXT NOT NULL, format_id INTEGER NOT NULL, album_id TEXT, path TEXT, size INTEGER, checksum TEXT, indexed_at REAL NOT NULL, last_played REAL, play_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (track_id, format_id))')
+            # indexes from before the play history get its columns added
+            columns = {row['name'] for row in self.connection.execute('PRAGMA table_info(tracks)')}
+            for column, definition in LibraryIndex.ADDED_COLUMNS:
+                if column not in columns:
+                    self.connection.execute('ALTER TABLE tracks ADD COLUMN {} {}'.format(column, definition))
+            self.connection.execute('CREATE INDEX IF NOT EXISTS tracks_album_id ON tracks (album_id, format_id)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS albums (album_id TEXT PRIMARY KEY, tracks_count INTEGER NOT NULL)')
+            # item_type is tracks or albums, pinned tracks are never evicted
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pins (item_type TEXT NOT NULL, item_id TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (item_type, item_id, source))')
+
+    def get_track(self, track_id, format_id):
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM tracks WHERE track_id = ? AND format_id = ? AND path IS NOT NULL', (str(track_id), format_id)).fetchone()
+        if row:
+            return dict(row)
+
+    def is_track_missing(self, track_id, format_id):
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM tracks WHERE track_id = ? AND format_id = ? AND path IS NULL', (str(track_id), format_id)).fetchone()
+        return bool(row)
+
+    def add_track(self, track_id, format_id, album_id, path, size, checksum):
+        # the play history stays when a track is indexed again
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO tracks (track_id, format_id, album_id, path, size, checksum, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (track_id, format_id) DO UPDATE SET album_id = excluded.album_id, path = excluded.path, size = excluded.size, checksum = excluded.checksum, indexed_at = excluded.indexed_at', (str(track_id), format_id, album_id and str(album_id), path, size, checksum, time.time()))
+
+    def add_missing_track(self, track_id, format_id, album_id):
+        self.add_track(track_id, format_id, album_id, None, None, None)
+
+    def remove_track(self, track_id, format_id):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM tracks WHERE track_id = ? AND format_id = ?', (str(track_id), format_id))
+
+    def remove_missing_tracks(self, indexed_before):
+        with self.lock, self.connection:
+            return self.connection.execute('DELETE FROM tracks WHERE path IS NULL AND indexed_at < ?', (indexed_before,)).rowcount
+
+    def record_play(self, track_id, format_id):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE tracks SET last_played = ?, play_count = play_count + 1 WHERE track_id = ? AND format_id = ?', (time.time(), str(track_id), format_id))
+
+    def total_size(self):
+        with self.lock:
+            return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM tracks WHERE path IS NOT NULL').fetchone()[0]
+
+    def set_pins(self, item_type, item_ids, source='favorites'):
+        # replaces what the source pinned before
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM pins WHERE item_type = ? AND source = ?', (item_type, source))
+            self.connection.executemany('INSERT OR IGNORE INTO pins (item_type, item_id, source) VALUES (?, ?, ?)', [(item_type, str(item_id), source) for item_id in item_ids])
+
+    def pin(self, item_type, item_id, source='manual'):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO pins (item_type, item_id, source) VALUES (?, ?, ?)', (item_type, str(item_id), source))
+
+    def unpin(self, item_type, item_id, source='manual'):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM pins WHERE item_type = ? AND item_id = ? AND source = ?', (item_type, str(item_id), source))
+
+    def eviction_candidates(self, policy='lru'):
+        # cached tracks which aren't pinned by themselves or through their album
+        order = LibraryIndex.EVICTION_ORDERS[policy]
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM tracks WHERE path IS NOT NULL AND track_id NOT IN (SELECT item_id FROM pins WHERE item_type = 'tracks') AND (album_id IS NULL OR album_id NOT IN (SELECT item_id FROM pins WHERE item_type = 'albums')) ORDER BY {}".format(order)).fetchall()
+        return [dict(row) for row in rows]
+
+    def tracks(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT * FROM tracks WHERE path IS NOT NULL').fetchall()
+        for row in rows:
+            yield dict(row)
+
+    def album_tracks(self, album_id, format_id):
+        with self.lock:
+            rows = self.connection.execute('SELECT * FROM tracks WHERE album_id = ? AND format_id = ?', (str(album_id), format_id)).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove_album(self, album_id):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM albums WHERE album_id = ?', (str(album_id),))
+
+    def set_album(self, album_id, tracks_count):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO albums (album_id, tracks_count) VALUES (?, ?)', (str(album_id), tracks_count))
+
+    def is_album_complete(self, album_id, format_id):
+        # an album is complete once every track is cached, one with unavailable tracks is tried again
+        with self.lock:
+            row = self.connection.execute('SELECT tracks_count, (SELECT COUNT(*) FROM tracks WHERE album_id = albums.album_id AND format_id = ? AND path IS NOT NULL) FROM albums WHERE album_id = ?', (format_id, str(album_id))).fetchone()
+        return bool(row) and row[1] >= row[0]
+
+    def rebuild(self, cache_dir, checksums=False):
+        # rescan cache_dir, files are indexed by their qobuz id tags, or by their path if they were indexed before
+        import taglib
+        known_tracks = {track['path']: track for track in self.tracks()}
+        indexed_tracks = []
+        unknown_files = []
+        for root, dirs, files in os.walk(cache_dir):
+            for file_name in files:
+                extension = os.path.splitext(file_name)[1].lower()
+                if extension not in AUDIO_EXTENSIONS:
+                    continue
+                absolute_path = os.path.join(root, file_name)
+                path = os.path.relpath(absolute_path, cache_dir)
+                try:
+                    tags = taglib.File(absolute_path).tags
+                except OSError:
+                    unknown_files.append(path)
+                    continue
+                known_track = known_tracks.get(path)
+                if TRACK_ID_TAG not in tags and not known_track:
+                    unknown_files.append(path)
+                    continue
+                size = os.path.getsize(absolute_path)
+                if known_track and known_track['size'] == size and not checksums:
+                    checksum = known_track['checksum']
+                else:
+                    checksum = get_file_checksum(absolute_path)
+                if TRACK_ID_TAG in tags:
+                    track_id = tags[TRACK_ID_TAG][0]
+                    format_id = int(tags.get(FORMAT_ID_TAG, [AUDIO_EXTENSIONS[extension]])[0])
+                    album_id = tags.get(ALBUM_ID_TAG, [None])[0]
+                else:
+                    track_id, format_id, album_id = known_track['track_id'], known_track['format_id'], known_track['album_id']
+                last_played, play_count = (known_track['last_played'], known_track['play_count']) if known_track else (None, 0)
+                indexed_tracks.append((track_id, format_id, album_id, path, size, checksum, time.time(), last_played, play_count))
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM tracks WHERE path IS NOT NULL')
+            self.connection.executemany('INSERT OR REPLACE INTO tracks (track_id, format_id, album_id, path, size, checksum, indexed_at, last_played, play_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', indexed_tracks)
+        return len(indexed_tracks), unknown_files
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,225 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import shutil
+import subprocess
+
+import taglib
+
+from qobuz import library_index
+from qobuz.qobuz_api import QobuzApi, QobuzFileError
+from qobuz.rate_limiter import Priority
+
+FLAC_BINARY = shutil.which('flac')
+
+def read_flac_header(path):
+    # walk the metadata blocks, a file cut off before its first audio frame is broken
+    with open(path, 'rb') as in_file:
+        if in_file.read(4) != b'fLaC':
+            return None
+        stream_info = None
+        while True:
+            block_header = in_file.read(4)
+            if len(block_header) < 4:
+                return None
+            block_length = int.from_bytes(block_header[1:], 'big')
+            if block_header[0] & 0x7f == 0:
+                stream_info = in_file.read(block_length)
+            else:
+                in_file.seek(block_length, os.SEEK_CUR)
+            if block_header[0] & 0x80:
+                break
+        audio_offset = in_file.tell()
+        if not stream_info or len(stream_info) < 34 or audio_offset >= os.fstat(in_file.fileno()).st_size:
+            return None
+    packed_info = int.from_bytes(stream_info[10:18], 'big')
+    return {
+        'sample_rate': packed_info >> 44,
+        'total_samples': packed_info & (2 ** 36 - 1),
+        'md5': stream_info[18:34].hex(),
+        'audio_offset': audio_offset
+    }
+
+def check_file(path, verify_md5=False):
+    # runs in a worker process, only the result is sent back
+    result = {
+        'size': os.path.getsize(path),
+        'problem': None,
+        'duration': None,
+        'tags': {}
+    }
+    if path.lower().endswith('.flac'):
+        header = read_flac_header(path)
+        if not header or not header['sample_rate']:
+            result['problem'] = 'header'
+            return result
+        result['duration'] = header['total_samples'] / header['sample_rate']
+        # flac -t decodes the whole file and compares it with the md5 of the header
+        if verify_md5 and FLAC_BINARY and header['md5'] != '0' * 32:
+            if subprocess.call([FLAC_BINARY, '-t', '-s', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+                result['problem'] = 'md5'
+                return result
+    try:
+        result['tags'] = taglib.File(path).tags
+    except OSError:
+        result['problem'] = 'unreadable'
+    return result
+
+class LibraryMaintenance:
+    PROGRESS_INTERVAL = 1000
+    CHECKPOINT_INTERVAL = 100
+    # seconds the header may be off from the duration qobuz reports
+    DURATION_TOLERANCE = 2
+
+    def __init__(self, qobuz_api, workers=None, verify_md5=False, dry_run=False, fetch_meta_data=True, checkpoint_path=None):
+        self.qobuz_api = qobuz_api
+        self.workers = workers or os.cpu_count()
+        self.verify_md5 = verify_md5
+        self.dry_run = dry_run
+        self.fetch_meta_data = fetch_meta_data
+        self.checkpoint_path = checkpoint_path or os.path.join(qobuz_api.cache_dir, '.qobuz_maintenance.checkpoint')
+        self.counts = Counter()
+        self.redownloads = {}
+        self.checkpoint_file = None
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                return set(line.rstrip('\n') for line in checkpoint_file)
+        except FileNotFoundError:
+            return set()
+
+    def get_paths(self):
+        cache_dir = self.qobuz_api.cache_dir
+        for root, dirs, files in os.walk(cache_dir):
+            # .covers and other bookkeeping folders
+            dirs[:] = [directory for directory in dirs if not directory.startswith('.')]
+            for file_name in files:
+                if os.path.splitext(file_name)[1].lower() in library_index.AUDIO_EXTENSIONS:
+                    yield os.path.relpath(os.path.join(root, file_name), cache_dir)
+
+    def run(self, restart=False):
+        if restart and os.path.isfile(self.checkpoint_path):
+            os.unlink(self.checkpoint_path)
+        checked_paths = self.load_checkpoint()
+        paths = [path for path in self.get_paths() if path not in checked_paths]
+        indexed_tracks = {}
+        if self.qobuz_api.library_index:
+            indexed_tracks = {track['path']: track for track in self.qobuz_api.library_index.tracks()}
+        print("Checking {} files ({} checked before)".format(len(paths), len(checked_paths)))
+        self.counts = Counter()
+        self.redownloads = {}
+        # files of an album without cached meta data wait for a single album/get
+        album_checks = []
+        absolute_paths = [self.qobuz_api.get_cache_file_path(path) for path in paths]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor, open(self.checkpoint_path, 'a') as self.checkpoint_file:
+            results = executor.map(check_file, absolute_paths, itertools.repeat(self.verify_md5), chunksize=64)
+            for position, (path, result) in enumerate(zip(paths, results), 1):
+                check = self.get_check(path, result, indexed_tracks.get(path))
+                if not check['meta_data'] and check['album_id'] and self.fetch_meta_data:
+                    # the files of an album follow each other in the walk
+                    if album_checks and album_checks[0]['album_id'] != check['album_id']:
+                        self.handle_album(album_checks)
+                        album_checks = []
+                    album_checks.append(check)
+                else:
+                    self.handle_check(check)
+                if position % LibraryMaintenance.PROGRESS_INTERVAL == 0:
+                    print("Checked {}/{} files".format(position, len(paths)))
+            if album_checks:
+                self.handle_album(album_checks)
+        self.checkpoint_file = None
+        if self.redownloads and not self.dry_run:
+            self.redownload(self.redownloads)
+        os.unlink(self.checkpoint_path)
+        if self.counts['unchecked']:
+            print("{} files have no meta data, their tags, duration and size weren't checked".format(self.counts['unchecked']))
+        return self.counts
+
+    def get_check(self, path, result, indexed_track):
+        tags = result['tags']
+        track_id = (tags.get(library_index.TRACK_ID_TAG) or [indexed_track and indexed_track['track_id']])[0]
+        album_id = (tags.get(library_index.ALBUM_ID_TAG) or [indexed_track and indexed_track['album_id']])[0]
+        return {
+            'path': path,
+            'result': result,
+            'indexed_track': indexed_track,
+            'track_id': track_id,
+            'album_id': album_id,
+            'meta_data': track_id and self.qobuz_api.get_cached_track_meta_data(track_id, album_id)
+        }
+
+    def handle_album(self, checks):
+        # one album/get for all its tracks, instead of a track/get per file
+        album_meta_data = self.qobuz_api.get_meta_data_for_album_id(checks[0]['album_id'])
+        track_items = {str(track['id']): track for track in album_meta_data.get('tracks', {}).get('items', [])}
+        for check in checks:
+            track = track_items.get(str(check['track_id']))
+            if track and self.qobuz_api.has_track_meta_data(track, album_meta_data):
+                check['meta_data'] = self.qobuz_api.parse_track_meta_data(track, album_meta_data)
+            self.handle_check(check)
+
+    def handle_check(self, check):
+        path = check['path']
+        action = self.handle_result(path, check['result'], check['indexed_track'], check['track_id'], check['meta_data'])
+        self.counts[action] += 1
+        # broken files are only done once they're downloaded again, a resumed run checks them again
+        if path not in self.redownloads:
+            self.checkpoint_file.write(path + '\n')
+        if sum(self.counts.values()) % LibraryMaintenance.CHECKPOINT_INTERVAL == 0:
+            self.checkpoint_file.flush()
+
+    def handle_result(self, path, result, indexed_track, track_id, meta_data):
+        tags = result['tags']
+        problem = result['problem']
+        if not track_id:
+            print("{}: {}".format(path, problem or 'no track id'))
+            return 'unknown'
+        if not meta_data and self.fetch_meta_data:
+            # only tracks without an album id
+            meta_data = self.qobuz_api.get_meta_data(track_id)
+        tags_match = bool(meta_data) and all(tags.get(tag) == [value] for tag, value in QobuzApi.get_tags(meta_data, self.qobuz_api.format_id).items())
+        # with unchanged tags a file smaller than when it was indexed has been cut off
+        if not problem and tags_match and indexed_track and result['size'] < indexed_track['size']:
+            problem = 'truncated'
+        if not problem and meta_data and result['duration'] is not None and abs(result['duration'] - meta_data['duration']) > LibraryMaintenance.DURATION_TOLERANCE:
+            problem = 'duration'
+        if problem:
+            if not meta_data:
+                print("{}: {}, can't be downloaded again without meta data".format(path, problem))
+                return problem
+            print("{}: {}, downloading again".format(path, problem))
+            self.redownloads[path] = meta_data
+            return problem
+        if not meta_data:
+            return 'unchecked'
+        if tags_match:
+            return 'ok'
+        print("{}: tags differ, tagging again".format(path))
+        if not self.dry_run:
+            self.qobuz_api.tag_file(path, meta_data)
+            self.qobuz_api.index_track(meta_data, path)
+        return 'retagged'
+
+    def redownload(self, redownloads):
+        executor = self.qobuz_api.get_executor()
+        futures = [executor.submit(self.qobuz_api.call_with_priority, Priority.BULK, self.redownload_track, path, meta_data) for path, meta_data in redownloads.items()]
+        if not all([future.result() for future in futures]):
+            print("Some tracks could not be downloaded again")
+
+    def redownload_track(self, path, meta_data):
+        # the broken file is only replaced once the new one is complete, until then
+        # it stays where it is and indexed, so an interrupted run finds it again
+        qobuz_api = self.qobuz_api
+        track_id = meta_data['track_id']
+        try:
+            file_url = qobuz_api.get_file_url(track_id)
+        except QobuzFileError as e:
+            print(e)
+            return False
+        if not qobuz_api.cache_file(file_url, path):
+            qobuz_api.file_url_cache.invalidate(track_id, qobuz_api.format_id)
+            return False
+        qobuz_api.finalize_track(meta_data, path)
+        return True
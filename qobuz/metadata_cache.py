@@ -0,0 +1,98 @@
+import json
+import sqlite3
+import threading
+import time
+
+DAY = 24 * 3600
+
+class MetadataCache:
+    # seconds until an entry of the given entity type has to be refetched, 0 disables caching
+    DEFAULT_TTLS = {
+        'track': 30 * DAY,
+        'album': 7 * DAY,
+        'artist': DAY,
+        'search': DAY,
+    }
+    # only persist access times this stale, so that lookups stay read only most of the time
+    ACCESS_RESOLUTION = 3600
+    EVICT_CHECK_INTERVAL = 100
+
+    def __init__(self, path, ttls=None, max_entries=100000):
+        self.path = path
+        self.ttls = dict(MetadataCache.DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta_data (entity TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (entity, key))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS meta_data_accessed_at ON meta_data (accessed_at)')
+
+    def get_ttl(self, entity):
+        return self.ttls.get(entity, DAY)
+
+    def get(self, entity, key):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT value, fetched_at, accessed_at FROM meta_data WHERE entity = ? AND key = ?', (entity, str(key))).fetchone()
+            if not row:
+                return None
+            value, fetched_at, accessed_at = row
+            if now - fetched_at > self.get_ttl(entity):
+                with self.connection:
+                    self.connection.execute('DELETE FROM meta_data WHERE entity = ? AND key = ?', (entity, str(key)))
+                return None
+            if now - accessed_at > MetadataCache.ACCESS_RESOLUTION:
+                with self.connection:
+                    self.connection.execute('UPDATE meta_data SET accessed_at = ? WHERE entity = ? AND key = ?', (now, entity, str(key)))
+        return json.loads(value)
+
+    def set(self, entity, key, value):
+        if not self.get_ttl(entity):
+            return
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO meta_data (entity, key, value, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)', (entity, str(key), json.dumps(value), now, now))
+            self.writes += 1
+            if self.writes % MetadataCache.EVICT_CHECK_INTERVAL == 0:
+                self.evict()
+
+    def evict(self):
+        # drop the least recently used tenth once the cache is over its size
+        entry_count = self.connection.execute('SELECT COUNT(*) FROM meta_data').fetchone()[0]
+        if entry_count <= self.max_entries:
+            return 0
+        evict_count = entry_count - self.max_entries + self.max_entries // 10
+        with self.connection:
+            self.connection.execute('DELETE FROM meta_data WHERE rowid IN (SELECT rowid FROM meta_data ORDER BY accessed_at LIMIT ?)', (evict_count,))
+        return evict_count
+
+    def invalidate(self, entity=None, key=None):
+        query = 'DELETE FROM meta_data'
+        params = ()
+        if entity and key is not None:
+            query += ' WHERE entity = ? AND key = ?'
+            params = (entity, str(key))
+        elif entity:
+            query += ' WHERE entity = ?'
+            params = (entity,)
+        elif key is not None:
+            query += ' WHERE key = ?'
+            params = (str(key),)
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).rowcount
+
+    def expire(self):
+        now = time.time()
+        expired_count = 0
+        with self.lock, self.connection:
+            for entity, ttl in self.ttls.items():
+                expired_count += self.connection.execute('DELETE FROM meta_data WHERE entity = ? AND fetched_at < ?', (entity, now - ttl)).rowcount
+        return expired_count
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
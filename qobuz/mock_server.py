@@ -0,0 +1,235 @@
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import struct
+import threading
+import time
+import urllib.parse
+
+API_PATH = '/api.json/0.2/'
+
+def get_flac_data(track_id, size):
+    # a STREAMINFO block is enough for taglib, the frames are filler
+    stream_info = struct.pack('>HH', 4096, 4096) + bytes(6)
+    stream_info += ((44100 << 44) | (1 << 41) | (15 << 36) | 44100 * 180).to_bytes(8, 'big') + bytes(16)
+    header = b'fLaC' + bytes([0x80]) + len(stream_info).to_bytes(3, 'big') + stream_info
+    filler = random.Random(track_id).getrandbits(4096 * 8).to_bytes(4096, 'big')
+    body_size = max(0, size - len(header))
+    return header + (filler * (body_size // len(filler) + 1))[:body_size]
+
+class MockCatalog:
+    def __init__(self, base_url, artist_count=50, albums_per_artist=5, tracks_per_album=10, favorite_track_count=1000, track_size=256 * 1024, sample_track_ids=()):
+        self.base_url = base_url
+        self.artist_count = artist_count
+        self.albums_per_artist = albums_per_artist
+        self.tracks_per_album = tracks_per_album
+        self.favorite_track_count = favorite_track_count
+        self.track_size = track_size
+        # only a preview of these can be streamed, like tracks which aren't licensed
+        self.sample_track_ids = set(sample_track_ids)
+
+    def get_artist(self, artist_id):
+        return {'id': artist_id, 'name': 'Artist {}'.format(artist_id)}
+
+    def get_album(self, album_id, with_tracks=False):
+        artist_id = album_id // 1000
+        album = {
+            'id': str(album_id),
+            'title': 'Album {}'.format(album_id),
+            'artist': self.get_artist(artist_id),
+            'genre': {'name': 'Ambient'},
+            'image': {'large': '{}/cover/{}.jpg'.format(self.base_url, album_id)},
+            'media_count': 1,
+            'released_at': 1262304000 + album_id,
+            'tracks_count': self.tracks_per_album
+        }
+        if with_tracks:
+            tracks = [self.get_track(album_id * 100 + track_number, with_album=False) for track_number in range(1, self.tracks_per_album + 1)]
+            album['tracks'] = {'items': tracks, 'total': len(tracks), 'offset': 0, 'limit': 50}
+        return album
+
+    def get_track(self, track_id, with_album=True):
+        track = {
+            'id': track_id,
+            'title': 'Track {}'.format(track_id),
+            'track_number': track_id % 100,
+            'media_number': 1,
+            'duration': 180,
+            'performer': self.get_artist(track_id // 100000)
+        }
+        if with_album:
+            track['album'] = self.get_album(track_id // 100)
+        return track
+
+    def get_artist_album_ids(self, artist_id):
+        return [artist_id * 1000 + album_number for album_number in range(self.albums_per_artist)]
+
+    def get_favorite_track_ids(self):
+        track_ids = []
+        for artist_id in range(1, self.artist_count + 1):
+            for album_id in self.get_artist_album_ids(artist_id):
+                for track_number in range(1, self.tracks_per_album + 1):
+                    if len(track_ids) >= self.favorite_track_count:
+                        return track_ids
+                    track_ids.append(album_id * 100 + track_number)
+        return track_ids
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.write_throttled(body)
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_body(json.dumps(data).encode('utf-8'), 'application/json', status, headers)
+
+    def write_throttled(self, body):
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk_size = 64 * 1024
+        for position in range(0, len(body), chunk_size):
+            chunk = body[position:position + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if url.path.startswith(API_PATH):
+            self.handle_api(url.path[len(API_PATH):], params)
+        elif url.path.startswith('/file/'):
+            self.handle_file(int(url.path.split('/')[-1]))
+        elif url.path.startswith('/cover/'):
+            self.server.count('cover')
+            self.send_body(b'\xff\xd8\xff\xe0' + url.path.encode('utf-8'), 'image/jpeg')
+        else:
+            self.send_json({'status': 'error', 'code': 404, 'message': 'Not found'}, 404)
+
+    def handle_api(self, endpoint, params):
+        server = self.server
+        server.count(endpoint)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.random.random() < server.error_rate:
+            if server.random.random() < 0.5:
+                self.send_json({'status': 'error', 'code': 429, 'message': 'Too many requests'}, 429, {'Retry-After': '0'})
+            else:
+                self.send_json({'status': 'error', 'code': 503, 'message': 'Unavailable'}, 503)
+            return
+        catalog = server.catalog
+        if endpoint == 'track/get':
+            self.send_json(catalog.get_track(int(params['track_id'])))
+        elif endpoint == 'track/getFileUrl':
+            expires_at = int(time.time()) + 1800
+            file_url = {'track_id': int(params['track_id']), 'format_id': int(params['format_id']), 'url': '{}/file/{}?etsp={}'.format(catalog.base_url, params['track_id'], expires_at)}
+            if file_url['track_id'] in catalog.sample_track_ids:
+                file_url['sample'] = True
+            self.send_json(file_url)
+        elif endpoint == 'album/get':
+            self.send_json(catalog.get_album(int(params['album_id']), with_tracks=True))
+        elif endpoint == 'artist/get':
+            artist_id = int(params['artist_id'])
+            artist = catalog.get_artist(artist_id)
+            album_ids = catalog.get_artist_album_ids(artist_id)
+            if params.get('extra') == 'albums':
+                artist['albums'] = {'items': [catalog.get_album(album_id) for album_id in album_ids], 'total': len(album_ids)}
+            if params.get('extra') == 'tracks':
+                track_ids = [album_ids[0] * 100 + track_number for track_number in range(1, catalog.tracks_per_album + 1)]
+                artist['tracks'] = {'items': [catalog.get_track(track_id) for track_id in track_ids], 'total': len(track_ids)}
+            self.send_json(artist)
+        elif endpoint == 'artist/getSimilarArtists':
+            artist_id = int(params['artist_id'])
+            limit = int(params.get('limit', 3))
+            artists = [catalog.get_artist((artist_id + offset) % catalog.artist_count + 1) for offset in range(limit)]
+            self.send_json({'artists': {'items': artists, 'total': len(artists)}})
+        elif endpoint == 'catalog/search':
+            query = params.get('query', '')
+            limit = int(params.get('limit', 10))
+            offset = int(params.get('offset', 0))
+            # every artist whose number contains the one searched for, highest first, so an exact match may be on a later page
+            number = query.split()[-1] if query.split()[-1:] and query.split()[-1].isdigit() else None
+            artist_ids = [artist_id for artist_id in range(catalog.artist_count, 0, -1) if number and number in str(artist_id)]
+            artists = [catalog.get_artist(artist_id) for artist_id in artist_ids[offset:offset + limit]]
+            # albums the same way, by their number
+            album_ids = [album_id for artist_id in range(1, catalog.artist_count + 1) for album_id in catalog.get_artist_album_ids(artist_id) if number and number in str(album_id)]
+            albums = [catalog.get_album(album_id) for album_id in album_ids[offset:offset + limit]]
+            self.send_json({'query': query, 'artists': {'items': artists, 'total': len(artist_ids), 'offset': offset, 'limit': limit}, 'albums': {'items': albums, 'total': len(album_ids), 'offset': offset, 'limit': limit}})
+        elif endpoint == 'favorite/getUserFavorites':
+            favorite_type = params.get('type', 'tracks')
+            limit = int(params.get('limit', 50))
+            offset = int(params.get('offset', 0))
+            items = []
+            if favorite_type == 'tracks':
+                items = [catalog.get_track(track_id) for track_id in catalog.get_favorite_track_ids()]
+            elif favorite_type == 'albums':
+                items = [catalog.get_album(album_id) for album_id in catalog.get_artist_album_ids(1)]
+            elif favorite_type == 'artists':
+                items = [catalog.get_artist(1)]
+            self.send_json({favorite_type: {'items': items[offset:offset + limit], 'total': len(items), 'offset': offset, 'limit': limit}})
+        else:
+            self.send_json({'status': 'error', 'code': 404, 'message': 'Unknown endpoint'}, 404)
+
+    def handle_file(self, track_id):
+        self.server.count('file')
+        data = get_flac_data(track_id, self.server.catalog.track_size)
+        start, end = 0, len(data) - 1
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            range_start, _, range_end = range_header[len('bytes='):].partition('-')
+            start = int(range_start or 0)
+            end = min(int(range_end), end) if range_end else end
+            if start >= len(data):
+                self.send_body(b'', 'audio/flac', 416, {'Content-Range': 'bytes */{}'.format(len(data))})
+                return
+            self.send_body(data[start:end + 1], 'audio/flac', 206, {'Content-Range': 'bytes {}-{}/{}'.format(start, end, len(data))})
+            return
+        self.send_body(data, 'audio/flac')
+
+class MockQobuzServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0, bandwidth=0, error_rate=0, seed=0, host='127.0.0.1', port=0, **catalog_options):
+        ThreadingHTTPServer.__init__(self, (host, port), MockRequestHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.base_url = 'http://{}:{}'.format(*self.server_address[:2])
+        self.api_endpoint = self.base_url + API_PATH.rstrip('/')
+        self.catalog = MockCatalog(self.base_url, **catalog_options)
+        self.counts_lock = threading.Lock()
+        self.counts = Counter()
+        self.thread = None
+
+    def count(self, endpoint):
+        with self.counts_lock:
+            self.counts[endpoint] += 1
+
+    def reset_counts(self):
+        with self.counts_lock:
+            counts = dict(self.counts)
+            self.counts.clear()
+        return counts
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,225 @@
+from collections import deque
+import shutil
+import subprocess
+import threading
+import time
+
+class PlayerError(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+class PlayerEntry:
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+class Player:
+    # queue bookkeeping shared by the backends, entries stay queued until they're done
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.entries = deque()
+        self.closed = False
+
+    @property
+    def current(self):
+        with self.condition:
+            for entry in self.entries:
+                if entry.started.is_set():
+                    return entry
+        return None
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.entries)
+
+    def enqueue(self, path, data=None):
+        entry = PlayerEntry(path, data)
+        with self.condition:
+            if self.closed:
+                raise PlayerError("The player is closed")
+            self.entries.append(entry)
+            self.condition.notify_all()
+        self.load(entry)
+        return entry
+
+    def wait(self, max_pending=0):
+        # returns once at most max_pending entries are left, 1 keeps the next track lined up
+        with self.condition:
+            while len(self.entries) > max_pending and not self.closed:
+                self.condition.wait()
+
+    def start_entry(self, entry):
+        entry.started.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def finish_entry(self, entry):
+        entry.done.set()
+        with self.condition:
+            if entry in self.entries:
+                self.entries.remove(entry)
+            self.condition.notify_all()
+
+    def finish_all(self):
+        with self.condition:
+            entries = list(self.entries)
+        for entry in entries:
+            self.finish_entry(entry)
+
+    def load(self, entry):
+        raise NotImplementedError
+
+    def skip(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class MPlayer(Player):
+    # one mplayer in slave mode for the whole session, files are appended to its playlist
+    # so it goes on to the next one without starting up again and without a gap
+    command = ["mplayer", "-slave", "-idle", "-quiet", "-nolirc", "-gapless-audio", "-msglevel", "all=4:global=6"]
+
+    def __init__(self, command=None, stderr=subprocess.DEVNULL):
+        Player.__init__(self)
+        self.command = command or MPlayer.command
+        if not shutil.which(self.command[0]):
+            raise PlayerError("{} not found".format(self.command[0]))
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+        self.command_lock = threading.Lock()
+        self.playing_entry = None
+        self.reader_thread = threading.Thread(target=self.read_output, name='qobuz-mplayer', daemon=True)
+        self.reader_thread.start()
+
+    @staticmethod
+    def quote(path):
+        return '"{}"'.format(path.replace('\\', '\\\\').replace('"', '\\"'))
+
+    def send(self, command):
+        with self.command_lock:
+            try:
+                self.process.stdin.write(command.encode('utf-8', 'surrogateescape') + b'\n')
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                raise PlayerError("mplayer isn't running")
+
+    def read_output(self):
+        # every file gets a "Playing <path>." line when it's opened and an "EOF code" once it's over
+        for line in self.process.stdout:
+            line = line.strip()
+            if line.startswith(b'Playing '):
+                with self.condition:
+                    entries = [entry for entry in self.entries if not entry.started.is_set()]
+                if self.playing_entry:
+                    self.finish_entry(self.playing_entry)
+                self.playing_entry = entries[0] if entries else None
+                if self.playing_entry:
+                    self.start_entry(self.playing_entry)
+            elif line.startswith(b'EOF code:') and self.playing_entry:
+                self.finish_entry(self.playing_entry)
+                self.playing_entry = None
+        # mplayer is gone, nothing queued will be played
+        self.playing_entry = None
+        self.finish_all()
+        self.close()
+
+    def load(self, entry):
+        # 1 appends to the playlist, playback starts right away when it's idle
+        self.send('loadfile {} 1'.format(MPlayer.quote(entry.path)))
+
+    def skip(self):
+        if not self.current:
+            return False
+        self.send('pt_step 1 1')
+        return True
+
+    def stop(self):
+        # empties the playlist as well
+        with self.condition:
+            playing = bool(self.entries)
+        if playing and self.process.poll() is None:
+            self.send('stop')
+        self.playing_entry = None
+        self.finish_all()
+        return playing
+
+    def close(self):
+        Player.close(self)
+        if self.process.poll() is None:
+            try:
+                self.send('quit')
+            except PlayerError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class NullPlayer(Player):
+    # reads every file to the end and throws the audio away, play_time slows it down to a fixed time per file
+    chunk_size = 64 * 1024
+
+    def __init__(self, play_time=0):
+        Player.__init__(self)
+        self.play_time = play_time
+        self.played = []
+        self.skip_event = threading.Event()
+        self.play_thread = threading.Thread(target=self.play_entries, name='qobuz-null-player', daemon=True)
+        self.play_thread.start()
+
+    def load(self, entry):
+        pass
+
+    def play_entries(self):
+        while True:
+            with self.condition:
+                while not self.entries and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                entry = self.entries[0]
+            self.skip_event.clear()
+            self.start_entry(entry)
+            self.play_entry(entry)
+            self.finish_entry(entry)
+
+    def play_entry(self, entry):
+        started_at = time.monotonic()
+        try:
+            with open(entry.path, 'rb') as in_file:
+                while not self.skip_event.is_set() and in_file.read(NullPlayer.chunk_size):
+                    pass
+        except OSError as e:
+            print("Playing {} failed: {}".format(entry.path, e))
+            return
+        self.played.append(entry.path)
+        self.skip_event.wait(max(0, self.play_time - (time.monotonic() - started_at)))
+
+    def skip(self):
+        if not self.current:
+            return False
+        self.skip_event.set()
+        return True
+
+    def stop(self):
+        with self.condition:
+            entries = list(self.entries)
+            # the playing entry is taken off by its thread
+            for entry in entries:
+                if not entry.started.is_set():
+                    self.entries.remove(entry)
+                    entry.done.set()
+            self.condition.notify_all()
+        self.skip_event.set()
+        return bool(entries)
+
+    def close(self):
+        self.stop()
+        Player.close(self)
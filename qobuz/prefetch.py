@@ -0,0 +1,75 @@
+import threading
+
+from qobuz.rate_limiter import Priority
+
+class TrackPrefetcher:
+    # the most bytes per second a track of each format takes up, uncompressed pcm for the lossless ones
+    BYTES_PER_SECOND = {
+        5: 320000 // 8,
+        6: 44100 * 2 * 2,
+        7: 96000 * 3 * 2,
+        27: 192000 * 3 * 2
+    }
+    # for tracks whose meta data isn't known yet
+    DEFAULT_DURATION = 600
+
+    def __init__(self, qobuz_api, depth=2, max_bytes=1024 ** 3):
+        self.qobuz_api = qobuz_api
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.reserved_bytes = {}
+
+    def fetch(self, track_id, track_meta_data=None):
+        self.qobuz_api.play_track(track_id, cache_only=True, track_meta_data=track_meta_data)
+        indexed_track = self.qobuz_api.get_indexed_track(track_id)
+        return indexed_track['size'] if indexed_track else 0
+
+    def estimate_bytes(self, track_meta_data=None):
+        duration = track_meta_data['duration'] if track_meta_data else TrackPrefetcher.DEFAULT_DURATION
+        return int(duration * TrackPrefetcher.BYTES_PER_SECOND.get(self.qobuz_api.format_id, TrackPrefetcher.BYTES_PER_SECOND[27]))
+
+    def get_buffered_bytes(self):
+        # finished prefetches count with their size, running ones with as much as they may take up
+        buffered_bytes = 0
+        for track_id, future in self.futures.items():
+            if not future.done():
+                buffered_bytes += self.reserved_bytes[track_id]
+            elif not future.cancelled() and not future.exception():
+                buffered_bytes += future.result()
+        return buffered_bytes
+
+    def prefetch(self, track_ids, track_meta_data=None):
+        # cache the next tracks in the background while the current one plays
+        track_meta_data = track_meta_data or {}
+        with self.lock:
+            for track_id in list(track_ids)[:self.depth]:
+                if track_id in self.futures:
+                    continue
+                reserved_bytes = self.estimate_bytes(track_meta_data.get(track_id))
+                if self.get_buffered_bytes() + reserved_bytes > self.max_bytes:
+                    break
+                self.reserved_bytes[track_id] = reserved_bytes
+                self.futures[track_id] = self.qobuz_api.get_prefetch_executor().submit(self.qobuz_api.call_with_priority, Priority.PREFETCH, self.fetch, track_id, track_meta_data.get(track_id))
+
+    def wait(self, track_id):
+        with self.lock:
+            future = self.futures.pop(track_id, None)
+            self.reserved_bytes.pop(track_id, None)
+        if not future:
+            return
+        try:
+            future.result()
+        except Exception as e:
+            # playing the track will fetch it again
+            print("Prefetching track {} failed: {}".format(track_id, e))
+
+    def retain(self, track_ids):
+        # forget prefetches which won't be played, the files stay cached
+        track_ids = set(track_ids)
+        with self.lock:
+            for track_id in list(self.futures):
+                if track_id not in track_ids:
+                    self.futures.pop(track_id).cancel()
+                    del self.reserved_bytes[track_id]
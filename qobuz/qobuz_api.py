@@ -1,19 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
 import hashlib
+import threading
 import time
 import json
 import os
-import urllib.request
+import urllib.parse
 import shutil
-import subprocess
+import tempfile
 
 import requests
-import taglib
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
+
+from qobuz import artist_graph, library_index
+from qobuz.artist_graph import ArtistGraph
+from qobuz.cache_manager import CacheManager
+from qobuz.cover_cache import CoverCache
+from qobuz.instrumentation import Instrumentation, JsonLinesSink, PrometheusExporter
+from qobuz.library_index import LibraryIndex
+from qobuz.metadata_cache import MetadataCache
+from qobuz.player import MPlayer
+from qobuz.prefetch import TrackPrefetcher
+from qobuz.rate_limiter import Priority, RateLimiter
+from qobuz.url_cache import FileUrlCache
 
 class QobuzFileError(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
 
+class QobuzApiError(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
 class QobuzIncompleteAlbumError(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
@@ -26,27 +47,197 @@ class FavoriteType(Enum):
 class QobuzApi:
     API_ENDPOINT = 'https://www.qobuz.com/api.json/0.2'
     album_web_url = 'https://play.qobuz.com/album/{id}'
+    # play_track returns once the player has at most this many tracks left, so the next one is lined up in time
+    player_lookahead = 1
+    stream_chunk_size = 64 * 1024
+    # none leaves flushing to the os, file syncs every file before the rename, batch syncs once per fsync_batch_size files
+    FSYNC_POLICIES = ('none', 'file', 'batch')
 
-    def __init__(self, app_id, app_secret, user_auth_token, format_id=6, cache_dir='.', log_dir='.'):
+    def __init__(self, app_id, app_secret, user_auth_token, format_id=6, cache_dir='.', log_dir='.', workers=4, max_connections_per_host=4, pool_size=10, retries=3, backoff_factor=0.5, timeout=30, meta_data_cache=True, meta_data_ttls=None, meta_data_cache_size=100000, use_library_index=True, progressive=False, prefetch_depth=2, prefetch_max_bytes=1024 ** 3, download_segments=1, segment_min_size=32 * 1024 ** 2, rate_limits=None, file_url_cache_size=512, api_endpoint=None, log_events=False, metrics_port=None, download_buffer_size=1024 ** 2, fsync_policy='none', fsync_batch_size=20, use_artist_graph=True, player=None, cache_max_bytes=None, cache_policy='lru', cache_cleanup_interval=3600):
         self.app_id = app_id
         self.app_secret = app_secret
         self.user_auth_token = user_auth_token
-        self.track_id = 0
-        self.request_ts = int(time.time())
+        if api_endpoint:
+            self.API_ENDPOINT = api_endpoint
         self.format_id = format_id
         self.cache_dir = cache_dir
         self.log_dir = log_dir
         self.cache_dir_fd = None
+        self.workers = workers
+        self.max_connections_per_host = max_connections_per_host
+        self.executor = None
+        self.prefetch_executor = None
+        self.lookup_executor = None
+        self.lock = threading.Lock()
+        self.host_slots = {}
+        self.player = player
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.download_segments = download_segments
+        self.segment_min_size = segment_min_size
+        self.download_buffer_size = download_buffer_size
+        if fsync_policy not in QobuzApi.FSYNC_POLICIES:
+            raise ValueError("fsync_policy has to be one of {}".format(', '.join(QobuzApi.FSYNC_POLICIES)))
+        self.fsync_policy = fsync_policy
+        self.fsync_batch_size = fsync_batch_size
+        self.unsynced_file_paths = []
+        self.session = self.create_session()
+        self.rate_limiter = RateLimiter(rate_limits)
+        self.local = threading.local()
+        self.file_url_cache = FileUrlCache(self.resolve_file_url, max_entries=file_url_cache_size, submit=self.submit_in_background)
+        self.meta_data_cache = None
+        if meta_data_cache:
+            meta_data_cache_path = os.path.join(cache_dir, '.qobuz_meta_data.sqlite')
+            self.meta_data_cache = MetadataCache(meta_data_cache_path, meta_data_ttls, meta_data_cache_size)
+        self.progressive = progressive
+        self.prefetcher = TrackPrefetcher(self, prefetch_depth, prefetch_max_bytes)
+        self.cover_cache = CoverCache(os.path.join(cache_dir, '.covers'), self.download_cover)
+        self.library_index = None
+        if use_library_index:
+            self.library_index = LibraryIndex(os.path.join(cache_dir, '.qobuz_library.sqlite'))
+        self.cache_manager = None
+        if self.library_index:
+            self.cache_manager = CacheManager(self, cache_max_bytes, cache_policy, cache_cleanup_interval)
+        elif cache_max_bytes:
+            raise ValueError("cache_max_bytes needs the library index")
+        self.artist_graph = None
+        if use_artist_graph:
+            self.artist_graph = ArtistGraph(os.path.join(cache_dir, '.qobuz_artists.sqlite'))
+        self.instrumentation = Instrumentation()
+        self.event_log = None
+        if log_events and log_dir:
+            # chunk events are only worth it for the metrics, the download event has the totals
+            self.event_log = JsonLinesSink.in_dir(log_dir, exclude=('download_chunk',))
+            self.instrumentation.subscribe(self.event_log)
+        self.metrics_exporter = None
+        if metrics_port:
+            self.metrics_exporter = PrometheusExporter()
+            self.instrumentation.subscribe(self.metrics_exporter)
+            self.metrics_exporter.serve(metrics_port)
+        if self.cache_manager:
+            self.cache_manager.start()
+
+    def create_session(self):
+        # one keep-alive pool for api calls and downloads, sized for the worker pool
+        retry_options = {
+            'total': self.retries,
+            'backoff_factor': self.backoff_factor,
+            'status_forcelist': (500, 502, 503, 504)
+        }
+        try:
+            retry = Retry(allowed_methods=('GET', 'HEAD'), **retry_options)
+        except TypeError:
+            # urllib3 before 1.26, as locked in Pipfile.lock
+            retry = Retry(method_whitelist=('GET', 'HEAD'), **retry_options)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=max(self.pool_size, self.workers), max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get_executor(self):
+        with self.lock:
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='qobuz')
+            return self.executor
+
+    def get_prefetch_executor(self):
+        # prefetches and url refreshes get their own threads, on the worker pool they'd wait behind a whole bulk sync
+        with self.lock:
+            if not self.prefetch_executor:
+                self.prefetch_executor = ThreadPoolExecutor(max_workers=max(2, self.prefetcher.depth), thread_name_prefix='qobuz-prefetch')
+            return self.prefetch_executor
+
+    def get_lookup_executor(self):
+        # name lookups are waited for by the caller, queued behind a bulk sync they'd stall it, or itself when it runs on a worker
+        with self.lock:
+            if not self.lookup_executor:
+                self.lookup_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='qobuz-lookup')
+            return self.lookup_executor
+
+    def close(self):
+        if self.player:
+            # whatever is still queued is played to the end, stop() cuts it short
+            self.player.wait()
+            self.player.close()
+            self.player = None
+        if self.cache_manager:
+            self.cache_manager.close()
+        self.file_url_cache.close()
+        self.session.close()
+        if self.unsynced_file_paths:
+            self.sync_paths(self.unsynced_file_paths)
+            self.unsynced_file_paths = []
+        if self.meta_data_cache:
+            self.meta_data_cache.close()
+        if self.library_index:
+            self.library_index.close()
+        if self.artist_graph:
+            self.artist_graph.close()
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown()
+            self.prefetch_executor = None
+        if self.lookup_executor:
+            self.lookup_executor.shutdown()
+            self.lookup_executor = None
+        if self.cache_dir_fd:
+            os.close(self.cache_dir_fd)
+            self.cache_dir_fd = None
+        if self.event_log:
+            self.instrumentation.unsubscribe(self.event_log)
+            self.event_log.close()
+        if self.metrics_exporter:
+            self.metrics_exporter.close()
 
-    def set_track_id(self, track_id):
-        self.track_id = track_id
+    @contextmanager
+    def host_slot(self, url):
+        # limit concurrent connections per host, the pool shares all hosts
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            slot = self.host_slots[host]
+        with slot:
+            yield
 
-    def get_request_sig(self):
+    def get_api_url(self, path):
+        return '{}/{}'.format(self.API_ENDPOINT, path)
+
+    def get_request_priority(self):
+        return getattr(self.local, 'priority', Priority.INTERACTIVE)
+
+    @contextmanager
+    def request_priority(self, priority):
+        # api calls made by this thread are scheduled in the given lane
+        previous_priority = self.get_request_priority()
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous_priority
+
+    def call_with_priority(self, priority, method, *args, **kwargs):
+        with self.request_priority(priority):
+            return method(*args, **kwargs)
+
+    def submit_in_background(self, method, *args, **kwargs):
+        return self.get_prefetch_executor().submit(self.call_with_priority, Priority.PREFETCH, method, *args, **kwargs)
+
+    def get_request_sig(self, track_id, format_id, request_ts):
+        return QobuzApi.sign_file_url_request(self.app_secret, track_id, format_id, request_ts)
+
+    @staticmethod
+    def sign_file_url_request(app_secret, track_id, format_id, request_ts):
         params = {
-            'format_id': self.format_id,
-            'track_id': self.track_id,
-            'request_ts': self.request_ts,
-            'app_secret': self.app_secret,
+            'format_id': format_id,
+            'track_id': track_id,
+            'request_ts': request_ts,
+            'app_secret': app_secret,
         }
         request_hash = hashlib.md5()
         string_to_hash = "trackgetFileUrlformat_id{format_id}intentstreamtrack_id{track_id}{request_ts}{app_secret}".format_map(params)
@@ -54,25 +245,36 @@ class QobuzApi:
         request_sig = request_hash.hexdigest()
         return request_sig
 
-    def get_file_url(self):
-        self.request_ts = int(time.time())
+    def get_file_url(self, track_id, format_id=None):
+        # signed urls are reused until shortly before they expire
+        with self.instrumentation.timed('file_url', track_id=track_id) as event:
+            self.local.file_url_resolved = False
+            file_url = self.file_url_cache.get(track_id, format_id or self.format_id)
+            event['cache'] = 'miss' if self.local.file_url_resolved else 'hit'
+        return file_url
+
+    def resolve_file_url(self, track_id, format_id):
+        self.local.file_url_resolved = True
+        request_ts = int(time.time())
+        with self.instrumentation.timed('sign', track_id=track_id, format_id=format_id):
+            request_sig = self.get_request_sig(track_id, format_id, request_ts)
         params = {
-            'track_id': self.track_id,
-            'format_id': self.format_id,
-            'request_ts': self.request_ts,
-            'request_sig': self.get_request_sig()
+            'track_id': track_id,
+            'format_id': format_id,
+            'request_ts': request_ts,
+            'request_sig': request_sig
         }
 
-        get_file_url = "https://www.qobuz.com/api.json/0.2/track/getFileUrl?track_id={track_id}&format_id={format_id}&intent=stream&request_ts={request_ts}&request_sig={request_sig}".format_map(params)
+        get_file_url = self.get_api_url("track/getFileUrl?track_id={track_id}&format_id={format_id}&intent=stream&request_ts={request_ts}&request_sig={request_sig}".format_map(params))
 
         json_response = self.get_json_from_url(get_file_url)
 
         if 'url' in json_response:
             file_url = json_response['url']
         else:
-            raise QobuzFileError("Track {} doesn't provide an url.".format(self.track_id))
+            raise QobuzFileError("Track {} doesn't provide an url.".format(track_id))
         if 'sample' in json_response:
-            raise QobuzFileError("Track {} is a sample.".format(self.track_id))
+            raise QobuzFileError("Track {} is a sample.".format(track_id))
         return file_url
 
     @staticmethod
@@ -111,64 +313,564 @@ class QobuzApi:
             'X-User-Auth-Token': self.user_auth_token,
             'X-App-Id': self.app_id
         }
-        response = requests.get(url, headers=headers)
-        json_response = json.loads(response.text)
+        endpoint = self.get_endpoint(url)
+        with self.instrumentation.timed('api_call', endpoint=endpoint) as event:
+            retries = 0
+            for attempt in range(self.retries + 1):
+                self.rate_limiter.acquire(endpoint, self.get_request_priority())
+                with self.host_slot(url):
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                retries += self.get_retry_count(response)
+                if response.status_code != 429:
+                    self.rate_limiter.succeeded(endpoint)
+                    break
+                retries += 1
+                self.rate_limiter.throttled(endpoint, RateLimiter.parse_retry_after(response.headers.get('Retry-After')))
+            else:
+                event['retries'] = retries
+                raise QobuzApiError("Rate limited on {}: {}".format(endpoint, url))
+            event['status'] = response.status_code
+            event['bytes'] = len(response.content)
+            event['retries'] = retries
+            try:
+                json_response = json.loads(response.text)
+            except ValueError:
+                raise QobuzApiError("{} ({}): {}".format(response.reason, response.status_code, url))
+        return json_response
+
+    @staticmethod
+    def get_retry_count(response):
+        # retries on 5xx happen inside urllib3, its history tells how many there were
+        return len(getattr(getattr(response.raw, 'retries', None), 'history', ()))
+
+    @staticmethod
+    def get_endpoint(url):
+        return urllib.parse.urlsplit(url).path.rpartition('/api.json/0.2/')[2]
+
+    def get_cached_json_from_url(self, entity, key, url):
+        with self.instrumentation.timed('meta_data', endpoint=self.get_endpoint(url), entity=entity) as event:
+            if self.meta_data_cache:
+                json_response = self.meta_data_cache.get(entity, key)
+                if json_response is not None:
+                    event['cache'] = 'hit'
+                    return json_response
+            event['cache'] = 'miss'
+            json_response = self.get_json_from_url(url)
+            # never cache api errors
+            if self.meta_data_cache and isinstance(json_response, dict) and json_response.get('status') != 'error':
+                self.meta_data_cache.set(entity, key, json_response)
         return json_response
 
-    def get_meta_data(self):
-        meta_data_url = "https://www.qobuz.com/api.json/0.2/track/get?track_id={}".format(self.track_id)
-        json_response = self.get_json_from_url(meta_data_url)
+    def invalidate_meta_data(self, entity=None, key=None):
+        if self.meta_data_cache:
+            return self.meta_data_cache.invalidate(entity, key)
+        return 0
+
+    def get_meta_data(self, track_id):
+        meta_data_url = self.get_api_url("track/get?track_id={}".format(track_id))
+        json_response = self.get_cached_json_from_url('track', track_id, meta_data_url)
+        return self.parse_track_meta_data(json_response)
 
+    @staticmethod
+    def parse_track_meta_data(track, album=None):
+        # track items of an album payload don't carry the album block, so it's passed separately
+        album = album or track['album']
         meta_data = {
-            'album_artist': json_response['album']['artist']['name'],
-            'artist': json_response.get('performer', json_response.get('composer'))['name'],
-            'album' :json_response['album']['title'],
-            'genre': json_response['album']['genre']['name'],
-            'title': json_response['title'],
-            'cover_url': json_response['album']['image']['large'],
-            'track_number': json_response['track_number'],
-            'cd_count': json_response['album']['media_count'],
-            'cd_number': json_response['media_number'],
-            'duration': json_response['duration'],
-            'released_at': time.gmtime(json_response['album']['released_at'])
+            'track_id': track['id'],
+            'album_id': album['id'],
+            'album_artist': album['artist']['name'],
+            'artist': track.get('performer', track.get('composer'))['name'],
+            'album' :album['title'],
+            'genre': album['genre']['name'],
+            'title': track['title'],
+            'cover_url': album['image']['large'],
+            'track_number': track['track_number'],
+            'cd_count': album['media_count'],
+            'cd_number': track['media_number'],
+            'duration': track['duration'],
+            'released_at': time.gmtime(album['released_at'])
         }
         return meta_data
 
+    @staticmethod
+    def has_track_meta_data(track, album=None):
+        album = album or track.get('album') or {}
+        track_keys = ('id', 'title', 'track_number', 'media_number', 'duration')
+        album_keys = ('id', 'artist', 'title', 'genre', 'image', 'media_count', 'released_at')
+        return all(key in track for key in track_keys) and ('performer' in track or 'composer' in track) and all(key in album for key in album_keys)
+
+    def get_cached_track_meta_data(self, track_id, album_id=None):
+        # only what's in the metadata cache already, without any api call
+        if not self.meta_data_cache:
+            return None
+        track = self.meta_data_cache.get('track', track_id)
+        if track and self.has_track_meta_data(track):
+            return self.parse_track_meta_data(track)
+        album = album_id and self.meta_data_cache.get('album', album_id)
+        if album:
+            for track in album.get('tracks', {}).get('items', []):
+                if str(track['id']) == str(track_id) and self.has_track_meta_data(track, album):
+                    return self.parse_track_meta_data(track, album)
+        return None
+
+    def resolve_track_meta_data(self, tracks):
+        # build the meta data from track lists, albums which aren't embedded are fetched once for all their tracks
+        track_meta_data = {}
+        tracks_by_album_id = {}
+        for track in tracks:
+            if self.has_track_meta_data(track):
+                track_meta_data[track['id']] = self.parse_track_meta_data(track)
+            elif track.get('album', {}).get('id'):
+                tracks_by_album_id.setdefault(track['album']['id'], []).append(track)
+        for album_id, album_tracks in tracks_by_album_id.items():
+            album_meta_data = self.get_meta_data_for_album_id(album_id)
+            album_track_items = {item['id']: item for item in album_meta_data.get('tracks', {}).get('items', [])}
+            for track in album_tracks:
+                track = album_track_items.get(track['id'], track)
+                if self.has_track_meta_data(track, album_meta_data):
+                    track_meta_data[track['id']] = self.parse_track_meta_data(track, album_meta_data)
+        return track_meta_data
+
     def cache_opener(self, path, flags):
-        if not self.cache_dir_fd:
-            self.cache_dir_fd = os.open(self.cache_dir, os.O_RDONLY, 0o600)
+        with self.lock:
+            if not self.cache_dir_fd:
+                self.cache_dir_fd = os.open(self.cache_dir, os.O_RDONLY, 0o600)
         return os.open(path, flags, 0o660, dir_fd=self.cache_dir_fd)
 
+    def get_temp_file_path(self, file_path):
+        return "{}.qtmp".format(file_path[:-5])
+
     def cache_file(self, file_url, file_path, is_cover = False):
-        temp_file_path = "{}.qtmp".format(file_path[:-5])
-        headers = {
+        temp_file_path = self.get_temp_file_path(file_path)
+        if not self.download_file(file_url, temp_file_path, is_cover):
+            return False
+        self.move_into_cache(temp_file_path, file_path)
+        return True
+
+    def move_into_cache(self, temp_file_path, file_path):
+        absolute_file_path = self.get_cache_file_path(file_path)
+        shutil.move(self.get_cache_file_path(temp_file_path), absolute_file_path)
+        if self.fsync_policy == 'file':
+            # the rename itself is only durable once the directory is synced
+            self.sync_directory(os.path.dirname(absolute_file_path))
+        elif self.fsync_policy == 'batch':
+            with self.lock:
+                self.unsynced_file_paths.append(absolute_file_path)
+                unsynced_file_paths = None
+                if len(self.unsynced_file_paths) >= self.fsync_batch_size:
+                    unsynced_file_paths = self.unsynced_file_paths
+                    self.unsynced_file_paths = []
+            if unsynced_file_paths:
+                self.sync_paths(unsynced_file_paths)
+
+    def sync_file(self, fd):
+        if self.fsync_policy == 'file':
+            os.fsync(fd)
+
+    @staticmethod
+    def sync_directory(directory_path):
+        directory_fd = os.open(directory_path or '.', os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def sync_paths(self, file_paths):
+        # only the batch and the folders it was renamed into, os.sync would flush every file system
+        for file_path in file_paths:
+            try:
+                fd = os.open(file_path, os.O_RDONLY)
+            except FileNotFoundError:
+                # evicted or pruned meanwhile
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for directory_path in {os.path.dirname(file_path) for file_path in file_paths}:
+            if os.path.isdir(directory_path or '.'):
+                self.sync_directory(directory_path)
+
+    def download_cover(self, cover_url, temp_file_path):
+        # the cover cache works with paths including cache_dir, downloads are opened relative to it
+        return self.download_file(cover_url, os.path.relpath(temp_file_path, self.cache_dir), is_cover=True)
+
+    def get_stream_headers(self, start=0, end=None):
+        return {
             'Host': 'streaming2.qobuz.com',
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:65.0) Gecko/20100101 Firefox/65.0',
             'Accept': 'audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5',
             'Accept-Language': 'en-US,en;q=0.5',
             'Referer': 'https://play.qobuz.com/album/0774204873820',
-            'Range': 'bytes=0-',
+            'Range': 'bytes={}-{}'.format(start, '' if end is None else end),
             'DNT': '1',
-            'Connection': 'keep-alive',
             'TE': 'Trailers'
         }
+
+    def download_file(self, file_url, temp_file_path, is_cover=False, started=None):
+        if not is_cover and not started and self.download_segments > 1:
+            cached = self.download_file_segmented(file_url, temp_file_path)
+            if cached is not None:
+                return cached
+        for attempt in range(self.retries + 1):
+            try:
+                return self.download_file_from_offset(file_url, temp_file_path, is_cover, started, resumed=attempt > 0)
+            except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                if attempt == self.retries:
+                    raise
+                print("Download of {} interrupted ({}), resuming".format(temp_file_path, e))
+                time.sleep(self.backoff_factor * 2 ** attempt)
+
+    def download_file_from_offset(self, file_url, temp_file_path, is_cover=False, started=None, resumed=False):
+        # continue a partial temp file left behind by an earlier attempt
+        absolute_temp_file_path = self.get_cache_file_path(temp_file_path)
+        offset = 0
+        if not is_cover and os.path.isfile(absolute_temp_file_path) and not os.path.isfile(self.get_parts_file_path(absolute_temp_file_path)):
+            offset = os.path.getsize(absolute_temp_file_path)
+        headers = None if is_cover else self.get_stream_headers(offset)
+        with self.instrumentation.timed('download', endpoint='cover' if is_cover else 'file', path=temp_file_path, offset=offset) as event, \
+                self.host_slot(file_url), self.session.get(file_url, headers=headers, stream=True, timeout=self.timeout) as response:
+            event['status'] = response.status_code
+            # an attempt resuming an interrupted one counts as retry
+            event['retries'] = int(resumed) + self.get_retry_count(response)
+            if response.status_code == 416 and offset:
+                if self.get_content_range_size(response) == offset:
+                    if started:
+                        started.set()
+                    return True
+                os.unlink(absolute_temp_file_path)
+                return self.download_file_from_offset(file_url, temp_file_path, is_cover, started)
+            if not response.ok:
+                print("{} ({}): {}".format(response.reason, response.status_code, file_url))
+                return False
+            if response.status_code != 206:
+                # the range was ignored, start over
+                offset = 0
+            with open(temp_file_path, 'r+b' if offset else 'wb', buffering=0, opener=self.cache_opener) as out_file:
+                out_file.seek(offset)
+                if started:
+                    started.set()
+                # the player follows the growing temp file, small reads get the first bytes to it sooner
+                buffer_size = self.stream_chunk_size if started else self.download_buffer_size
+                preallocated = not is_cover and not started and self.preallocate(out_file, absolute_temp_file_path, offset, response)
+                try:
+                    event['bytes'] = self.copy_response(response, out_file, event['endpoint'], buffer_size)
+                finally:
+                    if preallocated:
+                        # cut off what wasn't written, the size tells where to resume again
+                        out_file.truncate(out_file.tell())
+                        os.unlink(self.get_parts_file_path(absolute_temp_file_path))
+                self.sync_file(out_file.fileno())
+        return True
+
+    def preallocate(self, out_file, absolute_temp_file_path, offset, response):
+        # reserve the rest of the file in one go to avoid fragmentation, until the download is complete
+        # a .parts file marks the padded temp file, so after a crash it isn't mistaken for a partial download
+        length = int(response.headers.get('Content-Length') or 0)
+        if not hasattr(os, 'posix_fallocate') or length < self.download_buffer_size:
+            return False
+        parts_file_path = self.get_parts_file_path(absolute_temp_file_path)
+        parts = {
+            'size': offset + length,
+            'segments': [[offset, offset + length - 1]],
+            'done': []
+        }
+        with open(parts_file_path, 'w') as parts_file:
+            json.dump(parts, parts_file)
         try:
-            if is_cover:
-                req = urllib.request.Request(file_url)
-            else:
-                req = urllib.request.Request(file_url, headers=headers)
-            response = urllib.request.urlopen(req)
-        except urllib.error.HTTPError as e:
-            print("{} ({}): {}".format(e.reason, e.code, file_url))
-            return
-        with open(temp_file_path, 'wb', opener=self.cache_opener) as out_file:
-            shutil.copyfileobj(response, out_file)
-        shutil.move(self.get_cache_file_path(temp_file_path), self.get_cache_file_path(file_path))
+            os.posix_fallocate(out_file.fileno(), offset, length)
+        except OSError:
+            # not supported by every file system
+            os.unlink(parts_file_path)
+            return False
+        return True
 
-    def play_track(self, track_id, with_cover=True, cache_only=False, skip_existing=False):
-        self.set_track_id(track_id)
+    @staticmethod
+    def allocate(fd, size):
+        # reserve the whole file in one go, truncating alone leaves a sparse file the segments fragment
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                # not supported by every file system
+                pass
+        os.ftruncate(fd, size)
+
+    def copy_response(self, response, out_file, endpoint='file', buffer_size=None):
+        # read straight into one reused buffer instead of allocating a chunk per read
+        buffer = memoryview(bytearray(buffer_size or self.download_buffer_size))
+        size = 0
+        while True:
+            started_at = time.perf_counter()
+            chunk_size = response.raw.readinto(buffer)
+            if not chunk_size:
+                return size
+            written = 0
+            while written < chunk_size:
+                written += out_file.write(buffer[written:chunk_size])
+            size += chunk_size
+            self.instrumentation.emit('download_chunk', endpoint=endpoint, bytes=chunk_size, duration=time.perf_counter() - started_at)
+
+    @staticmethod
+    def get_content_range_size(response):
+        content_range = response.headers.get('Content-Range', '')
+        size = content_range.rpartition('/')[2]
+        return int(size) if size.isdigit() else None
+
+    @staticmethod
+    def get_parts_file_path(absolute_temp_file_path):
+        return '{}.parts'.format(absolute_temp_file_path)
+
+    def get_remote_file_size(self, file_url):
+        with self.host_slot(file_url), self.session.get(file_url, headers=self.get_stream_headers(0, 0), stream=True, timeout=self.timeout) as response:
+            if response.status_code != 206:
+                return None
+            return self.get_content_range_size(response)
+
+    def write_parts(self, parts_file_path, parts):
+        # replaced in one go, a half written .parts file couldn't be resumed from
+        temp_parts_file_path = '{}.qtmp'.format(parts_file_path)
+        with open(temp_parts_file_path, 'w') as parts_file:
+            json.dump(parts, parts_file)
+            parts_file.flush()
+            self.sync_file(parts_file.fileno())
+        os.replace(temp_parts_file_path, parts_file_path)
+
+    def download_file_segmented(self, file_url, temp_file_path):
+        # fetch large files over several connections, the finished segments are recorded
+        # in a .parts file next to the preallocated temp file so an interrupted download can resume
+        absolute_temp_file_path = self.get_cache_file_path(temp_file_path)
+        parts_file_path = self.get_parts_file_path(absolute_temp_file_path)
+        if os.path.isfile(parts_file_path) and os.path.isfile(absolute_temp_file_path):
+            with open(parts_file_path) as parts_file:
+                parts = json.load(parts_file)
+        elif os.path.isfile(absolute_temp_file_path):
+            return None
+        else:
+            file_size = self.get_remote_file_size(file_url)
+            if not file_size or file_size < self.segment_min_size:
+                return None
+            segment_size = -(-file_size // self.download_segments)
+            parts = {
+                'size': file_size,
+                'segments': [[start, min(start + segment_size, file_size) - 1] for start in range(0, file_size, segment_size)],
+                'done': []
+            }
+            # the .parts file comes first, a full size temp file without it would pass for a finished download
+            self.write_parts(parts_file_path, parts)
+            with open(temp_file_path, 'wb', opener=self.cache_opener) as out_file:
+                self.allocate(out_file.fileno(), file_size)
+
+        parts_lock = threading.Lock()
+        fd = self.cache_opener(temp_file_path, os.O_WRONLY)
+        segment_retries = []
+
+        def download_segment(index):
+            start, end = parts['segments'][index]
+            position = start
+            buffer = memoryview(bytearray(self.download_buffer_size))
+            for attempt in range(self.retries + 1):
+                try:
+                    with self.host_slot(file_url), self.session.get(file_url, headers=self.get_stream_headers(position, end), stream=True, timeout=self.timeout) as response:
+                        retries = self.get_retry_count(response)
+                        if retries:
+                            segment_retries.append(retries)
+                        if response.status_code != 206:
+                            raise QobuzFileError("Segment {}-{} of {} not available ({})".format(position, end, file_url, response.status_code))
+                        while True:
+                            chunk_started_at = time.perf_counter()
+                            chunk_size = response.raw.readinto(buffer)
+                            if not chunk_size:
+                                break
+                            written = 0
+                            while written < chunk_size:
+                                written += os.pwrite(fd, buffer[written:chunk_size], position + written)
+                            position += chunk_size
+                            self.instrumentation.emit('download_chunk', endpoint='segment', bytes=chunk_size, duration=time.perf_counter() - chunk_started_at)
+                    break
+                except (requests.RequestException, urllib3.exceptions.HTTPError):
+                    if attempt == self.retries:
+                        raise
+                    segment_retries.append(1)
+                    time.sleep(self.backoff_factor * 2 ** attempt)
+            # a segment only counts as done once it's on disk, a resumed download would skip it otherwise
+            self.sync_file(fd)
+            with parts_lock:
+                parts['done'].append(index)
+                self.write_parts(parts_file_path, parts)
+
+        pending_segments = [index for index in range(len(parts['segments'])) if index not in parts['done']]
+        with self.instrumentation.timed('download', endpoint='segments', path=temp_file_path, segments=len(pending_segments)) as event:
+            try:
+                with ThreadPoolExecutor(max_workers=self.download_segments) as segment_executor:
+                    for future in [segment_executor.submit(download_segment, index) for index in pending_segments]:
+                        future.result()
+            finally:
+                os.close(fd)
+                event['retries'] = sum(segment_retries)
+            event['bytes'] = sum(end - start + 1 for index, (start, end) in enumerate(parts['segments']) if index in pending_segments)
+        os.unlink(parts_file_path)
+        return True
+
+    def stream_file(self, file_url, file_path, on_cached=None, data=None):
+        # play from the first downloaded bytes, the player reads the growing temp file through a fifo
+        temp_file_path = self.get_temp_file_path(file_path)
+        started = threading.Event()
+        download_result = {'cached': False}
+
+        def download():
+            try:
+                download_result['cached'] = self.download_file(file_url, temp_file_path, started=started)
+            finally:
+                started.set()
 
-        track_meta_data = self.get_meta_data()
+        download_thread = threading.Thread(target=download, daemon=True)
+        download_thread.start()
+        started.wait()
+        absolute_temp_file_path = self.get_cache_file_path(temp_file_path)
+        if not os.path.isfile(absolute_temp_file_path):
+            download_thread.join()
+            return False
+
+        fifo_dir = tempfile.mkdtemp(prefix='qobuz')
+        fifo_path = os.path.join(fifo_dir, os.path.basename(file_path))
+        os.mkfifo(fifo_path, 0o600)
+        try:
+            entry = self.get_player().enqueue(fifo_path, data)
+            self.feed_fifo(fifo_path, entry, absolute_temp_file_path, download_thread)
+        finally:
+            os.unlink(fifo_path)
+            os.rmdir(fifo_dir)
+        download_thread.join()
+        if download_result['cached']:
+            self.move_into_cache(temp_file_path, file_path)
+            # the player only reads from the fifo, so the file can be tagged while it's still playing
+            if on_cached:
+                on_cached()
+        self.player.wait(self.player_lookahead)
+        return download_result['cached']
+
+    def feed_fifo(self, fifo_path, entry, absolute_temp_file_path, download_thread):
+        # the player opens the fifo once the tracks before it are over
+        while True:
+            try:
+                fifo_fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError:
+                if entry.done.is_set():
+                    return
+                time.sleep(0.05)
+        os.set_blocking(fifo_fd, True)
+        with open(fifo_fd, 'wb') as out_file, open(absolute_temp_file_path, 'rb') as in_file:
+            while True:
+                download_finished = not download_thread.is_alive()
+                chunk = in_file.read(self.stream_chunk_size)
+                if chunk:
+                    try:
+                        out_file.write(chunk)
+                    except BrokenPipeError:
+                        # player quit early, keep caching
+                        return
+                elif download_finished:
+                    break
+                else:
+                    time.sleep(0.05)
+            try:
+                out_file.flush()
+            except BrokenPipeError:
+                pass
+
+    def get_indexed_track(self, track_id):
+        if not self.library_index:
+            return None
+        indexed_track = self.library_index.get_track(track_id, self.format_id)
+        if not indexed_track:
+            return None
+        # a stat is enough to notice files which were removed or replaced behind our back
+        try:
+            size = os.path.getsize(self.get_cache_file_path(indexed_track['path']))
+        except OSError:
+            size = None
+        if size != indexed_track['size']:
+            self.library_index.remove_track(track_id, self.format_id)
+            return None
+        return indexed_track
+
+    def index_track(self, track_meta_data, file_path):
+        if self.library_index:
+            absolute_file_path = self.get_cache_file_path(file_path)
+            size = os.path.getsize(absolute_file_path)
+            checksum = library_index.get_file_checksum(absolute_file_path)
+            self.library_index.add_track(track_meta_data['track_id'], self.format_id, track_meta_data['album_id'], file_path, size, checksum)
+
+    def is_track_unavailable(self, track_id):
+        # recorded when qobuz had no file for it, trying again won't help for a while
+        return bool(self.library_index) and self.library_index.is_track_missing(track_id, self.format_id)
+
+    def is_album_cached(self, album_id):
+        return bool(self.library_index) and self.library_index.is_album_complete(album_id, self.format_id)
+
+    def rebuild_library_index(self, checksums=False, match=False):
+        indexed_count, unknown_files = self.library_index.rebuild(self.cache_dir, checksums=checksums)
+        if match and unknown_files:
+            matched_count, unknown_files = self.match_library_files(unknown_files)
+            indexed_count += matched_count
+        return indexed_count, unknown_files
+
+    def match_library_files(self, paths):
+        # files cached before they got their id tags, looked up by the album in their tags and tagged again
+        import taglib
+        extension = '.flac' if self.format_id > 5 else '.mp3'
+        album_files = {}
+        unmatched_paths = []
+        for path in paths:
+            try:
+                tags = taglib.File(self.get_cache_file_path(path)).tags
+            except OSError:
+                tags = {}
+            album_key = (tags.get('ALBUMARTIST', [''])[0], tags.get('ALBUM', [''])[0])
+            if not path.lower().endswith(extension) or not all(album_key):
+                unmatched_paths.append(path)
+                continue
+            album_files.setdefault(album_key, []).append((path, tags))
+        matched_count = 0
+        for (album_artist, album_title), files in album_files.items():
+            album_meta_data = self.find_album(album_artist, album_title)
+            track_items = album_meta_data['tracks']['items'] if album_meta_data else []
+            tracks = {(str(track['media_number']), str(track['track_number'])): track for track in track_items}
+            for path, tags in files:
+                track = tracks.get((tags.get('DISCNUMBER', ['1'])[0], tags.get('TRACKNUMBER', [''])[0]))
+                if not track or not self.has_track_meta_data(track, album_meta_data) or artist_graph.normalize_name(track['title']) != artist_graph.normalize_name(tags.get('TITLE', [''])[0]):
+                    unmatched_paths.append(path)
+                    continue
+                meta_data = self.parse_track_meta_data(track, album_meta_data)
+                self.tag_file(path, meta_data)
+                self.index_track(meta_data, path)
+                matched_count += 1
+        return matched_count, unmatched_paths
+
+    def find_album(self, album_artist, album_title):
+        artist_name = artist_graph.normalize_name(album_artist)
+        title = artist_graph.normalize_name(album_title)
+        for album in self.search_catalog_for_albums('{} {}'.format(album_artist, album_title), limit=10):
+            if artist_graph.normalize_name(album['title']) == title and artist_graph.normalize_name(album['artist']['name']) == artist_name:
+                return self.get_meta_data_for_album_id(album['id'])
+        return None
+
+    def play_track(self, track_id, with_cover=True, cache_only=False, skip_existing=False, track_meta_data=None):
+        # cached tracks are served from the index without any api call
+        indexed_track = self.get_indexed_track(track_id)
+        if indexed_track:
+            print("{} already exists".format(indexed_track['path']))
+            if not cache_only and not skip_existing:
+                print("Playing \"{}\"".format(indexed_track['path']))
+                self.record_play(track_id)
+                self.play_file(indexed_track['path'], data=track_id)
+            return True
+
+        if not track_meta_data:
+            track_meta_data = self.get_meta_data(track_id)
         artist = self.get_save_folder_name(track_meta_data['album_artist'])
         album = self.get_save_folder_name(track_meta_data['album'])
         album_path = os.path.join(artist, album)
@@ -187,17 +889,21 @@ class QobuzApi:
         file_path = os.path.join(album_path, self.get_save_file_name(file_name))
 
         track_exists = False
+        track_played = False
         if os.path.isfile(self.get_cache_file_path(file_path)):
             track_exists = True
             print("{title} already exists".format_map(params))
+            self.index_track(track_meta_data, file_path)
         else:
             missing_file_path = '{}.missing'.format(file_path)
             try:
-                file_url = self.get_file_url()
+                file_url = self.get_file_url(track_id)
             except QobuzFileError as e:
                 print(e)
                 with open(missing_file_path, 'w', opener=self.cache_opener):
                     pass
+                if self.library_index:
+                    self.library_index.add_missing_track(track_id, self.format_id, track_meta_data['album_id'])
                 return False
             else:
                 absolute_file_path = self.get_cache_file_path(missing_file_path)
@@ -205,42 +911,116 @@ class QobuzApi:
                 if os.path.isfile(absolute_file_path):
                     os.unlink(absolute_file_path)
             print("Caching {title}...".format_map(params))
-            self.cache_file(file_url, file_path)
-            self.tag_file(file_path, track_meta_data)
+            if self.progressive and not cache_only:
+                print("Playing \"{title}\" for {duration}s".format_map(params))
+                track_played = True
+                if not self.stream_file(file_url, file_path, on_cached=lambda: self.finalize_track(track_meta_data, file_path), data=track_id):
+                    self.file_url_cache.invalidate(track_id, self.format_id)
+                    return False
+                self.record_play(track_id)
+            else:
+                if not self.cache_file(file_url, file_path):
+                    self.file_url_cache.invalidate(track_id, self.format_id)
+                    return False
+                self.finalize_track(track_meta_data, file_path)
 
         if with_cover:
-            cover_url = track_meta_data['cover_url']
             cover_path = os.path.join(album_path, 'folder.jpg')
+            self.cover_cache.get(track_meta_data['cover_url'], self.get_cache_file_path(cover_path))
 
-            if not os.path.isfile(cover_path):
-                self.cache_file(cover_url, cover_path, is_cover = True)
-
-        if not cache_only and not (skip_existing and track_exists):
+        if not cache_only and not track_played and not (skip_existing and track_exists):
             print("Playing \"{title}\" for {duration}s".format_map(params))
-            #time.sleep(int(track_meta_data['duration']))
-            absolute_file_path = self.get_cache_file_path(file_path)
-            subprocess.call(["mplayer", "-msgcolor", "-nolirc", "-msglevel", "cplayer=-1:codeccfg=-1:decaudio=-1:decvideo=-1:demux=-1:demuxer=-1:subreader=-1", absolute_file_path])
+            self.record_play(track_id)
+            self.play_file(file_path, data=track_id)
         return True
 
+    def finalize_track(self, track_meta_data, file_path):
+        self.tag_file(file_path, track_meta_data)
+        self.index_track(track_meta_data, file_path)
+        if self.cache_manager:
+            self.cache_manager.enforce()
+
+    def record_play(self, track_id):
+        # the play history decides what is evicted first
+        if self.library_index:
+            self.library_index.record_play(track_id, self.format_id)
+
+    def remove_cached_track(self, track, remove_folder=True):
+        self.library_index.remove_track(track['track_id'], track['format_id'])
+        if not track['path']:
+            return
+        absolute_path = self.get_cache_file_path(track['path'])
+        print("Removing {}".format(track['path']))
+        try:
+            os.unlink(absolute_path)
+        except FileNotFoundError:
+            pass
+        # drop the album folder once only its cover is left
+        album_path = os.path.dirname(absolute_path)
+        if remove_folder and os.path.isdir(album_path) and os.listdir(album_path) == ['folder.jpg']:
+            os.unlink(os.path.join(album_path, 'folder.jpg'))
+            os.rmdir(album_path)
+
+    def play_file(self, file_path, data=None):
+        player = self.get_player()
+        player.enqueue(self.get_cache_file_path(file_path), data)
+        player.wait(self.player_lookahead)
+
+    def get_player(self):
+        # started on first use, cache_only runs never need it
+        with self.lock:
+            if not self.player:
+                with self.instrumentation.timed('player_launch', endpoint=MPlayer.command[0]):
+                    self.player = MPlayer()
+            return self.player
+
+    def wait_for_player(self):
+        if self.player:
+            self.player.wait()
+
+    def skip(self):
+        # stops the current track, the player goes on with the next one
+        return bool(self.player) and self.player.skip()
+
+    def stop(self):
+        # stops playing and forgets everything queued in the player
+        return bool(self.player) and self.player.stop()
+
     def get_cache_file_path(self, file_path):
         return os.path.join(self.cache_dir, file_path)
 
     def tag_file(self, file_path, meta_data):
+        with self.instrumentation.timed('tag_write', track_id=meta_data['track_id']):
+            self.write_tags(file_path, meta_data)
+
+    def write_tags(self, file_path, meta_data):
+        # loaded on first use, starting up doesn't need it
+        import taglib
         song = taglib.File(self.get_cache_file_path(file_path))
-        song.tags['TITLE'] = meta_data['title']
-        song.tags["ALBUM"] = meta_data['album']
-        song.tags['ALBUMARTIST'] = meta_data['album_artist']
-        song.tags["ARTIST"] = meta_data['artist']
-        song.tags["GENRE"] = meta_data['genre']
-        song.tags["DATE"] = str(meta_data['released_at'].tm_year)
-        song.tags['DISCNUMBER'] = str(meta_data['cd_number'])
-        song.tags['TOTALDISCS'] = str(meta_data['cd_count'])
-        song.tags['TRACKNUMBER'] = str(meta_data['track_number'])
+        for tag, value in self.get_tags(meta_data, self.format_id).items():
+            song.tags[tag] = value
         song.save()
 
+    @staticmethod
+    def get_tags(meta_data, format_id):
+        return {
+            'TITLE': meta_data['title'],
+            'ALBUM': meta_data['album'],
+            'ALBUMARTIST': meta_data['album_artist'],
+            'ARTIST': meta_data['artist'],
+            'GENRE': meta_data['genre'],
+            'DATE': str(meta_data['released_at'].tm_year),
+            'DISCNUMBER': str(meta_data['cd_number']),
+            'TOTALDISCS': str(meta_data['cd_count']),
+            'TRACKNUMBER': str(meta_data['track_number']),
+            library_index.TRACK_ID_TAG: str(meta_data['track_id']),
+            library_index.ALBUM_ID_TAG: str(meta_data['album_id']),
+            library_index.FORMAT_ID_TAG: str(format_id)
+        }
+
     def get_meta_data_for_album_id(self, album_id):
-        album_url = "http://www.qobuz.com/api.json/0.2/album/get?album_id={}".format(album_id)
-        json_response = self.get_json_from_url(album_url)
+        album_url = self.get_api_url("album/get?album_id={}".format(album_id))
+        json_response = self.get_cached_json_from_url('album', album_id, album_url)
         return json_response
 
     def get_meta_data_for_artist_id(self, artist_id, extra='focus'):
@@ -249,32 +1029,85 @@ class QobuzApi:
             'extra': extra
         }
 
-        artist_url = "https://www.qobuz.com/api.json/0.2/artist/get?artist_id={artist_id}&limit=50&extra={extra}".format_map(params)
-        json_response = self.get_json_from_url(artist_url)
+        artist_url = self.get_api_url("artist/get?artist_id={artist_id}&limit=50&extra={extra}".format_map(params))
+        json_response = self.get_cached_json_from_url('artist', '{artist_id}:{extra}'.format_map(params), artist_url)
         return json_response
 
     def play_album(self, album_id, cache_only=False, skip_existing=False):
+        if (cache_only or skip_existing) and self.is_album_cached(album_id):
+            print("Skipping album {} - already cached".format(album_id))
+            return
         album_meta_data = self.get_meta_data_for_album_id(album_id)
         params = {
             'artist': album_meta_data['artist']['name'],
             'album': album_meta_data['title']
         }
         print("Getting tracks for \"{artist} - {album}\"".format_map(params))
-        success = True
-        for track in album_meta_data['tracks']['items']:
-            success &= self.play_track(track['id'], cache_only=cache_only, skip_existing=skip_existing)
+        track_items = album_meta_data['tracks']['items']
+        track_ids = [track['id'] for track in track_items]
+        # the album payload has everything needed for its tracks, no track/get per track
+        track_meta_data = {track['id']: self.parse_track_meta_data(track, album_meta_data) for track in track_items if self.has_track_meta_data(track, album_meta_data)}
+        if self.library_index:
+            self.library_index.set_album(album_id, len(track_ids))
+        if cache_only:
+            success = self.cache_tracks(track_ids, skip_existing=skip_existing, track_meta_data=track_meta_data)
+        else:
+            success = self.play_tracks(track_ids, skip_existing=skip_existing, track_meta_data=track_meta_data)
         if not success:
             raise QobuzIncompleteAlbumError(album_meta_data)
 
-    def play_artist(self, artist_id, cache_only=False, track_limit=None):
+    def play_tracks(self, track_ids, skip_existing=False, track_limit=None, upcoming_track_ids=(), track_meta_data=None):
+        # the next tracks are cached while the current one plays, so transitions only hit the disk
+        track_ids = list(track_ids)
+        track_meta_data = track_meta_data or {}
+        success = True
+        played_track_count = 0
+        for position, track_id in enumerate(track_ids):
+            next_track_ids = track_ids[position + 1:]
+            if track_limit:
+                next_track_ids = next_track_ids[:track_limit - played_track_count - 1]
+            self.prefetcher.prefetch(next_track_ids + list(upcoming_track_ids), track_meta_data)
+            self.prefetcher.wait(track_id)
+            if self.play_track(track_id, skip_existing=skip_existing, track_meta_data=track_meta_data.get(track_id)):
+                played_track_count += 1
+            else:
+                success = False
+            if track_limit and played_track_count >= track_limit:
+                break
+        self.prefetcher.retain(upcoming_track_ids)
+        if not upcoming_track_ids:
+            self.wait_for_player()
+        return success
+
+    def cache_tracks(self, track_ids, skip_existing=False, track_meta_data=None):
+        return not self.try_cache_tracks(track_ids, skip_existing=skip_existing, track_meta_data=track_meta_data)
+
+    def try_cache_tracks(self, track_ids, skip_existing=False, track_meta_data=None):
+        # returns the ids of the tracks which couldn't be cached
+        # track_meta_data may still be filled while track_ids is consumed
+        track_meta_data = {} if track_meta_data is None else track_meta_data
+        executor = self.get_executor()
+        futures = [(track_id, executor.submit(self.call_with_priority, Priority.BULK, self.play_track, track_id, cache_only=True, skip_existing=skip_existing, track_meta_data=track_meta_data.get(track_id))) for track_id in track_ids]
+        return [track_id for track_id, future in futures if not future.result()]
+
+    def get_artist_tracks(self, artist_id):
         artist_meta_data = self.get_meta_data_for_artist_id(artist_id, extra='tracks')
         params = {
             'artist': artist_meta_data['name']
         }
         print("Getting tracks for \"{artist}\"".format_map(params))
+        return artist_meta_data['tracks']['items']
+
+    def play_artist(self, artist_id, cache_only=False, track_limit=None, upcoming_track_ids=()):
+        tracks = self.get_artist_tracks(artist_id)
+        track_ids = [track['id'] for track in tracks]
+        track_meta_data = self.resolve_track_meta_data(tracks)
+        if not cache_only:
+            self.play_tracks(track_ids, track_limit=track_limit, upcoming_track_ids=upcoming_track_ids, track_meta_data=track_meta_data)
+            return
         played_track_count = 0
-        for track in artist_meta_data['tracks']['items']:
-            if self.play_track(track['id'], cache_only=cache_only):
+        for track_id in track_ids:
+            if self.play_track(track_id, cache_only=cache_only, track_meta_data=track_meta_data.get(track_id)):
                 played_track_count += 1
             if track_limit and played_track_count >= track_limit:
                 return
@@ -288,7 +1121,7 @@ class QobuzApi:
             if album['tracks_count'] < minimum_track_count:
                 print('Skipping {} ({} tracks) - below track count'.format(album['title'], album['tracks_count']))
                 continue
-            skip_album = False
+            skip_album = (cache_only or skip_existing) and self.is_album_cached(album['id'])
             if skip_album:
                 print('Skipping {} ({} tracks) - already cached'.format(album['title'], album['tracks_count']))
                 continue
@@ -317,24 +1150,118 @@ class QobuzApi:
             if album_meta_data:
                 yield album_meta_data
 
-    def get_album(self, album, minimum_track_count=4):
+    @staticmethod
+    def get_album(album, minimum_track_count=4):
         if album.get('tracks_count', 0) >= minimum_track_count:
             released_at = time.gmtime(album['released_at'])
             release_date = f'{released_at.tm_year}-{released_at.tm_mon:02}-{released_at.tm_mday:02}'
             album_url = QobuzApi.album_web_url.format_map(album)
             return {'id': album['id'], 'title': album['title'], 'tracks_count': album['tracks_count'], 'released_at': released_at, 'release_date': release_date, 'url': album_url}
 
-    def play_similar_artists(self, artist_id, artist_limit=3, track_limit=1, cache_only=False):
+    def get_similar_artists(self, artist_id, limit=10):
         params = {
             'artist_id': artist_id,
-            'limit': artist_limit
+            'limit': limit
         }
-        similar_artist_url = 'https://www.qobuz.com/api.json/0.2/artist/getSimilarArtists?artist_id={artist_id}&limit={limit}'.format_map(params)
+        similar_artist_url = self.get_api_url('artist/getSimilarArtists?artist_id={artist_id}&limit={limit}'.format_map(params))
         similar_artists = self.get_json_from_url(similar_artist_url)
-        for artist in similar_artists['artists']['items']:
-            self.play_artist(artist['id'], track_limit=track_limit, cache_only=cache_only)
+        return similar_artists['artists']['items']
+
+    def refresh_artist_graph(self, artist_ids, depth=1, similar_limit=10, max_age=30 * artist_graph.DAY, lastfm=None):
+        # breadth first from the given artists, only edges older than max_age are fetched again
+        artist_ids = [str(artist_id) for artist_id in artist_ids]
+        seen_artist_ids = set(artist_ids)
+        for level in range(depth + 1):
+            next_artist_ids = []
+            for artist_id in artist_ids:
+                if self.artist_graph.is_stale(artist_id, ArtistGraph.QOBUZ, max_age):
+                    similar_artists = self.get_similar_artists(artist_id, similar_limit)
+                    for artist in similar_artists:
+                        self.artist_graph.add_artist(artist['id'], artist['name'])
+                    # qobuz only ranks them, the first one weighs most
+                    self.artist_graph.set_edges(artist_id, ArtistGraph.QOBUZ, [(artist['id'], 1 - rank / len(similar_artists)) for rank, artist in enumerate(similar_artists)])
+                if lastfm and self.artist_graph.is_stale(artist_id, ArtistGraph.LASTFM, max_age):
+                    self.refresh_lastfm_edges(artist_id, lastfm, similar_limit, max_age)
+                if level < depth:
+                    for similar_artist_id in self.artist_graph.get_similar(artist_id):
+                        if similar_artist_id not in seen_artist_ids:
+                            seen_artist_ids.add(similar_artist_id)
+                            next_artist_ids.append(similar_artist_id)
+            artist_ids = next_artist_ids
+
+    def refresh_lastfm_edges(self, artist_id, lastfm, limit=10, max_age=30 * artist_graph.DAY):
+        # lastfm is a pylast network, its similar artists are matched to the catalog by name
+        artist = self.artist_graph.get_artist(artist_id)
+        if not artist:
+            artist = self.get_meta_data_for_artist_id(artist_id)
+            self.artist_graph.add_artist(artist_id, artist['name'])
+        similar_artists = lastfm.get_artist(artist['name']).get_similar(limit=limit)
+        artist_ids = self.resolve_artists([similar_artist.item.name for similar_artist in similar_artists], max_age)
+        edges = [(artist_ids[similar_artist.item.name], float(similar_artist.match)) for similar_artist in similar_artists if artist_ids[similar_artist.item.name]]
+        self.artist_graph.set_edges(artist_id, ArtistGraph.LASTFM, edges)
+
+    def resolve_artist_name(self, name, max_age=30 * artist_graph.DAY):
+        if self.artist_graph:
+            known, artist_id = self.artist_graph.resolve_name(name, max_age)
+            if known:
+                return artist_id
+        artist = self.get_artist_by_name(name)
+        if self.artist_graph:
+            if artist:
+                self.artist_graph.add_artist(artist['id'], artist['name'])
+            # names without a match are remembered too
+            self.artist_graph.set_name(name, artist and artist['id'])
+        return artist and str(artist['id'])
+
+    def resolve_artists(self, names, max_age=30 * artist_graph.DAY):
+        # one search per distinct name, the ones which aren't known yet are looked up concurrently
+        names = list(names)
+        unique_names = {}
+        for name in names:
+            unique_names.setdefault(artist_graph.normalize_name(name), name)
+        artist_ids = {}
+        lookups = {}
+        priority = self.get_request_priority()
+        for normalized_name, name in unique_names.items():
+            if self.artist_graph:
+                known, artist_id = self.artist_graph.resolve_name(name, max_age)
+                if known:
+                    artist_ids[normalized_name] = artist_id
+                    continue
+            lookups[normalized_name] = self.get_lookup_executor().submit(self.call_with_priority, priority, self.resolve_artist_name, name, max_age)
+        for normalized_name, future in lookups.items():
+            artist_ids[normalized_name] = future.result()
+        return {name: artist_ids[artist_graph.normalize_name(name)] for name in names}
+
+    def play_similar_artists(self, artist_id, artist_limit=3, track_limit=1, cache_only=False):
+        if self.artist_graph:
+            self.refresh_artist_graph([artist_id], depth=0)
+            similar_artist_ids = self.artist_graph.get_similar(artist_id, artist_limit)
+        else:
+            similar_artist_ids = [artist['id'] for artist in self.get_similar_artists(artist_id, artist_limit)]
+        self.play_artists(similar_artist_ids, track_limit=track_limit, cache_only=cache_only)
+
+    def play_artist_radio(self, artist_id, artist_count=10, track_limit=1, cache_only=False, refresh_depth=1, lastfm=None):
+        # the walk itself only reads the local graph
+        self.refresh_artist_graph([artist_id], depth=refresh_depth, lastfm=lastfm)
+        artist_ids = self.artist_graph.random_walk(artist_id, artist_count)
+        self.play_artists(artist_ids, track_limit=track_limit, cache_only=cache_only)
 
-    def search_catalog(self, query, item_type=None, limit=2):
+    def play_artists(self, artist_ids, track_limit=1, cache_only=False):
+        if cache_only:
+            for artist_id in artist_ids:
+                self.play_artist(artist_id, track_limit=track_limit, cache_only=cache_only)
+            return
+        artist_tracks = [self.get_artist_tracks(artist_id) for artist_id in artist_ids]
+        artist_track_ids = [[track['id'] for track in tracks] for tracks in artist_tracks]
+        track_meta_data = self.resolve_track_meta_data(track for tracks in artist_tracks for track in tracks)
+        for position, track_ids in enumerate(artist_track_ids):
+            # look ahead into the following artists' first tracks
+            upcoming_track_ids = [track_id for next_track_ids in artist_track_ids[position + 1:] for track_id in next_track_ids[:track_limit]]
+            self.play_tracks(track_ids, track_limit=track_limit, upcoming_track_ids=upcoming_track_ids, track_meta_data=track_meta_data)
+
+    def search_catalog(self, query, item_type=None, limit=2, offset=0):
+        query = ' '.join(query.split())
         if item_type:
             params_type = "&type={}".format(item_type)
         else:
@@ -342,67 +1269,87 @@ class QobuzApi:
         if limit:
             params_limit = "&limit={}".format(limit)
         else:
-            params_type = ""
+            params_limit = ""
+        if offset:
+            params_offset = "&offset={}".format(offset)
+        else:
+            params_offset = ""
 
         params = {
-            'query': query,
+            'query': urllib.parse.quote(query),
             'type': params_type,
-            'limit': params_limit
+            'limit': params_limit,
+            'offset': params_offset,
+            'normalized_query': artist_graph.normalize_name(query)
         }
 
-        search_url = "https://www.qobuz.com/api.json/0.2/catalog/search?query={query}{type}{limit}".format_map(params)
-        json_response = self.get_json_from_url(search_url)
+        search_url = self.get_api_url("catalog/search?query={query}{type}{limit}{offset}".format_map(params))
+        # the search ignores case and spacing, so differently spelled queries share a cache entry
+        json_response = self.get_cached_json_from_url('search', '{type}{limit}{offset}&query={normalized_query}'.format_map(params), search_url)
         return json_response
 
-    def search_catalog_for_artists(self, artist, limit=5):
-        response = self.search_catalog(artist, 'artists', limit=limit)
+    def search_catalog_for_artists(self, artist, limit=5, offset=0):
+        response = self.search_catalog(artist, 'artists', limit=limit, offset=offset)
         return response['artists']['items']
 
-    def get_artist_by_name(self, artist):
-        artists = self.search_catalog_for_artists(artist, limit=5)
-        # sometimes another but the first result is a perfect match
-        for artist_item in artists:
-            if artist.lower() == artist_item['name'].lower():
-                return artist_item
+    def get_artist_by_name(self, artist, limit=10, max_results=50):
+        name = artist_graph.normalize_name(artist)
+        # sometimes another but the first result is a perfect match, or one on a later page
+        for offset in range(0, max_results, limit):
+            response = self.search_catalog(artist, 'artists', limit=limit, offset=offset)
+            artists = response['artists']
+            for artist_item in artists['items']:
+                if name == artist_graph.normalize_name(artist_item['name']):
+                    return artist_item
+            if len(artists['items']) < limit or offset + limit >= artists.get('total', max_results):
+                return None
 
     def search_catalog_for_albums(self, album, limit=2):
-        response = self.search_catalog(album, 'albums')
+        response = self.search_catalog(album, 'albums', limit=limit)
         return response['albums']['items']
 
-    def play_favorites(self, favorite_type=None, limit=2, offset=0, cache_only=False, skip_existing=False, confirm_album=False):
-        if favorite_type:
-            params_type = '&type={}'.format(favorite_type)
-        else:
-            params_type = ''
-        params = {
-            'params_type': params_type,
-            'limit': limit,
-            'offset': offset
-        }
+    def play_favorites(self, favorite_type=None, limit=50, offset=0, cache_only=False, skip_existing=False, confirm_album=False):
         play_params = {
             'cache_only': cache_only,
             'skip_existing': skip_existing
         }
-        while True:
-            favorites_url = 'https://www.qobuz.com/api.json/0.2/favorite/getUserFavorites?&limit={limit}{params_type}&offset={offset}'.format_map(params)
-            json_response = self.get_json_from_url(favorites_url)
+        if favorite_type == 'tracks':
+            play_method = self.play_track
+        elif favorite_type == 'albums':
+            play_method = self.play_album
+        elif favorite_type == 'artists':
+            play_method = self.play_artist_albums
+            play_params['confirm_album'] = confirm_album
+        else:
             # TODO: Handle all type
-            if not json_response[favorite_type]['items']:
-                break
-            for item in json_response[favorite_type]['items']:
-
-                if favorite_type == 'tracks':
-                    play_method = self.play_track
-                elif favorite_type == 'albums':
-                    play_method = self.play_album
-                elif favorite_type == 'artists':
-                    play_method = self.play_artist_albums
-                    play_params['confirm_album'] = True
-                else:
-                    print('Empty or unkown type "{}" for "{}"'.format(favorite_type, item['name']))
-                    break
-                play_method(item['id'], *play_params)
-                params['offset'] += 1
+            print('Empty or unkown type "{}"'.format(favorite_type))
+            return
+        favorites = self.get_favorites(FavoriteType(favorite_type), limit=limit, offset=offset)
+        if favorite_type == 'tracks':
+            track_meta_data = {}
+            favorites = self.resolve_favorite_tracks(favorites, track_meta_data)
+            if cache_only:
+                # tracks are submitted to the pool while paginating
+                if not self.cache_tracks((item['id'] for item in favorites), skip_existing=skip_existing, track_meta_data=track_meta_data):
+                    print('Some favorite tracks could not be cached')
+                return
+            for item in favorites:
+                play_method(item['id'], track_meta_data=track_meta_data.get(item['id']), **play_params)
+            return
+        for item in favorites:
+            play_method(item['id'], **play_params)
+
+    def resolve_favorite_tracks(self, favorites, track_meta_data):
+        # favorite track items embed their album, resolve them in batches while paginating
+        batch = []
+        for item in favorites:
+            batch.append(item)
+            if len(batch) >= self.workers:
+                track_meta_data.update(self.resolve_track_meta_data(batch))
+                yield from batch
+                batch = []
+        track_meta_data.update(self.resolve_track_meta_data(batch))
+        yield from batch
 
     def play_favorite_tracks(self, cache_only=False, skip_existing=False):
         self.play_favorites(favorite_type='tracks', cache_only=cache_only, skip_existing=skip_existing)
@@ -415,11 +1362,19 @@ class QobuzApi:
 
     def get_favorites(self, favorite_type: FavoriteType, limit: int = 10, offset: int = 0):
         while True:
-            favorites_url = f'https://www.qobuz.com/api.json/0.2/favorite/getUserFavorites?type={favorite_type.value}&limit={limit}&offset={offset}'
-            json_response = self.get_json_from_url(favorites_url)
-            if not json_response[favorite_type.value]['items']:
+            items, total = self.get_favorites_page(favorite_type, limit, offset)
+            if not items:
                 break
-            for favorite in json_response[favorite_type.value]['items']:
+            for favorite in items:
                 yield favorite
             offset += limit
+            # no need to ask for the empty page after the last one
+            if total is not None and offset >= total:
+                break
+
+    def get_favorites_page(self, favorite_type: FavoriteType, limit: int, offset: int):
+        favorites_url = self.get_api_url(f'favorite/getUserFavorites?type={favorite_type.value}&limit={limit}&offset={offset}')
+        json_response = self.get_json_from_url(favorites_url)
+        favorites = json_response[favorite_type.value]
+        return favorites['items'], favorites.get('total')
 
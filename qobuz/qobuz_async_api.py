@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+from qobuz.artist_graph import normalize_name
+from qobuz.instrumentation import Instrumentation
+from qobuz.metadata_cache import MetadataCache
+from qobuz.qobuz_api import FavoriteType, QobuzApi, QobuzApiError, QobuzFileError
+from qobuz.rate_limiter import Priority, RateLimiter
+
+class AsyncQobuzApi:
+    API_ENDPOINT = QobuzApi.API_ENDPOINT
+    RETRY_STATUS = (500, 502, 503, 504)
+
+    def __init__(self, app_id, app_secret, user_auth_token, format_id=6, cache_dir='.', pool_size=10, max_connections_per_host=4, retries=3, backoff_factor=0.5, timeout=30, meta_data_cache=True, meta_data_ttls=None, meta_data_cache_size=100000, rate_limits=None, api_endpoint=None, instrumentation=None):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.user_auth_token = user_auth_token
+        if api_endpoint:
+            self.API_ENDPOINT = api_endpoint
+        self.format_id = format_id
+        self.cache_dir = cache_dir
+        self.pool_size = pool_size
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_limits)
+        # pass QobuzApi's instrumentation to get the events of both clients into the same sinks
+        self.instrumentation = instrumentation or Instrumentation()
+        self.meta_data_cache = None
+        if meta_data_cache:
+            # same store as QobuzApi, both clients can share a cache_dir
+            meta_data_cache_path = os.path.join(cache_dir, '.qobuz_meta_data.sqlite')
+            self.meta_data_cache = MetadataCache(meta_data_cache_path, meta_data_ttls, meta_data_cache_size)
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def get_session(self):
+        # created lazily, the session is bound to the running event loop
+        if not self.session:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.max_connections_per_host)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        if self.meta_data_cache:
+            self.meta_data_cache.close()
+
+    async def acquire(self, endpoint, priority):
+        self.rate_limiter.set_waiting(endpoint, priority, 1)
+        try:
+            while True:
+                delay = self.rate_limiter.reserve(endpoint, priority)
+                if not delay:
+                    return
+                await asyncio.sleep(min(delay, RateLimiter.MAX_SLEEP))
+        finally:
+            self.rate_limiter.set_waiting(endpoint, priority, -1)
+
+    async def get_json(self, endpoint, params, priority=Priority.INTERACTIVE):
+        url = '{}/{}'.format(self.API_ENDPOINT, endpoint)
+        headers = {
+            'X-User-Auth-Token': self.user_auth_token,
+            'X-App-Id': self.app_id
+        }
+        with self.instrumentation.timed('api_call', endpoint=endpoint) as event:
+            for attempt in range(self.retries + 1):
+                event['retries'] = attempt
+                await self.acquire(endpoint, priority)
+                try:
+                    async with self.get_session().get(url, params=params, headers=headers) as response:
+                        if response.status == 429:
+                            self.rate_limiter.throttled(endpoint, RateLimiter.parse_retry_after(response.headers.get('Retry-After')))
+                            continue
+                        if response.status in AsyncQobuzApi.RETRY_STATUS and attempt < self.retries:
+                            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                            continue
+                        text = await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                    continue
+                self.rate_limiter.succeeded(endpoint)
+                event['status'] = response.status
+                event['bytes'] = len(text)
+                try:
+                    return json.loads(text)
+                except ValueError:
+                    raise QobuzApiError("{} ({}): {}".format(response.reason, response.status, url))
+            raise QobuzApiError("Rate limited on {}: {}".format(endpoint, url))
+
+    async def get_cached_json(self, entity, key, endpoint, params):
+        # sqlite blocks, the cache is used from the default executor to keep the event loop going
+        loop = asyncio.get_running_loop()
+        with self.instrumentation.timed('meta_data', endpoint=endpoint, entity=entity) as event:
+            if self.meta_data_cache:
+                json_response = await loop.run_in_executor(None, self.meta_data_cache.get, entity, key)
+                if json_response is not None:
+                    event['cache'] = 'hit'
+                    return json_response
+            event['cache'] = 'miss'
+            json_response = await self.get_json(endpoint, params)
+            if self.meta_data_cache and isinstance(json_response, dict) and json_response.get('status') != 'error':
+                await loop.run_in_executor(None, self.meta_data_cache.set, entity, key, json_response)
+        return json_response
+
+    async def paginate(self, get_page, limit, offset=0):
+        # the next page is requested while the caller consumes the current one
+        next_page = asyncio.ensure_future(get_page(limit, offset))
+        try:
+            while True:
+                items, total = await next_page
+                offset += limit
+                has_next_page = len(items) >= limit and (total is None or offset < total)
+                if has_next_page:
+                    next_page = asyncio.ensure_future(get_page(limit, offset))
+                for item in items:
+                    yield item
+                if not has_next_page:
+                    return
+        finally:
+            if not next_page.done():
+                next_page.cancel()
+
+    async def get_file_url(self, track_id):
+        request_ts = int(time.time())
+        params = {
+            'track_id': track_id,
+            'format_id': self.format_id,
+            'intent': 'stream',
+            'request_ts': request_ts,
+            'request_sig': QobuzApi.sign_file_url_request(self.app_secret, track_id, self.format_id, request_ts)
+        }
+        json_response = await self.get_json('track/getFileUrl', params)
+        if 'url' not in json_response:
+            raise QobuzFileError("Track {} doesn't provide an url.".format(track_id))
+        if 'sample' in json_response:
+            raise QobuzFileError("Track {} is a sample.".format(track_id))
+        return json_response['url']
+
+    async def get_meta_data(self, track_id):
+        json_response = await self.get_cached_json('track', track_id, 'track/get', {'track_id': track_id})
+        return QobuzApi.parse_track_meta_data(json_response)
+
+    async def get_meta_data_for_album_id(self, album_id):
+        return await self.get_cached_json('album', album_id, 'album/get', {'album_id': album_id})
+
+    async def get_meta_data_for_artist_id(self, artist_id, extra='focus', limit=50, offset=0):
+        key = '{}:{}'.format(artist_id, extra)
+        if offset:
+            key = '{}:{}'.format(key, offset)
+        params = {
+            'artist_id': artist_id,
+            'extra': extra,
+            'limit': limit,
+            'offset': offset
+        }
+        return await self.get_cached_json('artist', key, 'artist/get', params)
+
+    async def get_artist_albums(self, artist, minimum_track_count=4):
+        async def get_page(limit, offset):
+            artist_meta_data = await self.get_meta_data_for_artist_id(artist['id'], extra='albums', limit=limit, offset=offset)
+            albums = artist_meta_data['albums']
+            return albums['items'], albums.get('total')
+
+        async for album in self.paginate(get_page, 50):
+            album_meta_data = QobuzApi.get_album(album, minimum_track_count)
+            if album_meta_data:
+                yield album_meta_data
+
+    async def search_catalog(self, query, item_type=None, limit=2, offset=0):
+        query = ' '.join(query.split())
+        params = {'query': query}
+        key = ''
+        if item_type:
+            params['type'] = item_type
+            key += '&type={}'.format(item_type)
+        if limit:
+            params['limit'] = limit
+            key += '&limit={}'.format(limit)
+        if offset:
+            params['offset'] = offset
+            key += '&offset={}'.format(offset)
+        return await self.get_cached_json('search', '{}&query={}'.format(key, normalize_name(query)), 'catalog/search', params)
+
+    async def search_catalog_for_artists(self, artist, limit=5, offset=0):
+        response = await self.search_catalog(artist, 'artists', limit=limit, offset=offset)
+        return response['artists']['items']
+
+    async def get_artist_by_name(self, artist, limit=10, max_results=50):
+        name = normalize_name(artist)
+        for offset in range(0, max_results, limit):
+            response = await self.search_catalog(artist, 'artists', limit=limit, offset=offset)
+            artists = response['artists']
+            for artist_item in artists['items']:
+                if name == normalize_name(artist_item['name']):
+                    return artist_item
+            if len(artists['items']) < limit or offset + limit >= artists.get('total', max_results):
+                return None
+
+    async def search_catalog_for_albums(self, album, limit=2):
+        response = await self.search_catalog(album, 'albums', limit=limit)
+        return response['albums']['items']
+
+    async def get_favorites(self, favorite_type: FavoriteType, limit: int = 10, offset: int = 0):
+        async def get_page(limit, offset):
+            params = {
+                'type': favorite_type.value,
+                'limit': limit,
+                'offset': offset
+            }
+            json_response = await self.get_json('favorite/getUserFavorites', params)
+            favorites = json_response[favorite_type.value]
+            return favorites['items'], favorites.get('total')
+
+        async for favorite in self.paginate(get_page, limit, offset):
+            yield favorite
@@ -0,0 +1,121 @@
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+import threading
+import time
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    PREFETCH = 1
+    BULK = 2
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0
+        self.waiting = {priority: 0 for priority in Priority}
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_delay(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    GLOBAL = '*'
+    # requests per second and burst size, endpoints without their own budget only share the global one
+    DEFAULT_BUDGETS = {
+        GLOBAL: (10, 20),
+        'track/getFileUrl': (5, 10),
+        'catalog/search': (5, 10),
+    }
+    MIN_RATE = 0.2
+    MAX_SLEEP = 0.5
+
+    def __init__(self, budgets=None):
+        self.budgets = dict(RateLimiter.DEFAULT_BUDGETS, **(budgets or {}))
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def get_buckets(self, endpoint):
+        endpoints = [RateLimiter.GLOBAL]
+        if endpoint in self.budgets and endpoint != RateLimiter.GLOBAL:
+            endpoints.append(endpoint)
+        buckets = []
+        for bucket_endpoint in endpoints:
+            if bucket_endpoint not in self.buckets:
+                self.buckets[bucket_endpoint] = TokenBucket(*self.budgets[bucket_endpoint])
+            buckets.append(self.buckets[bucket_endpoint])
+        return buckets
+
+    def reserve(self, endpoint, priority=Priority.INTERACTIVE):
+        # take a token and return 0, or return the seconds to wait before trying again
+        with self.lock:
+            now = time.monotonic()
+            buckets = self.get_buckets(endpoint)
+            delay = 0
+            for bucket in buckets:
+                bucket.refill(now)
+                delay = max(delay, bucket.get_delay(now))
+                # requests of a more urgent lane waiting for the same bucket go first
+                if any(bucket.waiting[other_priority] for other_priority in Priority if other_priority < priority):
+                    delay = max(delay, 1 / bucket.rate)
+            if delay:
+                return delay
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0
+
+    def set_waiting(self, endpoint, priority, change):
+        with self.lock:
+            for bucket in self.get_buckets(endpoint):
+                bucket.waiting[priority] += change
+
+    def acquire(self, endpoint, priority=Priority.INTERACTIVE):
+        self.set_waiting(endpoint, priority, 1)
+        try:
+            while True:
+                delay = self.reserve(endpoint, priority)
+                if not delay:
+                    return
+                time.sleep(min(delay, RateLimiter.MAX_SLEEP))
+        finally:
+            self.set_waiting(endpoint, priority, -1)
+
+    def throttled(self, endpoint, retry_after=None):
+        # multiplicative decrease on 429, block until the server's Retry-After if there is one
+        with self.lock:
+            now = time.monotonic()
+            for bucket in self.get_buckets(endpoint):
+                bucket.rate = max(RateLimiter.MIN_RATE, bucket.rate / 2)
+                bucket.tokens = min(bucket.tokens, 0)
+                block_for = retry_after if retry_after is not None else 1 / bucket.rate
+                bucket.blocked_until = max(bucket.blocked_until, now + block_for)
+
+    def succeeded(self, endpoint):
+        # additive increase back to the configured budget
+        with self.lock:
+            for bucket in self.get_buckets(endpoint):
+                if bucket.rate < bucket.base_rate:
+                    bucket.rate = min(bucket.base_rate, bucket.rate + bucket.base_rate / 20)
+
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
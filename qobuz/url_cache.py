@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import heapq
+import threading
+import time
+import urllib.parse
+
+class FileUrlCache:
+    # seconds a url has to stay valid to be handed out, a download needs to start with it
+    MIN_REMAINING = 10
+
+    def __init__(self, resolve, max_entries=512, default_ttl=600, refresh_margin=60, submit=None):
+        self.resolve = resolve
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.submit = submit
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        # url, expiry and how often it was handed out again since it was resolved
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        # refresh times of the urls in use, looked after by a single thread
+        self.scheduled = []
+        self.scheduler_thread = None
+        self.closed = False
+
+    @staticmethod
+    def get_key(track_id, format_id):
+        # the daemon passes the ids it got over the socket as strings
+        return (str(track_id), int(format_id))
+
+    def get_expiry(self, url):
+        # streaming urls carry their expiry as unix timestamp in etsp
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        try:
+            return float(query['etsp'][0])
+        except (KeyError, ValueError):
+            return time.time() + self.default_ttl
+
+    def get(self, track_id, format_id):
+        key = self.get_key(track_id, format_id)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] - now > FileUrlCache.MIN_REMAINING:
+                self.entries.move_to_end(key)
+                entry[2] += 1
+                if entry[2] == 1:
+                    # used again, so it's worth having a fresh one before it expires
+                    self.schedule(key, entry[1])
+                if entry[1] - now < self.refresh_margin:
+                    self.submit_refresh(key)
+                return entry[0]
+        return self.refresh(*key)
+
+    def submit_refresh(self, key):
+        if self.submit and key not in self.refreshing and not self.closed:
+            self.refreshing.add(key)
+            self.submit(self.refresh, *key)
+
+    def schedule(self, key, expiry):
+        if not self.submit:
+            return
+        heapq.heappush(self.scheduled, (expiry - self.refresh_margin, key))
+        if not self.scheduler_thread:
+            self.scheduler_thread = threading.Thread(target=self.run_scheduled, name='qobuz-url-refresh', daemon=True)
+            self.scheduler_thread.start()
+        self.condition.notify()
+
+    def run_scheduled(self):
+        with self.condition:
+            while not self.closed:
+                now = time.time()
+                while self.scheduled and self.scheduled[0][0] <= now:
+                    refresh_at, key = heapq.heappop(self.scheduled)
+                    entry = self.entries.get(key)
+                    # skip urls which were evicted or resolved again meanwhile
+                    if entry and entry[1] - self.refresh_margin == refresh_at:
+                        self.submit_refresh(key)
+                self.condition.wait(self.scheduled[0][0] - now if self.scheduled else None)
+
+    def refresh(self, track_id, format_id):
+        key = self.get_key(track_id, format_id)
+        try:
+            url = self.resolve(track_id, format_id)
+        except Exception:
+            self.invalidate(track_id, format_id)
+            raise
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+        with self.lock:
+            self.entries[key] = [url, self.get_expiry(url), 0]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return url
+
+    def invalidate(self, track_id=None, format_id=None):
+        with self.lock:
+            if track_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(self.get_key(track_id, format_id), None)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.scheduler_thread:
+            self.scheduler_thread.join()
+            self.scheduler_thread = None
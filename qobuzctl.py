@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import argparse
+import configparser
+import json
+import os
+import sys
+
+# keep the imports light, this runs for every command
+from qobuz import control
+from qobuz.control import QobuzControlError
+
+CONFIG_PATH = os.path.expanduser('~/.qdl/qdl_config.ini')
+
+parser = argparse.ArgumentParser(description='Control a running qobuzd.py')
+parser.add_argument('--socket', help='control socket of the daemon')
+parser.add_argument('--json', action='store_true', help='print the raw response')
+commands = parser.add_subparsers(dest='command', required=True)
+for item_type in ('track', 'album', 'artist', 'radio'):
+    enqueue_parser = commands.add_parser(item_type, help='queue a {}'.format(item_type))
+    enqueue_parser.add_argument('item', help='id, or name for artist and radio')
+    enqueue_parser.add_argument('--next', action='store_true', help='play before the rest of the queue')
+    enqueue_parser.add_argument('--tracks', type=int, help='tracks per artist')
+    if item_type == 'radio':
+        enqueue_parser.add_argument('--artists', type=int, default=10, help='artists in the radio queue')
+commands.add_parser('status', help='show what is playing and queued')
+commands.add_parser('skip', help='skip the current track')
+commands.add_parser('clear', help='empty the queue')
+sync_parser = commands.add_parser('sync', help='sync the favorites in the background')
+sync_parser.add_argument('types', nargs='*', choices=('tracks', 'albums', 'artists'))
+sync_parser.add_argument('--prune', action='store_true')
+commands.add_parser('stop', help='stop the daemon')
+args = parser.parse_args()
+
+socket_path = args.socket
+if not socket_path:
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    socket_path = control.get_socket_path(config)
+
+command_args = {}
+command = args.command
+if command in ('track', 'album', 'artist', 'radio'):
+    command_args = {
+        'item_type': command,
+        'play_next': args.next,
+        'track_limit': args.tracks
+    }
+    if command in ('artist', 'radio') and not args.item.isdigit():
+        command_args['name'] = args.item
+    else:
+        command_args['item_id'] = args.item
+    if command == 'radio':
+        command_args['artist_count'] = args.artists
+    command = 'enqueue'
+elif command == 'sync':
+    command_args = {'types': args.types, 'prune': args.prune}
+
+try:
+    response = control.send_command(command, socket_path, **command_args)
+except QobuzControlError as e:
+    print(e)
+    sys.exit(1)
+
+if args.json or command != 'status':
+    print(json.dumps(response, indent=4, sort_keys=True))
+else:
+    current_track = response['current']
+    print("Playing: {artist} - {title} ({album})".format_map(current_track) if current_track else "Nothing playing")
+    for position, track in enumerate(response['queue'], 1):
+        print("{:3d}. {artist} - {title}".format(position, **track))
+    if response['queue_length'] > len(response['queue']):
+        print("     ... {} more".format(response['queue_length'] - len(response['queue'])))
+    sync_status = response['sync']
+    if sync_status['running']:
+        print("Syncing favorites")
+    elif sync_status['error']:
+        print("Last sync failed: {}".format(sync_status['error']))
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import argparse
+import signal
+import sys
+
+from qobuz import config as qobuz_config
+from qobuz import control
+from qobuz.daemon import QobuzDaemon
+
+parser = argparse.ArgumentParser(description='Keep a player and the caches running, controlled through qobuzctl.py')
+parser.add_argument('--socket', help='control socket (default: [DAEMON] socket or {})'.format(control.DEFAULT_SOCKET_PATH))
+parser.add_argument('--sync-interval', type=float, help='sync the favorites every SYNC_INTERVAL seconds')
+args = parser.parse_args()
+
+config = qobuz_config.load_config()
+socket_path = args.socket or control.get_socket_path(config)
+sync_interval = args.sync_interval if args.sync_interval is not None else config.getfloat('DAEMON', 'sync_interval', fallback=0)
+
+qobuz_client = qobuz_config.create_client(config)
+qobuz_daemon = QobuzDaemon(qobuz_client, socket_path, sync_interval=sync_interval).start()
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+print("Listening on {}".format(socket_path))
+try:
+    qobuz_daemon.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    qobuz_client.stop()
+    qobuz_client.close()
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+import sys
+
+from qobuz import config as qobuz_config
+
+qobuz_client = qobuz_config.create_client(qobuz_config.load_config())
+
+# pass --checksums to rehash every file instead of reusing known checksums,
+# --match to look up files without id tags by their album and tag them
+indexed_count, unknown_files = qobuz_client.rebuild_library_index(checksums='--checksums' in sys.argv, match='--match' in sys.argv)
+print("Indexed {} tracks".format(indexed_count))
+for unknown_file in unknown_files:
+    print("Not indexed (no track id tag, no match): {}".format(unknown_file))
+qobuz_client.close()
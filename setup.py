@@ -14,6 +14,9 @@ setuptools.setup(
     url="https://github.com/Whisprin/qobuz-player",
     packages=setuptools.find_packages(),
     install_requires=['requests', 'pytaglib'],
+    extras_require={
+        'async': ['aiohttp'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU General Public License v2 or later (GPLv2+)",
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import argparse
+import signal
+import sys
+import time
+
+import requests
+
+from qobuz import config as qobuz_config
+from qobuz.favorites_sync import FavoritesSync
+from qobuz.qobuz_api import FavoriteType, QobuzApiError
+
+parser = argparse.ArgumentParser(description='Cache favorites, only fetching what changed since the last sync')
+parser.add_argument('types', nargs='*', choices=[favorite_type.value for favorite_type in FavoriteType], default=[favorite_type.value for favorite_type in FavoriteType], help='favorite types to sync (default: all)')
+parser.add_argument('--interval', type=float, default=0, help='keep running and sync every INTERVAL seconds')
+parser.add_argument('--prune', action='store_true', help='remove cached files of unfavorited tracks and albums')
+parser.add_argument('--no-cache', dest='cache', action='store_false', help='only update the sync state')
+args = parser.parse_args()
+
+# stop cleanly when run as a service
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+qobuz_client = qobuz_config.create_client(qobuz_config.load_config())
+favorites_sync = FavoritesSync(qobuz_client)
+try:
+    while True:
+        try:
+            favorites_sync.sync_all([FavoriteType(favorite_type) for favorite_type in args.types], cache=args.cache, prune=args.prune)
+        except (requests.RequestException, QobuzApiError) as e:
+            if not args.interval:
+                raise
+            print("Sync failed ({}), retrying in {}s".format(e, args.interval))
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+except KeyboardInterrupt:
+    pass
+finally:
+    qobuz_client.close()
@@ -0,0 +1,104 @@
+import os
+import random
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+
+from qobuz.artist_graph import ArtistGraph
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class ArtistGraphStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.artist_graph = ArtistGraph(os.path.join(self.cache_dir.name, 'artists.sqlite'))
+
+    def tearDown(self):
+        self.artist_graph.close()
+        self.cache_dir.cleanup()
+
+    def test_edges_of_both_sources_add_up(self):
+        self.artist_graph.set_edges(1, ArtistGraph.QOBUZ, [(2, 1.0), (3, 0.5), (1, 1.0)])
+        self.artist_graph.set_edges(1, ArtistGraph.LASTFM, [(3, 0.75), (4, 0.25)])
+        self.assertEqual(self.artist_graph.get_neighbors(1), [('3', 1.25), ('2', 1.0), ('4', 0.25)])
+        # a refresh replaces what the source gave before
+        self.artist_graph.set_edges(1, ArtistGraph.LASTFM, [(4, 0.75)])
+        self.assertEqual(self.artist_graph.get_similar(1, 2), ['2', '4'])
+
+    def test_names_resolved_case_and_spacing_insensitive(self):
+        self.assertEqual(self.artist_graph.resolve_name('Artist 1'), (False, None))
+        self.artist_graph.add_artist(1, 'Artist 1')
+        self.artist_graph.set_name('Nobody', None)
+        self.assertEqual(self.artist_graph.resolve_name(' ARTIST  1'), (True, '1'))
+        self.assertEqual(self.artist_graph.resolve_name('nobody'), (True, None))
+        self.assertEqual(self.artist_graph.resolve_name('Artist 1', max_age=-1), (False, None))
+
+    def test_random_walk_stays_in_the_graph(self):
+        # a chain 1-2-3-4-5 with a branch 2-6, 7 isn't connected
+        for source_id, target_ids in {1: [2], 2: [3, 6], 3: [4], 4: [5], 7: [1]}.items():
+            self.artist_graph.set_edges(source_id, ArtistGraph.QOBUZ, [(target_id, 1.0) for target_id in target_ids])
+        for seed in range(10):
+            queue = self.artist_graph.random_walk(1, 4, random_source=random.Random(seed))
+            self.assertEqual(queue[0], '1')
+            self.assertEqual(len(queue), 4)
+            self.assertEqual(len(set(queue)), 4)
+            self.assertLessEqual(set(queue), {'1', '2', '3', '4', '5', '6'})
+        # all there is to reach
+        self.assertEqual(sorted(self.artist_graph.random_walk(1, 10, random_source=random.Random(0))), ['1', '2', '3', '4', '5', '6'])
+        self.assertEqual(self.artist_graph.random_walk(5, 3), ['5'])
+
+class ArtistGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def test_names_resolved_while_the_workers_are_busy(self):
+        # a bulk sync holding every worker
+        sync_done = threading.Event()
+        self.addCleanup(sync_done.set)
+        executor = self.qobuz_client.get_executor()
+        for _ in range(self.qobuz_client.workers):
+            executor.submit(sync_done.wait, 10)
+        result = {}
+        resolve_thread = threading.Thread(target=lambda: result.update(self.qobuz_client.resolve_artists(['Artist 7', 'artist 7', 'Nobody 7'])))
+        resolve_thread.start()
+        resolve_thread.join(5)
+        self.assertEqual(result, {'Artist 7': '7', 'artist 7': '7', 'Nobody 7': None})
+        # one search per distinct name
+        self.assertEqual(self.server.counts['catalog/search'], 2)
+        sync_done.set()
+
+    def test_graph_refreshed_once_within_max_age(self):
+        self.qobuz_client.refresh_artist_graph([1], depth=1, similar_limit=3)
+        # the artist and the three similar to it
+        self.assertEqual(self.server.reset_counts(), {'artist/getSimilarArtists': 4})
+        self.assertEqual(self.qobuz_client.artist_graph.get_similar(1), ['2', '3', '4'])
+        self.qobuz_client.refresh_artist_graph([1], depth=1, similar_limit=3)
+        self.assertEqual(self.server.reset_counts(), {})
+        self.qobuz_client.refresh_artist_graph([1], depth=0, similar_limit=3, max_age=-1)
+        self.assertEqual(self.server.reset_counts(), {'artist/getSimilarArtists': 1})
+
+    def test_lastfm_edges_matched_by_name(self):
+        similar_artists = [SimpleNamespace(item=SimpleNamespace(name=name), match=match) for name, match in [('artist 9', '0.9'), ('Somebody 9', '0.5'), ('ARTIST 19', '0.3')]]
+        lastfm = SimpleNamespace(get_artist=lambda name: SimpleNamespace(get_similar=lambda limit: similar_artists))
+        self.qobuz_client.refresh_lastfm_edges(1, lastfm)
+        # the artist name is looked up once, names without a match are left out
+        self.assertEqual(self.qobuz_client.artist_graph.get_neighbors(1), [('9', 0.9), ('19', 0.3)])
+        self.assertEqual(self.server.counts['artist/get'], 1)
+
+    def test_artist_radio_walks_the_graph(self):
+        self.qobuz_client.play_artist_radio(1, artist_count=3, cache_only=True, refresh_depth=1)
+        artist_ids = {int(track['track_id']) // 100000 for track in self.qobuz_client.library_index.tracks()}
+        self.assertEqual(len(artist_ids), 3)
+        self.assertIn(1, artist_ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.qobuz_api import FavoriteType
+from qobuz.qobuz_async_api import AsyncQobuzApi
+
+class AsyncQobuzApiTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(favorite_track_count=25).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self):
+        return AsyncQobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, api_endpoint=self.server.api_endpoint)
+
+    def test_meta_data_cache_off_the_event_loop(self):
+        cache_threads = []
+
+        async def get_album_twice():
+            async with self.create_client() as qobuz_client:
+                meta_data_cache = qobuz_client.meta_data_cache
+                for method_name in ('get', 'set'):
+                    method = getattr(meta_data_cache, method_name)
+                    def record_thread(*args, method=method):
+                        cache_threads.append(threading.get_ident())
+                        return method(*args)
+                    setattr(meta_data_cache, method_name, record_thread)
+                albums = [await qobuz_client.get_meta_data_for_album_id(1000) for _ in range(2)]
+            return albums, threading.get_ident()
+
+        albums, loop_thread = asyncio.run(get_album_twice())
+        self.assertEqual(albums[0], albums[1])
+        # a miss with its set, then a hit
+        self.assertEqual(len(cache_threads), 3)
+        self.assertNotIn(loop_thread, cache_threads)
+        self.assertEqual(self.server.reset_counts(), {'album/get': 1})
+
+    def test_favorites_paginated(self):
+        async def get_favorite_ids():
+            async with self.create_client() as qobuz_client:
+                return [favorite['id'] async for favorite in qobuz_client.get_favorites(FavoriteType.TRACK, limit=10)]
+
+        self.assertEqual(asyncio.run(get_favorite_ids()), self.server.catalog.get_favorite_track_ids())
+        self.assertEqual(self.server.reset_counts(), {'favorite/getUserFavorites': 3})
+
+if __name__ == '__main__':
+    unittest.main()
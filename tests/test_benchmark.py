@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import requests
+
+from benchmark import get_percentile
+from qobuz.mock_server import MockQobuzServer, get_flac_data
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class MockServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024).start()
+        self.addCleanup(self.server.stop)
+
+    def test_file_ranges(self):
+        data = get_flac_data(100001, self.server.catalog.track_size)
+        file_url = '{}/file/100001'.format(self.server.base_url)
+        self.assertEqual(requests.get(file_url).content, data)
+        response = requests.get(file_url, headers={'Range': 'bytes=100-'})
+        self.assertEqual((response.status_code, response.content), (206, data[100:]))
+        self.assertEqual(response.headers['Content-Range'], 'bytes 100-{}/{}'.format(len(data) - 1, len(data)))
+        response = requests.get(file_url, headers={'Range': 'bytes={}-'.format(len(data))})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(self.server.reset_counts(), {'file': 3})
+
+    def test_api_calls_counted_by_endpoint(self):
+        album = requests.get('{}/album/get?album_id=1001'.format(self.server.api_endpoint)).json()
+        self.assertEqual([track['id'] for track in album['tracks']['items']], [100100 + track_number for track_number in range(1, 11)])
+        self.assertEqual(requests.get('{}/unknown'.format(self.server.api_endpoint)).status_code, 404)
+        self.assertEqual(self.server.reset_counts(), {'album/get': 1, 'unknown': 1})
+
+class BenchmarkTest(unittest.TestCase):
+    def test_get_percentile(self):
+        self.assertIsNone(get_percentile([], 50))
+        self.assertEqual(get_percentile([3, 1, 2], 50), 2)
+        self.assertEqual(get_percentile(list(range(1, 101)), 99), 99)
+
+    def test_report(self):
+        command = [sys.executable, 'benchmark.py', '--favorite-tracks', '6', '--albums-per-artist', '1', '--tracks-per-album', '3', '--track-size', '4096', '--latency', '0', '--requests-per-second', '1000', '--label', 'test']
+        output = subprocess.run(command, cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=60).stdout
+        report = json.loads(output)
+        self.assertEqual(report['label'], 'test')
+        results = {result['workload']: result for result in report['results']}
+        self.assertEqual(list(results), ['favorites_sync_cold', 'favorites_sync_warm', 'artist_discography'])
+        self.assertEqual(results['favorites_sync_cold']['api_calls']['file'], 6)
+        # the warm sync finds everything in the cache
+        self.assertNotIn('file', results['favorites_sync_warm']['api_calls'])
+        self.assertEqual(results['artist_discography']['api_calls']['file'], 3)
+        for result in results.values():
+            self.assertIsNotNone(result['track_latency_p99'])
+
+if __name__ == '__main__':
+    unittest.main()
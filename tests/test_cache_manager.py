@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class CacheManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = None
+
+    def tearDown(self):
+        if self.qobuz_client:
+            self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self, **options):
+        options.setdefault('cache_cleanup_interval', 0)
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), **options)
+        return self.qobuz_client
+
+    def create_file(self, file_name, age=0):
+        path = os.path.join(self.cache_dir.name, file_name)
+        with open(path, 'wb') as out_file:
+            out_file.write(bytes(1024))
+        modified_at = time.time() - age
+        os.utime(path, (modified_at, modified_at))
+        return path
+
+    def test_stale_temp_file_removed_with_its_parts(self):
+        cache_manager = self.create_client().cache_manager
+        day = cache_manager.temp_max_age
+        stale_paths = [self.create_file('01 Stale.qtmp', 2 * day), self.create_file('01 Stale.qtmp.parts', day // 2)]
+        # the .parts file is written after the temp file is created, it may well be older than the temp file
+        recent_paths = [self.create_file('02 Recent.qtmp'), self.create_file('02 Recent.qtmp.parts', 2 * day)]
+        orphan_path = self.create_file('03 Orphan.qtmp.parts', 2 * day)
+        self.assertEqual(cache_manager.cleanup(), 3)
+        for path in stale_paths + [orphan_path]:
+            self.assertFalse(os.path.exists(path))
+        for path in recent_paths:
+            self.assertTrue(os.path.exists(path))
+
+    def test_cleanup_thread_needs_a_budget(self):
+        self.assertIsNone(self.create_client(cache_cleanup_interval=3600).cache_manager.cleanup_thread)
+        self.qobuz_client.close()
+        self.assertIsNotNone(self.create_client(cache_cleanup_interval=3600, cache_max_bytes=1024 ** 3).cache_manager.cleanup_thread)
+
+    def evict_played_album(self, policy, track_plays):
+        qobuz_client = self.create_client(cache_policy=policy)
+        qobuz_client.play_album(1000, cache_only=True)
+        for track_id, play_count in track_plays:
+            for _ in range(play_count):
+                qobuz_client.record_play(track_id)
+        cache_manager = qobuz_client.cache_manager
+        cache_manager.min_age = 0
+        tracks = list(qobuz_client.library_index.tracks())
+        track_size = tracks[0]['size']
+        overhead_bytes = cache_manager.get_overhead_bytes()
+        self.assertGreater(overhead_bytes, 0)
+        # down to 90% of the budget leaves room for six tracks next to the covers and databases,
+        # half a track to spare as the tags make their sizes differ by a few bytes
+        cache_manager.max_bytes = (6.5 * track_size + overhead_bytes) / cache_manager.LOW_WATERMARK
+        self.assertEqual(cache_manager.enforce(), 4)
+        return {int(track['track_id']) for track in qobuz_client.library_index.tracks()}
+
+    def test_lru_evicts_played_longest_ago(self):
+        # played once each, one after another
+        track_plays = [(100000 + track_number, 1) for track_number in range(1, 11)]
+        self.assertEqual(self.evict_played_album('lru', track_plays), {100005, 100006, 100007, 100008, 100009, 100010})
+
+    def test_lfu_evicts_played_least_often(self):
+        # the last five are played more recently, but less often
+        track_plays = [(100000 + track_number, 2) for track_number in range(1, 6)] + [(100000 + track_number, 1) for track_number in range(6, 11)]
+        self.assertEqual(self.evict_played_album('lfu', track_plays), {100001, 100002, 100003, 100004, 100005, 100010})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi, QobuzIncompleteAlbumError
+
+class CacheOnlyTest(unittest.TestCase):
+    def setUp(self):
+        # slow enough for the downloads of an album to overlap
+        self.server = MockQobuzServer(bandwidth=256 * 1024, track_size=32 * 1024, favorite_track_count=12, sample_track_ids=(100105,)).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0, workers=3)
+        self.downloads = []
+        self.qobuz_client.instrumentation.subscribe(self.record_download)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def record_download(self, event):
+        if event['event'] == 'download' and event['endpoint'] == 'file':
+            self.downloads.append((event['time'] - event['duration'], event['time']))
+
+    def get_peak_downloads(self):
+        changes = sorted([(started_at, 1) for started_at, _ in self.downloads] + [(ended_at, -1) for _, ended_at in self.downloads])
+        running = peak = 0
+        for _, change in changes:
+            running += change
+            peak = max(peak, running)
+        return peak
+
+    def get_cached_track_ids(self):
+        return {int(track['track_id']) for track in self.qobuz_client.library_index.tracks()}
+
+    def test_album_tracks_downloaded_by_the_workers(self):
+        self.qobuz_client.play_album(1000, cache_only=True)
+        self.assertEqual(self.get_cached_track_ids(), {100000 + track_number for track_number in range(1, 11)})
+        self.assertEqual(len(self.downloads), 10)
+        self.assertGreater(self.get_peak_downloads(), 1)
+        self.assertLessEqual(self.get_peak_downloads(), 3)
+
+    def test_failed_track_leaves_the_album_incomplete(self):
+        with self.assertRaises(QobuzIncompleteAlbumError):
+            self.qobuz_client.play_album(1001, cache_only=True)
+        # the other tracks are cached regardless
+        self.assertEqual(self.get_cached_track_ids(), {100100 + track_number for track_number in range(1, 11)} - {100105})
+        self.assertFalse(self.qobuz_client.is_album_cached(1001))
+
+    def test_favorite_tracks_cached_while_paginating(self):
+        self.qobuz_client.play_favorites('tracks', limit=5, cache_only=True)
+        self.assertEqual(self.server.counts['favorite/getUserFavorites'], 3)
+        self.assertEqual(len(self.get_cached_track_ids()), 12)
+        self.assertGreater(self.get_peak_downloads(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class CoverCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024).start()
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.work_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.server.stop()
+        self.work_dir.cleanup()
+
+    def create_client(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, cache_dir, cache_dir, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+        self.addCleanup(qobuz_client.close)
+        return qobuz_client
+
+    def test_relative_cache_dir(self):
+        qobuz_client = self.create_client('music')
+        qobuz_client.play_album(1000, cache_only=True)
+        album_path = os.path.join('music', 'Artist 1', 'Album 1000')
+        self.assertEqual(len([file_name for file_name in os.listdir(album_path) if file_name.endswith('.flac')]), 10)
+        self.assertTrue(os.path.isfile(os.path.join(album_path, 'folder.jpg')))
+        self.assertFalse([file_name for file_name in os.listdir(os.path.join('music', '.covers', 'urls')) if file_name.endswith('.qtmp')])
+
+    def test_cover_downloaded_once_per_url(self):
+        qobuz_client = self.create_client(os.path.abspath('music'))
+        qobuz_client.play_album(1000, cache_only=True)
+        self.assertEqual(self.server.counts['cover'], 1)
+
+    def test_url_locks_bounded(self):
+        qobuz_client = self.create_client(os.path.abspath('music'))
+        cover_cache = qobuz_client.cover_cache
+        # as many urls as a sync of a large library goes through, each keeps its lock
+        for album_id in range(1000, 1000 + 2 * cover_cache.LOCK_COUNT):
+            url = '{}/cover/{}.jpg'.format(self.server.base_url, album_id)
+            self.assertIs(cover_cache.url_lock(url), cover_cache.url_lock(url))
+        self.assertEqual(len(cover_cache.url_locks), cover_cache.LOCK_COUNT)
+
+if __name__ == '__main__':
+    unittest.main()
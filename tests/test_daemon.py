@@ -0,0 +1,59 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from qobuz.control import send_command
+from qobuz.daemon import QobuzDaemon
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class QobuzDaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=64 * 1024, tracks_per_album=5).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self, player):
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=player, cache_cleanup_interval=0)
+        return self.qobuz_client
+
+    def get_track_path(self, track_id):
+        return self.qobuz_client.get_cache_file_path(self.qobuz_client.get_indexed_track(track_id)['path'])
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out")
+            time.sleep(0.05)
+
+    def test_enqueue_and_skip(self):
+        player = NullPlayer(play_time=30)
+        qobuz_client = self.create_client(player)
+        socket_path = os.path.join(self.cache_dir.name, 'qobuz.sock')
+        daemon = QobuzDaemon(qobuz_client, socket_path).start()
+        server_thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            response = send_command('enqueue', socket_path, item_type='album', item_id=1000)
+            self.assertEqual(response['queued'], 5)
+            # status falls back to the track being cached, skip needs the player to have started it
+            self.wait_for(lambda: player.current and player.current.data == 100001)
+            self.assertEqual(send_command('status', socket_path)['current']['track_id'], 100001)
+            self.assertTrue(send_command('skip', socket_path)['skipped'])
+            self.wait_for(lambda: (send_command('status', socket_path)['current'] or {}).get('track_id') == 100002)
+            self.assertEqual(player.played[0], self.get_track_path(100001))
+        finally:
+            send_command('stop', socket_path)
+            server_thread.join(10)
+        self.assertFalse(os.path.exists(socket_path))
+
+if __name__ == '__main__':
+    unittest.main()
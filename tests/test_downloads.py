@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from qobuz.mock_server import MockQobuzServer, get_flac_data
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=64 * 1024).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self, **options):
+        return QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0, **options)
+
+    def test_batch_fsync_syncs_only_the_batch(self):
+        qobuz_client = self.create_client(fsync_policy='batch', fsync_batch_size=4, workers=1)
+        with mock.patch('os.sync', side_effect=AssertionError('os.sync flushes every file system')), mock.patch('os.fsync', wraps=os.fsync) as fsync:
+            qobuz_client.play_album(1000, cache_only=True)
+            # two full batches of four tracks, each with their album folder
+            self.assertEqual(fsync.call_count, 2 * (4 + 1))
+            qobuz_client.close()
+            # the two tracks left over are synced on close
+            self.assertEqual(fsync.call_count, 2 * (4 + 1) + 2 + 1)
+
+    def test_partial_temp_file_resumed(self):
+        qobuz_client = self.create_client()
+        track_id = 100001
+        qobuz_client.play_track(track_id, cache_only=True)
+        track = qobuz_client.get_indexed_track(track_id)
+        qobuz_client.remove_cached_track(track, remove_folder=False)
+        # an interrupted download, its last byte marks what was kept
+        data = get_flac_data(track_id, self.server.catalog.track_size)
+        partial_data = data[:len(data) // 2 - 1] + bytes([data[len(data) // 2 - 1] ^ 0xff])
+        with open(qobuz_client.get_temp_file_path(qobuz_client.get_cache_file_path(track['path'])), 'wb') as temp_file:
+            temp_file.write(partial_data)
+        self.assertTrue(qobuz_client.play_track(track_id, cache_only=True))
+        qobuz_client.close()
+        with open(qobuz_client.get_cache_file_path(track['path']), 'rb') as cached_file:
+            cached_data = cached_file.read()
+        self.assertTrue(cached_data.endswith(partial_data[-4096:] + data[len(partial_data):]))
+
+    def test_segmented_download_preallocated(self):
+        qobuz_client = self.create_client(download_segments=4, segment_min_size=1)
+        track_size = self.server.catalog.track_size
+        with mock.patch('os.posix_fallocate', wraps=os.posix_fallocate) as posix_fallocate, mock.patch('os.ftruncate', wraps=os.ftruncate) as ftruncate:
+            self.assertTrue(qobuz_client.play_track(100001, cache_only=True))
+        self.assertEqual([call.args[1:] for call in posix_fallocate.call_args_list], [(0, track_size)])
+        self.assertFalse(ftruncate.called)
+        track = qobuz_client.get_indexed_track(100001)
+        qobuz_client.close()
+        with open(qobuz_client.get_cache_file_path(track['path']), 'rb') as cached_file:
+            cached_data = cached_file.read()
+        data = get_flac_data(100001, track_size)
+        self.assertTrue(cached_data.endswith(data[-track_size // 2:]))
+        self.assertEqual([path for path in os.listdir(os.path.dirname(qobuz_client.get_cache_file_path(track['path']))) if '.qtmp' in path], [])
+
+    def test_segmented_download_synced_per_segment(self):
+        qobuz_client = self.create_client(download_segments=4, segment_min_size=1, fsync_policy='file')
+        with mock.patch('os.fsync', wraps=os.fsync) as fsync:
+            self.assertTrue(qobuz_client.play_track(100001, cache_only=True))
+        qobuz_client.close()
+        # each of the four segments before it's recorded in the .parts file, the five .parts
+        # files written, the cover and the album folder once the track is moved into it
+        self.assertEqual(fsync.call_count, 4 + 5 + 1 + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+
+from qobuz.favorites_sync import FavoritesSync
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import FavoriteType, QobuzApi
+
+class FavoritesSyncTest(unittest.TestCase):
+    def setUp(self):
+        # one favorite can only be streamed as a sample, qobuz has no file for it
+        self.server = MockQobuzServer(track_size=16 * 1024, favorite_track_count=30, sample_track_ids=[100203]).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def test_only_failed_ids_left_out_of_the_state(self):
+        track_ids = self.server.catalog.get_favorite_track_ids()
+        failed_track_id = track_ids[3]
+        self.assertIn(100203, track_ids)
+        play_track = self.qobuz_client.play_track
+        def fail_one_track(track_id, *args, **kwargs):
+            if track_id == failed_track_id:
+                return False
+            return play_track(track_id, *args, **kwargs)
+        self.qobuz_client.play_track = fail_one_track
+        favorites_sync = FavoritesSync(self.qobuz_client)
+        favorites_sync.sync(FavoriteType.TRACK)
+        self.assertEqual(favorites_sync.get_favorite_ids(FavoriteType.TRACK), [track_id for track_id in track_ids if track_id != failed_track_id])
+        # the next run picks up the failed one as new
+        self.qobuz_client.play_track = play_track
+        favorites_sync = FavoritesSync(self.qobuz_client)
+        new_items, removed_ids = favorites_sync.sync(FavoriteType.TRACK)
+        self.assertEqual([item['id'] for item in new_items], [failed_track_id])
+        self.assertEqual(favorites_sync.get_favorite_ids(FavoriteType.TRACK), track_ids)
+
+    def test_unavailable_favorites_kept_in_the_state(self):
+        track_ids = self.server.catalog.get_favorite_track_ids()
+        FavoritesSync(self.qobuz_client).sync(FavoriteType.TRACK)
+        self.server.reset_counts()
+        favorites_sync = FavoritesSync(self.qobuz_client)
+        new_items, removed_ids = favorites_sync.sync(FavoriteType.TRACK)
+        self.assertEqual(new_items, [])
+        self.assertEqual(favorites_sync.get_favorite_ids(FavoriteType.TRACK), track_ids)
+        # one page tells nothing changed, the unavailable track isn't tried again
+        self.assertEqual(self.server.reset_counts(), {'favorite/getUserFavorites': 1})
+
+if __name__ == '__main__':
+    unittest.main()
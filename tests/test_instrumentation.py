@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from qobuz.instrumentation import PrometheusExporter
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=64 * 1024).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = None
+
+    def tearDown(self):
+        if self.qobuz_client:
+            self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self, **options):
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, player=NullPlayer(), cache_cleanup_interval=0, backoff_factor=0, **options)
+        self.events = []
+        self.qobuz_client.instrumentation.subscribe(self.events.append)
+        return self.qobuz_client
+
+    def get_download_events(self):
+        return [event for event in self.events if event['event'] == 'download' and event['endpoint'] != 'cover']
+
+    def test_event_log_is_opt_in(self):
+        log_path = os.path.join(self.cache_dir.name, 'qobuz_events.jsonl')
+        self.create_client().play_track(100001, cache_only=True)
+        self.qobuz_client.close()
+        self.assertFalse(os.path.exists(log_path))
+        self.create_client(log_events=True).play_track(100002, cache_only=True)
+        self.qobuz_client.close()
+        self.qobuz_client = None
+        with open(log_path) as log_file:
+            logged_events = [json.loads(line)['event'] for line in log_file]
+        self.assertIn('download', logged_events)
+        self.assertNotIn('download_chunk', logged_events)
+
+    def test_resumed_download_counted_as_retry(self):
+        qobuz_client = self.create_client()
+        copy_response = qobuz_client.copy_response
+        interruptions = [requests.ConnectionError('connection reset')]
+
+        def interrupted_copy_response(*args, **kwargs):
+            if interruptions:
+                raise interruptions.pop()
+            return copy_response(*args, **kwargs)
+
+        exporter = qobuz_client.instrumentation.subscribe(PrometheusExporter())
+        with mock.patch.object(qobuz_client, 'copy_response', side_effect=interrupted_copy_response):
+            self.assertTrue(qobuz_client.play_track(100001, cache_only=True))
+        self.assertEqual([event['retries'] for event in self.get_download_events()], [0, 1])
+        self.assertIn('qobuz_retries_total{event="download",endpoint="file"} 1', exporter.render())
+
+    def test_segment_retries_recorded(self):
+        qobuz_client = self.create_client(download_segments=4, segment_min_size=1)
+        pwrite = os.pwrite
+        interruptions = [requests.ConnectionError('connection reset') for _ in range(2)]
+
+        def interrupted_pwrite(*args):
+            if interruptions:
+                raise interruptions.pop()
+            return pwrite(*args)
+
+        with mock.patch('os.pwrite', side_effect=interrupted_pwrite):
+            self.assertTrue(qobuz_client.play_track(100001, cache_only=True))
+        download_events = self.get_download_events()
+        self.assertEqual([(event['endpoint'], event['retries'], event['bytes']) for event in download_events], [('segments', 2, self.server.catalog.track_size)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import tempfile
+import unittest
+
+import taglib
+
+from qobuz import library_index
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi, QobuzIncompleteAlbumError
+
+class LibraryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024, sample_track_ids=[100103]).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def remove_id_tags(self, track):
+        song = taglib.File(self.qobuz_client.get_cache_file_path(track['path']))
+        for tag in (library_index.TRACK_ID_TAG, library_index.ALBUM_ID_TAG, library_index.FORMAT_ID_TAG):
+            del song.tags[tag]
+        song.save()
+
+    def test_cached_album_skipped(self):
+        self.qobuz_client.play_album(1000, cache_only=True)
+        self.assertTrue(self.qobuz_client.is_album_cached(1000))
+        self.server.reset_counts()
+        self.qobuz_client.play_album(1000, cache_only=True)
+        self.assertFalse(self.server.reset_counts())
+
+    def test_album_with_unavailable_track_incomplete(self):
+        for _ in range(2):
+            with self.assertRaises(QobuzIncompleteAlbumError):
+                self.qobuz_client.play_album(1001, cache_only=True)
+        self.assertFalse(self.qobuz_client.is_album_cached(1001))
+        self.assertTrue(self.qobuz_client.is_track_unavailable(100103))
+
+    def test_rebuild_keeps_indexed_files_without_id_tags(self):
+        self.qobuz_client.play_album(1000, cache_only=True)
+        tracks = sorted(self.qobuz_client.library_index.tracks(), key=lambda track: track['path'])
+        self.remove_id_tags(tracks[0])
+        indexed_count, unknown_files = self.qobuz_client.rebuild_library_index()
+        self.assertEqual((indexed_count, unknown_files), (len(tracks), []))
+        self.assertEqual(self.qobuz_client.get_indexed_track(tracks[0]['track_id'])['path'], tracks[0]['path'])
+
+    def test_rebuild_matches_files_by_their_album(self):
+        self.qobuz_client.play_album(1000, cache_only=True)
+        tracks = list(self.qobuz_client.library_index.tracks())
+        # a library from before the index, neither tagged with ids nor indexed
+        for track in tracks:
+            self.remove_id_tags(track)
+            self.qobuz_client.library_index.remove_track(track['track_id'], track['format_id'])
+        indexed_count, unknown_files = self.qobuz_client.rebuild_library_index()
+        self.assertEqual((indexed_count, len(unknown_files)), (0, len(tracks)))
+        indexed_count, unknown_files = self.qobuz_client.rebuild_library_index(match=True)
+        self.assertEqual((indexed_count, unknown_files), (len(tracks), []))
+        for track in tracks:
+            indexed_track = self.qobuz_client.get_indexed_track(track['track_id'])
+            self.assertEqual(indexed_track['path'], track['path'])
+            self.assertEqual(taglib.File(self.qobuz_client.get_cache_file_path(track['path'])).tags[library_index.TRACK_ID_TAG], [track['track_id']])
+
+if __name__ == '__main__':
+    unittest.main()
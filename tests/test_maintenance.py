@@ -0,0 +1,73 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import taglib
+
+from qobuz.favorites_sync import FavoritesSync
+from qobuz.maintenance import LibraryMaintenance
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import FavoriteType, QobuzApi
+
+class LibraryMaintenanceTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024, favorite_track_count=20).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+        # favorites embed their meta data, neither tracks nor albums end up in the metadata cache
+        FavoritesSync(self.qobuz_client).sync(FavoriteType.TRACK)
+        self.qobuz_client.invalidate_meta_data()
+        self.tracks = list(self.qobuz_client.library_index.tracks())
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def test_tag_drift_found_with_one_album_call_per_album(self):
+        song = taglib.File(self.qobuz_client.get_cache_file_path(self.tracks[0]['path']))
+        song.tags['TITLE'] = ['Changed']
+        song.save()
+        self.server.reset_counts()
+        counts = LibraryMaintenance(self.qobuz_client, workers=1).run()
+        self.assertEqual(counts['retagged'], 1)
+        self.assertEqual(counts['ok'], len(self.tracks) - 1)
+        self.assertEqual(counts['unchecked'], 0)
+        api_counts = self.server.reset_counts()
+        self.assertEqual(api_counts.get('album/get'), len({track['album_id'] for track in self.tracks}))
+        self.assertNotIn('track/get', api_counts)
+        self.assertNotEqual(taglib.File(self.qobuz_client.get_cache_file_path(self.tracks[0]['path'])).tags['TITLE'], ['Changed'])
+
+    def test_cached_meta_data_only(self):
+        self.server.reset_counts()
+        counts = LibraryMaintenance(self.qobuz_client, workers=1, fetch_meta_data=False).run()
+        self.assertEqual(counts['unchecked'], len(self.tracks))
+        self.assertFalse(self.server.reset_counts())
+
+    def truncate_track(self, track, size):
+        with open(self.qobuz_client.get_cache_file_path(track['path']), 'r+b') as track_file:
+            track_file.truncate(size)
+
+    def test_broken_file_kept_until_downloaded_again(self):
+        track = self.tracks[0]
+        self.truncate_track(track, track['size'] // 2)
+        with mock.patch.object(self.qobuz_client, 'cache_file', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                LibraryMaintenance(self.qobuz_client, workers=1).run()
+        # still there and indexed, the resumed run finds it again
+        self.assertEqual(self.qobuz_client.library_index.get_track(track['track_id'], 6)['path'], track['path'])
+        counts = LibraryMaintenance(self.qobuz_client, workers=1).run()
+        self.assertEqual(counts['truncated'], 1)
+        self.assertEqual(self.qobuz_client.get_indexed_track(track['track_id'])['size'], track['size'])
+
+    def test_broken_file_without_cached_meta_data_only(self):
+        # cut off within the flac header
+        self.truncate_track(self.tracks[0], 16)
+        self.server.reset_counts()
+        counts = LibraryMaintenance(self.qobuz_client, workers=1, fetch_meta_data=False).run()
+        self.assertEqual(counts['header'], 1)
+        self.assertFalse(self.server.reset_counts())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from qobuz.metadata_cache import MetadataCache
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.cache_dir.name, 'meta_data.sqlite')
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def create_cache(self, **options):
+        meta_data_cache = MetadataCache(self.path, **options)
+        self.addCleanup(meta_data_cache.close)
+        return meta_data_cache
+
+    def test_entry_expires_after_its_ttl(self):
+        meta_data_cache = self.create_cache(ttls={'album': 60})
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            meta_data_cache.set('album', 1000, {'id': 1000})
+        with mock.patch('time.time', return_value=now + 59):
+            self.assertEqual(meta_data_cache.get('album', '1000'), {'id': 1000})
+        with mock.patch('time.time', return_value=now + 61):
+            self.assertIsNone(meta_data_cache.get('album', 1000))
+        # the expired entry is gone, not just hidden
+        self.assertIsNone(meta_data_cache.get('album', 1000))
+        self.assertEqual(meta_data_cache.invalidate('album'), 0)
+
+    def test_zero_ttl_disables_caching(self):
+        meta_data_cache = self.create_cache(ttls={'artist': 0})
+        meta_data_cache.set('artist', 1, {'id': 1})
+        self.assertIsNone(meta_data_cache.get('artist', 1))
+
+    def test_least_recently_used_evicted(self):
+        meta_data_cache = self.create_cache(max_entries=10)
+        now = time.time()
+        for track_id in range(MetadataCache.EVICT_CHECK_INTERVAL):
+            # the first tracks are written last, so they were used most recently
+            with mock.patch('time.time', return_value=now - track_id):
+                meta_data_cache.set('track', track_id, {'id': track_id})
+        # down to 90% of max_entries
+        self.assertEqual([track_id for track_id in range(MetadataCache.EVICT_CHECK_INTERVAL) if meta_data_cache.get('track', track_id)], list(range(9)))
+
+    def test_meta_data_persisted_across_clients(self):
+        server = MockQobuzServer().start()
+        self.addCleanup(server.stop)
+        for _ in range(2):
+            qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=server.api_endpoint, player=NullPlayer(), cache_cleanup_interval=0)
+            self.assertEqual(qobuz_client.get_meta_data_for_album_id(1000)['title'], 'Album 1000')
+            qobuz_client.close()
+        self.assertEqual(server.counts['album/get'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import tempfile
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class PlayerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=64 * 1024, tracks_per_album=5).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self, player):
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=player, cache_cleanup_interval=0)
+        return self.qobuz_client
+
+    def get_track_path(self, track_id):
+        return self.qobuz_client.get_cache_file_path(self.qobuz_client.get_indexed_track(track_id)['path'])
+
+    def test_play_tracks_in_order_with_prefetch(self):
+        player = NullPlayer(play_time=0.2)
+        qobuz_client = self.create_client(player)
+        track_ids = [100001 + track_number for track_number in range(5)]
+        started_entries = []
+        start_entry = player.start_entry
+        def record_start(entry):
+            # the track after the one starting is already cached
+            next_position = track_ids.index(entry.data) + 1
+            started_entries.append(next_position == len(track_ids) or qobuz_client.get_indexed_track(track_ids[next_position]) is not None)
+            start_entry(entry)
+        player.start_entry = record_start
+        self.assertTrue(qobuz_client.play_tracks(track_ids))
+        self.assertEqual(player.played, [self.get_track_path(track_id) for track_id in track_ids])
+        self.assertEqual(started_entries, [True] * len(track_ids))
+        # prefetched tracks aren't downloaded a second time to play them
+        self.assertEqual(self.server.reset_counts()['file'], len(track_ids))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+from qobuz.rate_limiter import RateLimiter
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=64 * 1024, latency=0.02, bandwidth=2 * 1024 ** 2, tracks_per_album=5).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.player = NullPlayer()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=self.player, cache_cleanup_interval=0)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def test_playback_does_not_wait_for_bulk_sync(self):
+        # a backlog of bulk downloads on the worker pool must not hold up prefetching for playback
+        bulk_track_ids = [artist_id * 100000 + track_number for artist_id in range(2, 42) for track_number in range(1, 6)]
+        bulk_sync = threading.Thread(target=self.qobuz_client.cache_tracks, args=(bulk_track_ids,))
+        bulk_sync.start()
+        started_at = time.monotonic()
+        self.qobuz_client.play_album(1000)
+        # a second or so, behind the backlog it takes over half a minute
+        self.assertLess(time.monotonic() - started_at, 10)
+        self.assertTrue(bulk_sync.is_alive())
+        self.assertEqual(len(self.player.played), 5)
+        # lift the limits for the rest of the backlog
+        self.server.latency = 0
+        self.server.bandwidth = 0
+        self.qobuz_client.rate_limiter = RateLimiter({endpoint: (1000, 1000) for endpoint in RateLimiter.DEFAULT_BUDGETS})
+        bulk_sync.join()
+
+    def test_running_prefetches_count_toward_max_bytes(self):
+        prefetcher = self.qobuz_client.prefetcher
+        track_ids = [100001, 100002, 100003]
+        track_meta_data = {track_id: self.qobuz_client.get_meta_data(track_id) for track_id in track_ids}
+        # room for two tracks still downloading, none of them is done yet
+        prefetcher.depth = 3
+        prefetcher.max_bytes = 2 * prefetcher.estimate_bytes(track_meta_data[100001])
+        self.server.bandwidth = 64 * 1024
+        prefetcher.prefetch(track_ids, track_meta_data)
+        self.assertEqual(list(prefetcher.futures), [100001, 100002])
+        for track_id in track_ids[:2]:
+            prefetcher.wait(track_id)
+        self.assertEqual(prefetcher.reserved_bytes, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from qobuz.mock_server import MockQobuzServer, get_flac_data
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class RecordingPlayer(NullPlayer):
+    # keeps what was read from the fifo and when playback started
+    def __init__(self):
+        self.data = []
+        self.started_at = []
+        self.started = threading.Event()
+        NullPlayer.__init__(self)
+
+    def start_entry(self, entry):
+        self.started_at.append(time.time())
+        self.started.set()
+        NullPlayer.start_entry(self, entry)
+
+    def play_entry(self, entry):
+        data = bytearray()
+        with open(entry.path, 'rb') as in_file:
+            while not self.skip_event.is_set():
+                chunk = in_file.read(NullPlayer.chunk_size)
+                if not chunk:
+                    break
+                data += chunk
+        self.data.append(bytes(data))
+
+class ProgressiveTest(unittest.TestCase):
+    def setUp(self):
+        # the last of the two chunks of a track arrives a second after the first
+        self.server = MockQobuzServer(bandwidth=64 * 1024, track_size=128 * 1024).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.player = RecordingPlayer()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=self.player, cache_cleanup_interval=0, progressive=True)
+        self.downloaded_at = []
+        self.qobuz_client.instrumentation.subscribe(self.record_download)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def record_download(self, event):
+        if event['event'] == 'download' and event['endpoint'] == 'file':
+            self.downloaded_at.append(event['time'])
+
+    def test_playback_starts_before_the_download_finishes(self):
+        self.assertTrue(self.qobuz_client.play_track(100001))
+        self.qobuz_client.wait_for_player()
+        self.assertLess(self.player.started_at[0], self.downloaded_at[0] - 0.5)
+        # the player got the whole file through the fifo, the cached copy is tagged and indexed
+        data = get_flac_data(100001, self.server.catalog.track_size)
+        self.assertEqual(self.player.data, [data])
+        track = self.qobuz_client.get_indexed_track(100001)
+        self.assertIsNotNone(track)
+        with open(self.qobuz_client.get_cache_file_path(track['path']), 'rb') as cached_file:
+            self.assertTrue(cached_file.read().endswith(data[-4096:]))
+
+    def test_skipped_track_still_cached(self):
+        skip_thread = threading.Thread(target=lambda: self.player.started.wait(5) and self.player.skip())
+        skip_thread.start()
+        self.assertTrue(self.qobuz_client.play_track(100001))
+        skip_thread.join()
+        self.assertLess(len(self.player.data[0]), self.server.catalog.track_size)
+        track = self.qobuz_client.get_indexed_track(100001)
+        self.assertTrue(os.path.isfile(self.qobuz_client.get_cache_file_path(track['path'])))
+        # played from the cache the next time
+        self.assertTrue(self.qobuz_client.play_track(100001))
+        self.assertEqual(self.server.counts['file'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+from email.utils import formatdate
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+from qobuz.rate_limiter import Priority, RateLimiter
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        # the buckets only refill when the clock is moved on
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        rate_limiter = RateLimiter({RateLimiter.GLOBAL: (10, 3)})
+        self.assertEqual([rate_limiter.reserve('album/get') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(rate_limiter.reserve('album/get'), 0.1)
+        self.now += 0.1
+        self.assertEqual(rate_limiter.reserve('album/get'), 0)
+
+    def test_endpoint_budget_on_top_of_the_global_one(self):
+        rate_limiter = RateLimiter({RateLimiter.GLOBAL: (100, 3), 'track/getFileUrl': (1, 2)})
+        self.assertEqual([rate_limiter.reserve('track/getFileUrl') for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(rate_limiter.reserve('track/getFileUrl'), 1)
+        # other endpoints only wait for what's left of the global budget
+        self.assertEqual(rate_limiter.reserve('album/get'), 0)
+        self.assertAlmostEqual(rate_limiter.reserve('album/get'), 0.01)
+
+    def test_more_urgent_lane_goes_first(self):
+        rate_limiter = RateLimiter({RateLimiter.GLOBAL: (10, 5)})
+        rate_limiter.set_waiting('album/get', Priority.INTERACTIVE, 1)
+        self.assertAlmostEqual(rate_limiter.reserve('album/get', Priority.BULK), 0.1)
+        self.assertAlmostEqual(rate_limiter.reserve('album/get', Priority.PREFETCH), 0.1)
+        self.assertEqual(rate_limiter.reserve('album/get', Priority.INTERACTIVE), 0)
+        rate_limiter.set_waiting('album/get', Priority.INTERACTIVE, -1)
+        self.assertEqual(rate_limiter.reserve('album/get', Priority.BULK), 0)
+
+    def test_throttled_halves_the_rate_until_it_recovers(self):
+        rate_limiter = RateLimiter({RateLimiter.GLOBAL: (10, 5)})
+        rate_limiter.throttled('album/get', retry_after=2)
+        bucket = rate_limiter.buckets[RateLimiter.GLOBAL]
+        self.assertEqual(bucket.rate, 5)
+        self.assertAlmostEqual(rate_limiter.reserve('album/get'), 2)
+        self.now += 2
+        # the tokens were taken away, they come back at the lowered rate
+        self.assertAlmostEqual(rate_limiter.reserve('album/get'), 0)
+        for _ in range(10):
+            rate_limiter.succeeded('album/get')
+        self.assertEqual(bucket.rate, 10)
+
+    def test_rate_never_drops_below_the_minimum(self):
+        rate_limiter = RateLimiter()
+        for _ in range(20):
+            rate_limiter.throttled('album/get', retry_after=0)
+        self.assertEqual(rate_limiter.buckets[RateLimiter.GLOBAL].rate, RateLimiter.MIN_RATE)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(RateLimiter.parse_retry_after('3'), 3)
+        self.assertIsNone(RateLimiter.parse_retry_after(''))
+        self.assertIsNone(RateLimiter.parse_retry_after('soon'))
+        self.assertAlmostEqual(RateLimiter.parse_retry_after(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+
+class ThrottledClientTest(unittest.TestCase):
+    def test_rate_limited_calls_retried(self):
+        # 429s with a Retry-After and 503s, on about a third of the calls
+        server = MockQobuzServer(error_rate=0.3, seed=1).start()
+        self.addCleanup(server.stop)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, cache_dir.name, cache_dir.name, api_endpoint=server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0, meta_data_cache=False, backoff_factor=0)
+        self.addCleanup(qobuz_client.close)
+        retries = []
+        qobuz_client.instrumentation.subscribe(lambda event: event['event'] == 'api_call' and retries.append(event['retries']))
+        for album_id in range(1000, 1010):
+            self.assertEqual(qobuz_client.get_meta_data_for_album_id(album_id)['title'], 'Album {}'.format(album_id))
+        self.assertEqual(len(retries), 10)
+        self.assertEqual(server.counts['album/get'], 10 + sum(retries))
+        self.assertGreater(sum(retries), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer().start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = None
+
+    def tearDown(self):
+        if self.qobuz_client:
+            self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def create_client(self):
+        if self.qobuz_client:
+            self.qobuz_client.close()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+        return self.qobuz_client
+
+    def test_differently_spelled_queries_share_a_cache_entry(self):
+        qobuz_client = self.create_client()
+        results = [qobuz_client.search_catalog_for_artists(query) for query in ['Artist 7', ' artist   7', 'ARTIST 7']]
+        self.assertEqual(results, [results[0]] * 3)
+        self.assertEqual(self.server.reset_counts(), {'catalog/search': 1})
+        # another page or type is another search
+        qobuz_client.search_catalog_for_artists('Artist 7', limit=2)
+        qobuz_client.search_catalog_for_albums('Artist 7')
+        self.assertEqual(self.server.reset_counts(), {'catalog/search': 2})
+
+    def test_exact_match_on_a_later_page(self):
+        # Artist 41, 31, 21, 19 ... 10 come first
+        self.assertEqual(self.create_client().get_artist_by_name('artist 1')['id'], 1)
+        self.assertEqual(self.server.reset_counts(), {'catalog/search': 2})
+
+    def test_resolved_names_kept_across_clients(self):
+        names = ['Artist 47', 'Artist 48', 'Nobody 49']
+        self.assertEqual(self.create_client().resolve_artists(names), {'Artist 47': '47', 'Artist 48': '48', 'Nobody 49': None})
+        self.assertEqual(self.server.reset_counts(), {'catalog/search': 3})
+        self.assertEqual(self.create_client().resolve_artists(names + ['artist 47']), {'Artist 47': '47', 'Artist 48': '48', 'Nobody 49': None, 'artist 47': '47'})
+        self.assertEqual(self.server.reset_counts(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from urllib3.util.retry import Retry
+
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class OldRetry(Retry):
+    # Retry of urllib3 before 1.26, allowed_methods was still called method_whitelist
+    def __init__(self, method_whitelist=None, **kwargs):
+        if 'allowed_methods' in kwargs:
+            raise TypeError("__init__() got an unexpected keyword argument 'allowed_methods'")
+        self.method_whitelist = method_whitelist
+        Retry.__init__(self, **kwargs)
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_retries_only_idempotent_requests(self):
+        for retry_class in (Retry, OldRetry):
+            with mock.patch('qobuz.qobuz_api.Retry', retry_class):
+                qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+            retry = qobuz_client.session.get_adapter('https://www.qobuz.com').max_retries
+            qobuz_client.close()
+            self.assertIsInstance(retry, retry_class)
+            self.assertEqual(retry.total, 3)
+            if retry_class is OldRetry:
+                self.assertEqual(retry.method_whitelist, ('GET', 'HEAD'))
+            else:
+                self.assertEqual(retry.allowed_methods, ('GET', 'HEAD'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+
+from qobuz.mock_server import MockQobuzServer
+from qobuz.player import NullPlayer
+from qobuz.qobuz_api import QobuzApi
+
+class TrackMetaDataTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockQobuzServer(track_size=16 * 1024, tracks_per_album=5).start()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.qobuz_client = QobuzApi('app_id', 'app_secret', 'token', 6, self.cache_dir.name, self.cache_dir.name, api_endpoint=self.server.api_endpoint, log_events=False, player=NullPlayer(), cache_cleanup_interval=0)
+
+    def tearDown(self):
+        self.qobuz_client.close()
+        self.server.stop()
+        self.cache_dir.cleanup()
+
+    def test_album_cached_without_track_get(self):
+        self.qobuz_client.play_album(1000, cache_only=True)
+        self.assertEqual(len(list(self.qobuz_client.library_index.tracks())), 5)
+        self.assertEqual(self.server.counts['album/get'], 1)
+        self.assertNotIn('track/get', self.server.counts)
+
+    def test_artist_tracks_cached_without_track_get(self):
+        self.qobuz_client.play_artist(2, cache_only=True)
+        self.assertEqual(len(list(self.qobuz_client.library_index.tracks())), 5)
+        self.assertNotIn('track/get', self.server.counts)
+
+    def test_album_fetched_once_for_its_tracks(self):
+        # track items which only carry the id of their album
+        tracks = [{'id': 100101 + position, 'album': {'id': '1001'}} for position in range(3)] + [{'id': 100201 + position, 'album': {'id': '1002'}} for position in range(2)]
+        track_meta_data = self.qobuz_client.resolve_track_meta_data(tracks)
+        self.assertEqual(sorted(track_meta_data), [100101, 100102, 100103, 100201, 100202])
+        self.assertEqual(self.server.counts['album/get'], 2)
+        self.assertNotIn('track/get', self.server.counts)
+        # the same as the track/get payload gives
+        self.assertEqual(track_meta_data[100102], self.qobuz_client.get_meta_data(100102))
+
+    def test_cached_album_serves_its_tracks(self):
+        self.assertIsNone(self.qobuz_client.get_cached_track_meta_data(100101, '1001'))
+        self.qobuz_client.get_meta_data_for_album_id('1001')
+        self.server.reset_counts()
+        track_meta_data = self.qobuz_client.get_cached_track_meta_data(100101, '1001')
+        self.assertEqual(self.server.reset_counts(), {})
+        self.assertEqual(track_meta_data, self.qobuz_client.get_meta_data(100101))
+
+if __name__ == '__main__':
+    unittest.main()
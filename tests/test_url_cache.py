@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+
+from qobuz.url_cache import FileUrlCache
+
+class FileUrlCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.resolved = []
+        self.url_cache = None
+
+    def tearDown(self):
+        if self.url_cache:
+            self.url_cache.close()
+
+    def resolve(self, track_id, format_id):
+        self.resolved.append((track_id, format_id))
+        return 'http://localhost/file/{}?etsp={}'.format(track_id, time.time() + 12)
+
+    def submit(self, function, *args):
+        threading.Thread(target=function, args=args).start()
+
+    def create_url_cache(self):
+        # valid for 12 seconds, refreshed half a second after it was resolved
+        self.url_cache = FileUrlCache(self.resolve, refresh_margin=11.5, submit=self.submit)
+        return self.url_cache
+
+    def wait_for_resolved(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.resolved) < count and time.time() < deadline:
+            time.sleep(0.05)
+
+    def test_string_and_integer_ids_share_an_entry(self):
+        url_cache = self.create_url_cache()
+        url = url_cache.get(100001, '6')
+        self.assertEqual(url_cache.get('100001', 6), url)
+        self.assertEqual(len(self.resolved), 1)
+        url_cache.invalidate(100001, 6)
+        url_cache.get('100001', '6')
+        self.assertEqual(len(self.resolved), 2)
+
+    def test_used_url_refreshed_ahead_of_expiry(self):
+        url_cache = self.create_url_cache()
+        url_cache.get(100001, 6)
+        url_cache.get(100001, 6)
+        self.wait_for_resolved(2)
+        self.assertEqual(len(self.resolved), 2)
+        # the refreshed url is handed out without resolving it again
+        url_cache.get(100001, 6)
+        self.assertEqual(len(self.resolved), 2)
+
+    def test_unused_url_not_refreshed(self):
+        url_cache = self.create_url_cache()
+        url_cache.get(100001, 6)
+        time.sleep(1)
+        self.assertEqual(len(self.resolved), 1)
+        self.assertIsNone(url_cache.scheduler_thread)
+
+if __name__ == '__main__':
+    unittest.main()